@@ -0,0 +1,291 @@
+"""Run a whole import and archive on a synthetic corpus and time each stage.
+
+PYTHONPATH=src python benchmarks/bench_import.py --sizes 1000,10000,100000
+PYTHONPATH=src python benchmarks/bench_import.py --save baseline.json
+PYTHONPATH=src python benchmarks/bench_import.py --baseline baseline.json
+
+Each size runs in a fresh process: Sort.launch imports the corpus into an
+album with archiving on, then archive.copy archives the organized album a
+second time on its own. Per stage it prints files/s, bytes/s, subprocesses
+started and the peak RSS of the benchmark and of its largest subprocess.
+
+With --tools fake (the default) ExifTool, ffmpeg and ffprobe are replaced by
+the stand-ins in fake_tools.py, so the numbers measure importrr itself and
+the latencies given on the command line; --tools real uses whatever is
+installed.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import corpus
+import fake_tools
+
+from importrr import archive, exifhelper, report, scanner
+from importrr.sort import Sort
+
+# a stage counts as slower when its files/s drops by more than this
+TOLERANCE = 0.15
+
+# stages which took less than this in total are too noisy to compare
+MIN_WALL = 0.1
+
+TOOLS = ("exiftool", "ffmpeg", "ffprobe")
+
+
+def count_subprocesses():
+    # every tool importrr runs goes through Popen, pyexiftool and ffmpy too
+    init = subprocess.Popen.__init__
+
+    def counting_init(self, *args, **kwargs):
+        report.count("subprocesses")
+        counting_init.total += 1
+        init(self, *args, **kwargs)
+
+    counting_init.total = 0
+    subprocess.Popen.__init__ = counting_init  # type: ignore[method-assign]
+    return counting_init
+
+
+def organized_files(album):
+    """Files of the album relative to it, without the import dir and the
+    album's hidden lock and state files."""
+    result = []
+    for dirpath, dirnames, filenames in os.walk(album):
+        dirnames[:] = sorted(
+            d for d in dirnames if d != "import" and not d.startswith(".")
+        )
+        rel = os.path.relpath(dirpath, album)
+        result += [
+            os.path.normpath(os.path.join(rel, f))
+            for f in sorted(filenames)
+            if not f.startswith(".")
+        ]
+    return result
+
+
+def summarize(run, subprocesses):
+    stages = {}
+    for s in run["spans"]:
+        total = stages.setdefault(
+            s["stage"],
+            {"count": 0, "wall": 0.0, "files": 0, "bytes": 0, "subprocesses": 0},
+        )
+        total["count"] += 1
+        total["wall"] += s["wall"]
+        for key in ("files", "bytes", "subprocesses"):
+            if isinstance(s.get(key), int):
+                total[key] += s[key]
+        if isinstance(s.get("file"), str):
+            # spans of a single file, like a transcode
+            total["files"] += 1
+        # ru_maxrss only grows, so this is the peak reached by the stage's end
+        total["max_rss"] = max(total.get("max_rss", 0), s.get("max_rss", 0))
+        total["child_max_rss"] = max(
+            total.get("child_max_rss", 0), s.get("child_max_rss", 0)
+        )
+    for total in stages.values():
+        # stages faster than the report's resolution have no rate
+        wall = total["wall"] = round(total["wall"], 3)
+        total["files_per_s"] = round(total["files"] / wall, 1) if wall else None
+        total["bytes_per_s"] = round(total["bytes"] / wall) if wall else None
+    return {
+        "wall": run["wall"],
+        "subprocesses": subprocesses,
+        "exiftool_invocations": run.get("exiftool_invocations"),
+        "stages": stages,
+    }
+
+
+def run_size(size, args):
+    """Benchmark one corpus size; runs in its own process."""
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+    root = tempfile.mkdtemp(prefix=f"importrr-bench-{size}-", dir=args.dir)
+    try:
+        if args.tools == "fake":
+            bin_dir = fake_tools.install(os.path.join(root, "bin"))
+            os.environ["PATH"] = bin_dir + os.pathsep + os.environ["PATH"]
+            os.environ["IMPORTRR_FAKE_COMMAND"] = str(args.command_latency)
+            os.environ["IMPORTRR_FAKE_FILE"] = str(args.file_latency)
+            os.environ["IMPORTRR_FAKE_SPEED"] = str(args.transcode_speed)
+            os.environ["IMPORTRR_FAKE_DURATION"] = str(args.clip_seconds)
+
+        album = os.path.join(root, "album")
+        archive_dir = os.path.join(root, "archive")
+        copy_dir = os.path.join(root, "archive-copy")
+        report_dir = os.path.join(root, "reports")
+        for d in (archive_dir, copy_dir):
+            os.makedirs(d)
+        import_dir = os.path.join(album, "import")
+        corpus.write_corpus(import_dir, size, args.payload, args.collisions)
+        # the corpus was only just written; a first scan remembers the files,
+        # so the import takes them as unchanged instead of waiting for them
+        scanner.scan(import_dir, 0)
+
+        counter = count_subprocesses()
+        Sort(
+            album,
+            archive_dir,
+            transcode_jobs=args.jobs,
+            batch_files=args.batch_files,
+            archive_mode=args.archive_mode,
+            archive_layout=args.archive_layout,
+            archive_policy=args.archive_policy,
+            report_dir=report_dir,
+        ).launch("import")
+        (run,) = report.load(report_dir)
+        results = {"import": summarize(run, counter.total)}
+
+        files = organized_files(album)
+        size_total = sum(os.path.getsize(os.path.join(album, f)) for f in files)
+        counter.total = 0
+        copy_report = report.start("archive-copy")
+        try:
+            with exifhelper.ExifToolSession(album) as session:
+                # pyexiftool has the process killed when the thread which
+                # started it exits, so not from one of the converter threads
+                session.start()
+                with report.span("archive.copy", files=len(files), bytes=size_total):
+                    archive.copy(
+                        album,
+                        files,
+                        copy_dir,
+                        "bench",
+                        session=session,
+                        jobs=args.jobs,
+                        mode=args.archive_mode,
+                        layout=args.archive_layout,
+                        policy=args.archive_policy,
+                    )
+                copy_report.info["exiftool_invocations"] = session.invocations
+        finally:
+            report.stop()
+        results["archive"] = summarize(copy_report.to_dict(), counter.total)
+        return results
+    finally:
+        if args.keep:
+            print(f"kept {root}")
+        else:
+            shutil.rmtree(root)
+
+
+def rate(value, scale):
+    return "-" if value is None else f"{value / scale:.1f}"
+
+
+def print_results(size, results):
+    for scenario, result in results.items():
+        print(
+            f"\n{size} files, {scenario}: {result['wall']:.2f}s, "
+            f"{result['subprocesses']} subprocesses, "
+            f"{result['exiftool_invocations']} ExifTool commands"
+        )
+        print(
+            f"  {'stage':<28} {'runs':>5} {'wall s':>8} {'files/s':>9} "
+            f"{'MB/s':>8} {'procs':>6} {'RSS MB':>7} {'child MB':>8}"
+        )
+        for stage, s in result["stages"].items():
+            files_per_s = rate(s["files_per_s"], 1)
+            mb_per_s = rate(s["bytes_per_s"], 1e6)
+            print(
+                f"  {stage:<28} {s['count']:>5} {s['wall']:>8.2f} "
+                f"{files_per_s:>9} {mb_per_s:>8} "
+                f"{s['subprocesses']:>6} {s['max_rss'] / 2**20:>7.1f} "
+                f"{s['child_max_rss'] / 2**20:>8.1f}"
+            )
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing every stage that got slower or started more processes."""
+    regressions = []
+    for size, scenarios in results.items():
+        for scenario, result in scenarios.items():
+            old = baseline.get(size, {}).get(scenario)
+            if old is None:
+                continue
+            for stage, s in result["stages"].items():
+                before = old["stages"].get(stage)
+                if before is None or before["wall"] < MIN_WALL:
+                    continue
+                where = f"{size} {scenario} {stage}"
+                new, old_rate = s["files_per_s"], before["files_per_s"]
+                if new and old_rate and new < old_rate * (1 - tolerance):
+                    regressions.append(f"{where}: {old_rate} -> {new} files/s")
+                if s["subprocesses"] > before["subprocesses"]:
+                    regressions.append(
+                        f"{where}: {before['subprocesses']} -> "
+                        f"{s['subprocesses']} subprocesses"
+                    )
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--tools", choices=("fake", "real"), default="fake")
+    parser.add_argument("--collisions", type=int, default=5, help="files per time")
+    parser.add_argument("--payload", type=int, default=4096, help="bytes per file")
+    parser.add_argument("--jobs", type=int, default=2, help="transcode jobs")
+    parser.add_argument("--batch-files", type=int, default=2000)
+    parser.add_argument("--archive-mode", choices=("tar", "mirror"), default="tar")
+    parser.add_argument("--archive-layout", choices=("flat", "month"), default="flat")
+    parser.add_argument(
+        "--archive-policy", choices=("full", "incremental"), default="full"
+    )
+    parser.add_argument("--command-latency", type=float, default=0.02)
+    parser.add_argument("--file-latency", type=float, default=0.002)
+    parser.add_argument("--transcode-speed", type=float, default=100)
+    parser.add_argument("--clip-seconds", type=float, default=10)
+    parser.add_argument("--dir", help="where to build the corpora")
+    parser.add_argument("--keep", action="store_true", help="keep the corpora")
+    parser.add_argument("--save", help="write the results as a baseline")
+    parser.add_argument("--baseline", help="compare with a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--verbose", action="store_true")
+    return parser
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.tools == "real":
+        missing = [t for t in TOOLS if shutil.which(t) is None]
+        if missing:
+            parser.error(f"not installed: {', '.join(missing)}")
+
+    results = {}
+    for size in [int(s) for s in args.sizes.split(",")]:
+        # a fresh process per size, so peak RSS isn't carried over
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            results[str(size)] = pool.submit(run_size, size, args).result()
+        print_results(size, results[str(size)])
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nSaved baseline {args.save}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nSlower than the baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline")
+
+
+if __name__ == "__main__":
+    main()
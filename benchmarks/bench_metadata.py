@@ -0,0 +1,60 @@
+"""Compare the in-process metadata reader with ExifTool.
+
+PYTHONPATH=src python benchmarks/bench_metadata.py --files 5000
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import corpus
+
+from importrr import exifhelper, fastmeta
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    records = func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} {len(records):>7} records {elapsed:>8.3f}s")
+    return records, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--dir", help="existing directory to read instead")
+    args = parser.parse_args()
+
+    work = args.dir or tempfile.mkdtemp(prefix="importrr-bench-")
+    try:
+        if not args.dir:
+            corpus.write_corpus(work, args.files)
+        print(f"Reading {sum(len(f) for _, _, f in os.walk(work))} files in {work}")
+
+        timed("reader", lambda: fastmeta.read_dir(work)[0])
+        if shutil.which("exiftool") is None:
+            print("exiftool not found, skipping the ExifTool runs")
+            return
+        with exifhelper.ExifToolSession(work) as session:
+            _, fast = timed(
+                "fast",
+                lambda: exifhelper.read_metadata(work, work, session, fast=True),
+            )
+            _, slow = timed(
+                "exiftool",
+                lambda: exifhelper.read_metadata(work, work, session, fast=False),
+            )
+        print(f"speedup    {slow / fast:>7.1f}x with fallback")
+    finally:
+        if not args.dir:
+            shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Synthetic media files for benchmarks: real headers, tiny payloads."""
+
+import os
+import struct
+from datetime import datetime, timedelta
+
+QUICKTIME_EPOCH = datetime(1904, 1, 1)
+
+DATE = "2024:01:02 03:04:05"
+
+
+def tiff(date_time_original=DATE, create_date=DATE, endian="<"):
+    mark = b"II" if endian == "<" else b"MM"
+    tags = [(0x9003, date_time_original), (0x9004, create_date)]
+    tags = [(tag, value.encode() + b"\x00") for tag, value in tags if value]
+
+    exif_ifd = 8 + 2 + 12 + 4
+    data_at = exif_ifd + 2 + 12 * len(tags) + 4
+    out = mark + struct.pack(endian + "HI", 42, 8)
+    out += struct.pack(endian + "H", 1)
+    out += struct.pack(endian + "HHII", 0x8769, 4, 1, exif_ifd)
+    out += struct.pack(endian + "I", 0)
+    out += struct.pack(endian + "H", len(tags))
+    data = b""
+    for tag, value in tags:
+        out += struct.pack(endian + "HHII", tag, 2, len(value), data_at + len(data))
+        data += value
+    out += struct.pack(endian + "I", 0)
+    return out + data
+
+
+def jpeg(exif=None, payload=b"\x00" * 64):
+    out = b"\xff\xd8"
+    # a JFIF segment first, like most cameras
+    app0 = b"JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00"
+    out += b"\xff\xe0" + struct.pack(">H", len(app0) + 2) + app0
+    if exif is not None:
+        app1 = b"Exif\x00\x00" + exif
+        out += b"\xff\xe1" + struct.pack(">H", len(app1) + 2) + app1
+    return out + b"\xff\xda\x00\x02" + payload + b"\xff\xd9"
+
+
+def png_chunk(kind, data):
+    return struct.pack(">I", len(data)) + kind + data + b"\x00\x00\x00\x00"
+
+
+def png(exif=None, payload=b"\x00" * 64):
+    out = b"\x89PNG\r\n\x1a\n"
+    out += png_chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+    if exif is not None:
+        out += png_chunk(b"eXIf", exif)
+    out += png_chunk(b"IDAT", payload)
+    return out + png_chunk(b"IEND", b"")
+
+
+def box(kind, data):
+    return struct.pack(">I", len(data) + 8) + kind + data
+
+
+def quicktime(
+    brand=b"qt  ", seconds=3787096445, creation_date=None, payload=b"", udta=None
+):
+    mvhd = box(b"mvhd", struct.pack(">BxxxII", 0, seconds, seconds) + b"\x00" * 88)
+    children = mvhd
+    if creation_date is not None:
+        key = b"com.apple.quicktime.creationdate"
+        keys = box(b"keys", struct.pack(">II", 0, 1) + box(b"mdta", key))
+        value = struct.pack(">II", 1, 0) + creation_date.encode()
+        ilst = box(b"ilst", box(struct.pack(">I", 1), box(b"data", value)))
+        children += box(b"meta", box(b"hdlr", b"\x00" * 24) + keys + ilst)
+    if udta is not None:
+        children += box(b"udta", udta)
+    # the movie header after the media data, as phones write it
+    return (
+        box(b"ftyp", brand + b"\x00\x00\x00\x00" + brand)
+        + box(b"mdat", payload)
+        + box(b"moov", children)
+    )
+
+
+# what a phone's camera roll looks like, out of every 20 files
+MIX = (
+    [("jpeg", "IMG_{:05d}.JPG")] * 11
+    + [("jpeg-plain", "IMG_{:05d}.JPG")] * 2
+    + [("screenshot", "Screenshot_{:05d}.png")] * 2
+    + [("mov", "IMG_{:05d}.MOV")] * 3
+    + [("mp4", "VID_{:05d}.mp4")] * 2
+)
+
+FIRST_TAKEN = datetime(2024, 1, 1, 9, 0, 0)
+SPACING = timedelta(hours=3)
+
+
+def media(kind, taken, payload):
+    exif_date = taken.strftime("%Y:%m:%d %H:%M:%S")
+    if kind == "jpeg":
+        return jpeg(tiff(exif_date, exif_date), payload)
+    if kind == "jpeg-plain":
+        # stripped by a messenger, dated from the file only
+        return jpeg(None, payload)
+    if kind == "screenshot":
+        return png(None, payload)
+    seconds = int((taken - QUICKTIME_EPOCH).total_seconds())
+    if kind == "mov":
+        date = taken.strftime("%Y-%m-%dT%H:%M:%S+0000")
+        return quicktime(b"qt  ", seconds, date, payload)
+    return quicktime(b"mp42", seconds, None, payload)
+
+
+def write_corpus(directory, count, payload_size=4096, collisions=1):
+    """Write count files in the mix of a camera roll.
+
+    Every ``collisions`` consecutive files share the same capture time, so
+    the organizer has to number them apart; the times are three hours apart
+    and span months for large corpora. Files are dated in the past, so the
+    import's time cutoff never skips them.
+    """
+    os.makedirs(directory, exist_ok=True)
+    payload = os.urandom(payload_size)
+    paths = []
+    for i in range(count):
+        kind, name = MIX[i % len(MIX)]
+        taken = FIRST_TAKEN + SPACING * (i // max(1, collisions))
+        path = os.path.join(directory, name.format(i))
+        with open(path, "wb") as f:
+            f.write(media(kind, taken, payload))
+        mtime = taken.timestamp()
+        os.utime(path, (mtime, mtime))
+        paths.append(path)
+    return paths
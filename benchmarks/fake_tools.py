@@ -0,0 +1,195 @@
+"""Stand-ins for exiftool, ffmpeg and ffprobe with configurable latency.
+
+install() writes small launcher scripts into a bin dir which is then put in
+front of PATH. The fakes do the same file I/O as the real tools (files are
+read and rewritten, MOVs are copied to MP4) and sleep where the real tool
+would spend CPU time:
+
+IMPORTRR_FAKE_COMMAND  seconds added to every ExifTool command
+IMPORTRR_FAKE_FILE     seconds added per file an ExifTool command writes
+IMPORTRR_FAKE_SPEED    media seconds converted per second by ffmpeg
+IMPORTRR_FAKE_DURATION media seconds reported for every clip
+"""
+
+import json
+import os
+import shutil
+import sys
+import time
+
+EXIFTOOL_VERSION = "12.76"
+FFMPEG_VERSION = "ffmpeg version 6.1-fake Copyright (c) the importrr benchmarks"
+
+LAUNCHER = """#!{python}
+import sys
+sys.path[:0] = {paths!r}
+import fake_tools
+sys.exit(fake_tools.{main}(sys.argv[1:]))
+"""
+
+
+def install(bin_dir):
+    """Write exiftool, ffmpeg and ffprobe launchers into bin_dir."""
+    os.makedirs(bin_dir, exist_ok=True)
+    here = os.path.dirname(os.path.abspath(__file__))
+    src = os.path.join(os.path.dirname(here), "src")
+    for tool in ("exiftool", "ffmpeg", "ffprobe"):
+        path = os.path.join(bin_dir, tool)
+        with open(path, "w") as f:
+            f.write(
+                LAUNCHER.format(
+                    python=sys.executable, paths=[here, src], main=tool + "_main"
+                )
+            )
+        os.chmod(path, 0o755)
+    return bin_dir
+
+
+def setting(name, default):
+    return float(os.environ.get(name, default))
+
+
+def modify_date(path):
+    # as ExifTool prints FileModifyDate
+    from importrr import fastmeta
+
+    return fastmeta.format_local(os.stat(path).st_mtime)
+
+
+def file_type(path):
+    with open(path, "rb") as f:
+        head = f.read(12)
+    if head[:2] == b"\xff\xd8":
+        return "JPG"
+    if head[:8] == b"\x89PNG\r\n\x1a\n":
+        return "PNG"
+    if head[4:8] == b"ftyp":
+        return "MOV" if head[8:12] == b"qt  " else "MP4"
+    return None
+
+
+def targets(args):
+    for target in args:
+        if os.path.isdir(target):
+            for dirpath, _, names in os.walk(target):
+                for name in sorted(names):
+                    yield os.path.join(dirpath, name)
+        elif os.path.exists(target):
+            yield target
+
+
+def read_record(path):
+    from importrr import fastmeta
+
+    record = fastmeta.read(path) or {"SourceFile": path}
+    record["SourceFile"] = path
+    kind = file_type(path)
+    if kind is None:
+        return None
+    record.setdefault("File:FileTypeExtension", kind)
+    record.setdefault("File:FileModifyDate", modify_date(path))
+    return record
+
+
+def rewrite(path):
+    # -overwrite_original writes a whole new copy of the file
+    tmp = path + "_exiftool_tmp"
+    shutil.copyfile(path, tmp)
+    os.replace(tmp, path)
+    time.sleep(setting("IMPORTRR_FAKE_FILE", 0.002))
+
+
+def exiftool_command(args):
+    """Run one command; returns (stdout, stderr, status)."""
+    time.sleep(setting("IMPORTRR_FAKE_COMMAND", 0.02))
+    if args == ["-ver"]:
+        return EXIFTOOL_VERSION, "", 0
+
+    # the value of -if is a condition, not a file
+    conditions = {i + 1 for i, a in enumerate(args) if a == "-if"}
+    files = [
+        a
+        for i, a in enumerate(args)
+        if i not in conditions and not a.startswith("-") and "<" not in a
+    ]
+    if "-json" in args:
+        records = [r for r in map(read_record, targets(files)) if r]
+        return json.dumps(records), "", 0
+
+    if "-o" in args:
+        # sidecars: -tagsFromFile @ <tags> -o %d%f.%e.xmp <files>
+        pattern = args[args.index("-o") + 1]
+        written = 0
+        for f in files:
+            if f == pattern or f == "@":
+                continue
+            with open(f + pattern.rsplit("%e", 1)[1], "w") as out:
+                out.write("<x:xmpmeta/>")
+            written += 1
+        return f"    {written} image files created", "", 0
+
+    if "-TagsFromFile" in args:
+        # copy_tags: only the last file is written
+        files = files[-1:]
+    for f in files:
+        rewrite(f)
+    return f"    {len(files)} image files updated", "", 0
+
+
+def exiftool_main(argv):
+    if "-stay_open" not in argv:
+        stdout, stderr, status = exiftool_command(argv)
+        print(stdout)
+        return status
+
+    # the -stay_open protocol pyexiftool speaks: one argument per line, each
+    # command ends with -executeNNN and is answered with {readyNNN}
+    args = []
+    for line in sys.stdin:
+        arg = line.rstrip("\n")
+        if not arg.startswith("-execute"):
+            args.append(arg)
+            if args[-2:] == ["-stay_open", "False"]:
+                return 0
+            continue
+
+        seq = arg[len("-execute") :]
+        echo = ""
+        if "-echo4" in args:
+            i = args.index("-echo4")
+            echo = args[i + 1]
+            args = args[:i] + args[i + 2 :]
+        stdout, stderr, status = exiftool_command(args)
+        sys.stdout.write(f"{stdout}\n{{ready{seq}}}\n")
+        sys.stdout.flush()
+        sys.stderr.write(stderr + echo.replace("${status}", str(status)) + "\n")
+        sys.stderr.flush()
+        args = []
+    return 0
+
+
+def ffprobe_main(argv):
+    duration = setting("IMPORTRR_FAKE_DURATION", 10)
+    streams = [
+        {
+            "codec_type": "video",
+            "codec_name": "hevc",
+            "pix_fmt": "yuv420p10le",
+            "duration": str(duration),
+        },
+        {"codec_type": "audio", "codec_name": "aac", "duration": str(duration)},
+    ]
+    print(json.dumps({"streams": streams}))
+    return 0
+
+
+def ffmpeg_main(argv):
+    if argv == ["-version"]:
+        print(FFMPEG_VERSION)
+        return 0
+    source = argv[argv.index("-i") + 1]
+    output = argv[-1]
+    speed = setting("IMPORTRR_FAKE_SPEED", 100)
+    time.sleep(setting("IMPORTRR_FAKE_DURATION", 10) / speed)
+    shutil.copyfile(source, output)
+    return 0
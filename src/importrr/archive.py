@@ -1,85 +1,462 @@
+import functools
 import logging
 import os
-import tarfile
+import queue
+import re
+from concurrent.futures import ThreadPoolExecutor
 
-from importrr import transcode
+from importrr import catalog, exifhelper, manifest, mirror, report, tarwriter, transcode
 
 logger = logging.getLogger(__name__)
 
 # Max Tar size in GB
 MAX_SIZE = 1000000000
 
+# suffix of a tar while it is being written
+PART_EXT = ".part"
 
-def copy(root_dir, sorted_files, archive_dir, prefix):
-    if not sorted_files:
+# tars written at once with the month layout
+WRITERS = 4
+
+YEAR_DIR = re.compile(r"^\d{4}$")
+MONTH_DIR = re.compile(r"^\d{2}$")
+
+
+def copy(
+    root_dir,
+    sorted_files,
+    archive_dir,
+    prefix,
+    session=None,
+    jobs=1,
+    threads=None,
+    cache=None,
+    journal=None,
+    stop=None,
+    mode="tar",
+    layout="flat",
+    policy="full",
+):
+    """Archive sorted_files into tars of at most MAX_SIZE, or mirror them.
+
+    With the month layout every yyyy/mm of the album gets its own volumes,
+    in a folder of the same name in archive_dir. With the incremental policy
+    files whose content is already in a volume are only referenced.
+
+    sorted_files can be any iterable, including one which is still being
+    filled while files are organized. A sidecar directly follows its media.
+    Once stop is set, running conversions are finished and archived but
+    nothing new is started; the journal leaves the rest for the next run.
+    """
+    entries = queue.Queue()
+    feeder = ThreadPoolExecutor(max_workers=1, thread_name_prefix="feeder")
+    with feeder, ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        # every MOV starts converting as soon as it arrives, but the results
+        # are consumed in order so the tar contents don't depend on which job
+        # finished first
+        feeding = feeder.submit(
+            submit_conversions,
+            pool,
+            sorted_files,
+            entries,
+            root_dir,
+            session,
+            threads,
+            cache,
+            journal=journal,
+            stop=stop,
+        )
+        content = None
+        if mode == "mirror":
+            write = mirror_files
+        else:
+            if policy == "incremental":
+                content = catalog.ArchivedContent(archive_dir)
+            write = functools.partial(
+                build_month_volumes if layout == "month" else build_volumes,
+                content=content,
+            )
+        try:
+            archived = write(
+                root_dir, iter(entries.get, None), archive_dir, prefix, journal, stop
+            )
+        finally:
+            if content is not None:
+                content.close()
+        # the feeder ends the entries when it fails too, which mustn't look
+        # like every file was archived
+        feeding.result()
+
+    if not archived:
         logger.debug("No files to archive")
-        return
 
-    logger.info(f"Starting archive creation for {len(sorted_files)} files")
-    index = 0
-    size = 0
-    files = []
 
+def group_sidecars(sorted_files):
+    # a file is held back until the next one shows whether it is its sidecar
+    held = None
     for f in sorted_files:
-        if f.endswith(".mov"):
-            logger.debug(f"Converting MOV file: {f}")
-            f = transcode.convert(root_dir, f)
-            if f is None:
+        if held is not None and f == held + exifhelper.SIDECAR_EXT:
+            yield [held, f]
+            held = None
+            continue
+        if held is not None:
+            yield [held]
+        held = f
+    if held is not None:
+        yield [held]
+
+
+def submit_conversions(
+    pool,
+    sorted_files,
+    entries,
+    root_dir,
+    session,
+    threads,
+    cache,
+    journal=None,
+    stop=None,
+):
+    try:
+        converting = 0
+        for members in group_sidecars(sorted_files):
+            conversion = None
+            if members[0].endswith(".mov") and not (stop and stop.is_set()):
+                conversion = pool.submit(
+                    convert, root_dir, members[0], session, threads, cache, journal
+                )
+                converting += 1
+            entries.put((members, conversion))
+        if converting:
+            logger.info(f"Queued {converting} MOV files for conversion")
+    finally:
+        entries.put(None)
+
+
+def convert(root_dir, source_file, session, threads, cache, journal=None):
+    if journal is not None:
+        # converted before the previous run was stopped
+        done = journal.transcoded().get(source_file)
+        if done and os.path.exists(os.path.join(root_dir, done)):
+            logger.info(f"Reusing conversion of {source_file} from an earlier run")
+            return done
+
+    with report.span("transcode", session, file=source_file) as span:
+        result = transcode.convert(root_dir, source_file, session, threads, cache)
+        span["bytes"] = file_size(root_dir, source_file)
+        span["output_bytes"] = file_size(root_dir, result) if result else 0
+    if result is not None and journal is not None:
+        journal.record("transcoded", file=source_file, to=result)
+    return result
+
+
+def file_size(root_dir, f):
+    try:
+        return os.path.getsize(os.path.join(root_dir, f))
+    except OSError:
+        return 0
+
+
+def ready(entries, stop=None):
+    """The members of each entry once its MOV, if any, is converted."""
+    left = 0
+    for members, conversion in entries:
+        # after a stop, a conversion which already started is finished and
+        # archived; everything else is left to the journal and the next run
+        stopped = stop is not None and stop.is_set()
+        if stopped and (conversion is None or conversion.cancel()):
+            left += 1
+            continue
+        if conversion is not None:
+            logger.debug(f"Waiting for MOV conversion: {members[0]}")
+            converted = conversion.result()
+            if converted is None:
                 logger.warning("Skipping file due to MOV conversion failure")
                 continue  # Skip this file if conversion failed
+            members[0] = converted
+        yield members
+    if left:
+        logger.info(f"Stopping, {left} files are left to archive on the next run")
 
-        file = os.path.join(root_dir, f)
-        try:
-            file_size = os.stat(file).st_size
-            logger.debug(f"Adding file to archive: {f} ({file_size} bytes)")
-        except OSError as e:
-            logger.error(f"Cannot access file {f}: {e}")
+
+def build_volumes(
+    root_dir, entries, archive_dir, prefix, journal=None, stop=None, content=None
+):
+    index = 0
+    size = 0
+    files = []
+    archived = 0
+
+    for members in ready(entries, stop):
+        if not archived:
+            logger.info("Starting archive creation")
+        archived += 1
+
+        file_size = entry_size(root_dir, members, content)
+        if file_size is None:
             continue
 
         if not files:  # Check if list is empty instead of None
-            files.append(f)
+            files.extend(members)
             size = file_size
             continue
         elif size + file_size > MAX_SIZE:
             logger.info(f"Archive size limit reached, creating archive {index}")
-            create_tar(root_dir, files, archive_dir, prefix, index)
+            create_tar(
+                root_dir, files, archive_dir, prefix, index, journal, content=content
+            )
 
             # reset all the things
             index += 1
             size = 0
             files.clear()
 
-        files.append(f)
+        files.extend(members)
         size += file_size
 
     # Clear the last tar
     if files:
         logger.info(f"Creating final archive {index}")
-        create_tar(root_dir, files, archive_dir, prefix, index)
+        create_tar(
+            root_dir, files, archive_dir, prefix, index, journal, content=content
+        )
         total_archives = index + 1
     else:
         total_archives = index  # No final archive was created
 
-    logger.info(f"Archive creation completed - created {total_archives} archive(s)")
+    if archived:
+        logger.info(f"Archive creation completed - created {total_archives} archive(s)")
+    return archived
 
 
-def create_tar(root_dir, sorted_files, archive_dir, prefix, index):
-    tar_file = os.path.join(archive_dir, prefix + "-" + str(index) + ".tar")
+def entry_size(root_dir, members, content=None):
+    # None if a member can't be archived; referenced ones take no space
+    size = 0
+    for member in members:
+        try:
+            if content is not None and content.lookup(root_dir, member):
+                continue
+            member_size = os.stat(os.path.join(root_dir, member)).st_size
+        except OSError as e:
+            logger.error(f"Cannot access file {member}: {e}")
+            return None
+        logger.debug(f"Adding file to archive: {member} ({member_size} bytes)")
+        size += member_size
+    return size
+
+
+def partition(f):
+    """The yyyy/mm folder f was sorted into, or "" if it is elsewhere."""
+    parts = f.split("/")
+    if len(parts) > 2 and YEAR_DIR.match(parts[0]) and MONTH_DIR.match(parts[1]):
+        return os.path.join(parts[0], parts[1])
+    return ""
+
+
+def build_month_volumes(
+    root_dir, entries, archive_dir, prefix, journal=None, stop=None, content=None
+):
+    """build_volumes with separate volumes for every month, written at once.
+
+    A month's volume goes to one of WRITERS threads as soon as it is full,
+    and the last one of every month once all files are in, so a month is
+    spread over as few volumes as its size allows.
+    """
+    months = {}
+    indexes = {}
+    written = []
+    archived = 0
+
+    with ThreadPoolExecutor(
+        max_workers=WRITERS, thread_name_prefix=f"tar-{prefix}"
+    ) as pool:
+
+        def write(month, files):
+            index = indexes.get(month, 0)
+            indexes[month] = index + 1
+            written.append(
+                pool.submit(
+                    create_tar,
+                    root_dir,
+                    files,
+                    archive_dir,
+                    prefix,
+                    index,
+                    journal,
+                    partition=month,
+                    content=content,
+                )
+            )
+
+        for members in ready(entries, stop):
+            if not archived:
+                logger.info("Starting archive creation")
+            archived += 1
+            file_size = entry_size(root_dir, members, content)
+            if file_size is None:
+                continue
+
+            month = partition(members[0])
+            volume = months.setdefault(month, [[], 0])
+            if volume[0] and volume[1] + file_size > MAX_SIZE:
+                logger.info(f"Archive size limit reached for {month or 'other files'}")
+                write(month, volume[0])
+                volume = months[month] = [[], 0]
+            volume[0].extend(members)
+            volume[1] += file_size
+
+        for month, (files, _) in sorted(months.items()):
+            write(month, files)
+        # the first failure is raised once every writer is done
+        for future in written:
+            future.result()
+
+    if archived:
+        logger.info(
+            f"Archive creation completed - created {len(written)} archive(s) "
+            f"for {len(months)} months"
+        )
+    return archived
+
+
+def mirror_files(root_dir, entries, archive_dir, prefix, journal=None, stop=None):
+    """Place each file in archive_dir under its album path, see mirror.Mirror.
+
+    Nothing is read or written through Python, and the manifest of the files
+    placed takes the place of the tar's member list.
+    """
+    placer = mirror.Mirror(root_dir, archive_dir)
+    archived = 0
+    with report.span("mirror") as span:
+        try:
+            for members in ready(entries, stop):
+                for member in members:
+                    try:
+                        method = placer.place(member)
+                    except FileNotFoundError:
+                        logger.warning(f"File not found for archiving: {member}")
+                        continue
+                    if method is not None:
+                        span[method] = span.get(method, 0) + 1
+                archived += 1
+                if journal is not None:
+                    journal.record("archived", files=members)
+        finally:
+            span["files"] = len(placer.placed)
+            span["bytes"] = sum(e["size"] for e in placer.placed)
+            placer.write_manifest(prefix)
+
+    if archived:
+        logger.info(f"Mirrored {len(placer.placed)} files into {archive_dir}")
+    else:
+        logger.debug("No files to archive")
+    return archived
+
+
+class Archiver:
+    """Archives files handed over by put() while the rest are still organized."""
+
+    def __init__(self, root_dir, archive_dir, prefix, **kwargs):
+        self.queue = queue.Queue()
+        self.args = (root_dir, iter(self.queue.get, None), archive_dir, prefix)
+        self.kwargs = kwargs
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"archive-{prefix}"
+        )
+        self.future = None
+
+    def start(self):
+        self.future = self.executor.submit(copy, *self.args, **self.kwargs)
+
+    def put(self, f):
+        self.queue.put(f)
+
+    def finish(self):
+        """Wait for the archive; whatever it failed with is raised here."""
+        self.queue.put(None)
+        try:
+            self.future.result()
+        finally:
+            self.executor.shutdown()
+
+
+def create_tar(
+    root_dir,
+    sorted_files,
+    archive_dir,
+    prefix,
+    index,
+    journal=None,
+    partition="",
+    content=None,
+):
+    # partition is the folder in archive_dir the tar goes into; files content
+    # finds in earlier volumes are only referenced in the manifest
+    volume_dir = os.path.join(archive_dir, partition)
+    if partition:
+        os.makedirs(volume_dir, exist_ok=True)
+    tar_file = os.path.join(volume_dir, prefix + "-" + str(index) + ".tar")
     logger.info(f"Creating archive: {tar_file} with {len(sorted_files)} files")
+    part = None
+    found = []
 
     try:
-        with tarfile.open(tar_file, "w") as tar:
+        while True:
+            # import dirs of one section can finish in the same second, so a
+            # name another worker already took moves on to the next index
+            try:
+                opened = tarwriter.TarWriter.open(tar_file + PART_EXT, "x")
+                part = tar_file + PART_EXT
+                break
+            except FileExistsError:
+                index += 1
+                tar_file = os.path.join(volume_dir, f"{prefix}-{index}.tar")
+                logger.warning(f"Archive already exists, using {tar_file}")
+
+        if journal is not None:
+            journal.record("archiving", part=part)
+        with report.span("tar", files=len(sorted_files)) as span, opened as tar:
             for f in sorted_files:
                 file_path = os.path.join(root_dir, f)
-                if os.path.exists(file_path):
+                if not os.path.exists(file_path):
+                    logger.warning(f"File not found for archiving: {f}")
+                elif content is not None and content.lookup(root_dir, f):
+                    found.append(content.lookup(root_dir, f))
+                else:
                     tar.add(file_path, arcname=f, recursive=False)
                     logger.debug(f"Added to archive: {f}")
-                else:
-                    logger.warning(f"File not found for archiving: {f}")
+            span["bytes"] = tar.offset
+            if found:
+                span["referenced"] = len(found)
+                span["referenced_bytes"] = sum(e["size"] for e in found)
+            files = manifest.listing(tar)
+
+        # a tar only gets its name once it is complete, so an interrupted run
+        # never leaves a volume behind that looks finished
+        while True:
+            try:
+                os.link(part, tar_file)
+                break
+            except FileExistsError:
+                index += 1
+                tar_file = os.path.join(volume_dir, f"{prefix}-{index}.tar")
+                logger.warning(f"Archive already exists, using {tar_file}")
+        os.remove(part)
+        files += [catalog.reference(e, archive_dir, tar_file) for e in found]
+        manifest.save(tar_file, files)
+        catalog.add_volume(archive_dir, tar_file, files)
+        if journal is not None:
+            journal.record(
+                "archived", part=part, tar=tar_file, files=list(sorted_files)
+            )
 
         archive_size = os.path.getsize(tar_file)
         logger.info(f"Archive created successfully: {tar_file} ({archive_size} bytes)")
+        if found:
+            logger.info(f"{len(found)} files were archived before, only referenced")
 
     except Exception as e:
         logger.error(f"Failed to create archive {tar_file}: {e}")
+        if part is not None and os.path.exists(part):
+            os.remove(part)
         raise
@@ -0,0 +1,89 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+
+from importrr import hashing
+
+logger = logging.getLogger(__name__)
+
+# Default max cache size in GB
+MAX_SIZE = 50
+
+
+def link_or_copy(src, dst):
+    # write next to the destination first so readers never see a partial file;
+    # the pid keeps workers storing the same entry from sharing a temp file
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def touch(path):
+    # the atime is the last-used time for eviction; the mtime is left alone
+    # because entries are usually hardlinked into the album
+    st = os.stat(path)
+    os.utime(path, ns=(time.time_ns(), st.st_mtime_ns))
+
+
+class TranscodeCache:
+    def __init__(self, cache_dir, max_size=MAX_SIZE * 1000000000):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def key(self, input_file, params):
+        params_digest = hashlib.sha256(params.encode()).hexdigest()[:16]
+        return f"{hashing.file_digest(input_file)}-{params_digest}"
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key + ".mp4")
+
+    def fetch(self, key, output_file):
+        entry = self.path(key)
+        with self._lock:
+            if not os.path.exists(entry):
+                return False
+            link_or_copy(entry, output_file)
+            touch(entry)
+        logger.info(f"Reused cached transcode for {os.path.basename(output_file)}")
+        return True
+
+    def store(self, key, output_file):
+        with self._lock:
+            try:
+                link_or_copy(output_file, self.path(key))
+                touch(self.path(key))
+                logger.debug(f"Cached transcode {key}")
+            except OSError as e:
+                logger.warning(f"Failed to cache {output_file}: {e}")
+                return
+            self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".mp4") or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                logger.debug(f"Evicted cached transcode {os.path.basename(path)}")
+            except OSError as e:
+                logger.warning(f"Failed to evict {path}: {e}")
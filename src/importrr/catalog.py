@@ -0,0 +1,290 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tarfile
+import threading
+
+from importrr import hashing, manifest
+from importrr.hashing import CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = ".importrr-catalog.sqlite"
+# workers of one section add volumes at the same time
+TIMEOUT = 60
+# a format change rebuilds the catalog from the manifests
+SCHEMA_VERSION = 2
+COLUMNS = (
+    "volume",
+    "path",
+    "offset",
+    "offset_data",
+    "size",
+    "mtime",
+    "sha256",
+    "link",
+    "ref",
+)
+
+
+class Catalog:
+    """Where every archived file of a section lies in its tar volumes.
+
+    Volumes are named by their path relative to the archive dir. A link
+    member has its data in the member named by ``link``, in the volume named
+    by ``ref`` or else in its own volume; only those have no offsets.
+    """
+
+    def __init__(self, archive_dir, check_same_thread=True):
+        self.archive_dir = archive_dir
+        self.db = sqlite3.connect(
+            os.path.join(archive_dir, CATALOG_FILE),
+            timeout=TIMEOUT,
+            check_same_thread=check_same_thread,
+        )
+        (version,) = self.db.execute("PRAGMA user_version").fetchone()
+        outdated = 0 < version < SCHEMA_VERSION or (
+            version == 0 and self._has_members()
+        )
+        if outdated:
+            self.db.execute("DROP TABLE members")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS members ("
+            "volume TEXT NOT NULL, path TEXT NOT NULL, "
+            "offset INTEGER, offset_data INTEGER, "
+            "size INTEGER NOT NULL, mtime INTEGER, sha256 TEXT, link TEXT, "
+            "ref TEXT, PRIMARY KEY (volume, path))"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS members_path ON members (path)")
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS members_sha256 ON members (sha256, size)"
+        )
+        self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.commit()
+        if outdated:
+            logger.info(f"Catalog of {archive_dir} is outdated, rebuilding it")
+            self.rebuild()
+
+    def _has_members(self):
+        return (
+            self.db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'members'"
+            ).fetchone()
+            is not None
+        )
+
+    def close(self):
+        self.db.close()
+
+    def add(self, volume, files):
+        """Index the manifest entries of one tar, named relative to the dir."""
+        rows = []
+        for e in files:
+            row = dict(e, volume=volume)
+            if "ref" in e:
+                # manifests name the volume relative to their own tar
+                row["ref"] = os.path.normpath(
+                    os.path.join(os.path.dirname(volume), e["ref"])
+                )
+            rows.append(tuple(row.get(c) for c in COLUMNS))
+        with self.db:
+            self.db.execute("DELETE FROM members WHERE volume = ?", (volume,))
+            # a name in a tar more than once is extracted from its last member
+            self.db.executemany(
+                f"INSERT OR REPLACE INTO members ({', '.join(COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows,
+            )
+
+    def lookup(self, path, volume=None):
+        """The newest archived copy of path, as a dict, or None."""
+        query = f"SELECT {', '.join(COLUMNS)} FROM members WHERE path = ?"
+        args = [path]
+        if volume is not None:
+            query += " AND volume = ?"
+            args.append(volume)
+        row = self.db.execute(query + " ORDER BY rowid DESC", args).fetchone()
+        return None if row is None else dict(zip(COLUMNS, row))
+
+    def stored(self, digest, size):
+        """The oldest member holding this content whose volume still exists."""
+        rows = self.db.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM members "
+            "WHERE sha256 = ? AND size = ? AND link IS NULL ORDER BY rowid",
+            (digest, size),
+        )
+        for row in rows:
+            entry = dict(zip(COLUMNS, row))
+            if os.path.exists(os.path.join(self.archive_dir, entry["volume"])):
+                return entry
+        return None
+
+    def rebuild(self):
+        """Index every tar of the dir again from its manifest."""
+        volumes = 0
+        with self.db:
+            self.db.execute("DELETE FROM members")
+        for path in manifest.find([self.archive_dir]):
+            with open(path) as f:
+                saved = json.load(f)
+            if "tar" not in saved:
+                # mirrored files are restored by copying them
+                continue
+            # volumes of the month layout are in yyyy/mm folders
+            tar_file = os.path.join(os.path.dirname(path), saved["tar"])
+            files = saved["files"]
+            if any("offset_data" not in e and "ref" not in e for e in files):
+                files = with_offsets(tar_file, files)
+            self.add(os.path.relpath(tar_file, self.archive_dir), files)
+            volumes += 1
+        logger.info(f"Catalog of {self.archive_dir} rebuilt from {volumes} volumes")
+        return volumes
+
+
+def with_offsets(tar_file, files):
+    # manifests written before offsets were recorded; the headers are read
+    # once here so restores never have to
+    with tarfile.open(tar_file) as tar:
+        members = {m.name: m for m in tar.getmembers()}
+    result = []
+    for e in files:
+        member = members.get(e["path"])
+        if "ref" in e:
+            result.append(e)
+        elif member is not None:
+            result.append(
+                dict(
+                    e,
+                    offset=member.offset,
+                    offset_data=member.offset_data,
+                    mtime=int(member.mtime),
+                )
+            )
+    return result
+
+
+def add_volume(archive_dir, tar_file, files):
+    """Index a finished tar; the manifest stays the record if this fails."""
+    try:
+        catalog = Catalog(archive_dir)
+        try:
+            catalog.add(os.path.relpath(tar_file, archive_dir), files)
+        finally:
+            catalog.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Cannot add {tar_file} to the catalog: {e}")
+
+
+def restore(archive_dir, path, dest):
+    """Copy one archived file out of its tar to dest.
+
+    The catalog gives the data offset, so only the file's own bytes are
+    read, however many volumes there are. Returns the volume it came from.
+    """
+    if not os.path.exists(os.path.join(archive_dir, CATALOG_FILE)):
+        raise FileNotFoundError(f"No catalog in {archive_dir}")
+    catalog = Catalog(archive_dir)
+    try:
+        entry = catalog.lookup(path)
+        if entry is None:
+            raise FileNotFoundError(f"{path} is not in the catalog of {archive_dir}")
+        if entry["link"] is not None:
+            # a hardlink member has no data, its target in the same tar has,
+            # or a reference to content archived before, in the volume it names
+            volume = entry["ref"] or entry["volume"]
+            target = catalog.lookup(entry["link"], volume)
+            if target is None:
+                raise FileNotFoundError(
+                    f"{entry['link']}, linked as {path}, is not in {volume}"
+                )
+            entry = dict(target, path=path, mtime=entry["mtime"])
+    finally:
+        catalog.close()
+
+    tar_file = os.path.join(archive_dir, entry["volume"])
+    tmp = f"{dest}.{os.getpid()}.tmp"
+    digest = hashlib.sha256()
+    try:
+        with open(tar_file, "rb") as src, open(tmp, "wb") as dst:
+            offset, end = entry["offset_data"], entry["offset_data"] + entry["size"]
+            while offset < end:
+                data = os.pread(src.fileno(), min(CHUNK_SIZE, end - offset), offset)
+                if not data:
+                    raise OSError(f"{tar_file} ends inside {path}")
+                digest.update(data)
+                dst.write(data)
+                offset += len(data)
+        if entry["sha256"] is not None and digest.hexdigest() != entry["sha256"]:
+            raise OSError(f"Checksum mismatch for {path} in {tar_file}")
+        if entry["mtime"] is not None:
+            os.utime(tmp, (entry["mtime"], entry["mtime"]))
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    logger.info(f"Restored {path} from {entry['volume']} to {dest}")
+    return entry["volume"]
+
+
+class ArchivedContent:
+    """Finds the files of a batch whose content a volume already holds.
+
+    With the incremental policy such a file goes into the manifest as a
+    reference to the stored copy instead of into another tar. Only content
+    in the catalog counts, so tars written before it need a rebuild first.
+    """
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        self.lock = threading.Lock()
+        self.found = {}
+        self.catalog = None
+
+    def close(self):
+        with self.lock:
+            if self.catalog is not None:
+                self.catalog.close()
+                self.catalog = None
+
+    def lookup(self, root_dir, f):
+        """The manifest reference for f, or None if it has to be stored."""
+        with self.lock:
+            if f in self.found:
+                return self.found[f]
+        path = os.path.join(root_dir, f)
+        st = os.stat(path)
+        digest = hashing.file_digest(path)
+        try:
+            with self.lock:
+                if self.catalog is None:
+                    # the volume writers of the month layout share it
+                    self.catalog = Catalog(self.archive_dir, check_same_thread=False)
+                stored = self.catalog.stored(digest, st.st_size)
+        except sqlite3.Error as e:
+            logger.warning(f"Cannot look up {f} in the catalog: {e}")
+            stored = None
+
+        reference = None
+        if stored is not None:
+            logger.debug(f"Already archived as {stored['path']}: {f}")
+            reference = {
+                "path": f,
+                "size": st.st_size,
+                "mtime": int(st.st_mtime),
+                "sha256": digest,
+                "link": stored["path"],
+                "volume": stored["volume"],
+            }
+        with self.lock:
+            self.found[f] = reference
+        return reference
+
+
+def reference(found, archive_dir, tar_file):
+    # the manifest entry, naming the volume relative to the new tar
+    entry = dict(found)
+    volume = os.path.join(archive_dir, entry.pop("volume"))
+    entry["ref"] = os.path.relpath(volume, os.path.dirname(tar_file))
+    return entry
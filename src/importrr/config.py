@@ -1,7 +1,10 @@
 import logging
-import os.path
+import os
 from configparser import ConfigParser
 
+from importrr.report import REPORT_HISTORY
+from importrr.sort import BATCH_FILES, BATCH_SIZE
+
 CANDIDATES = ["config.ini", "/config/config.ini"]
 
 logger = logging.getLogger(__name__)
@@ -38,6 +41,64 @@ class Config:
         logger.info(f"Album root directory: {self.album_root}")
         logger.info(f"Archive root directory: {self.archive_root}")
 
+        # ffmpeg threads per transcode, and how many cores all transcodes may
+        # use together; without a thread count MOVs are converted one by one
+        self.transcode_threads = parser["global"].getint(
+            "transcode_threads", fallback=None
+        )
+        self.core_budget = parser["global"].getint(
+            "core_budget", fallback=os.cpu_count() or 1
+        )
+        # import dirs processed at once; the core budget is shared by all of them
+        self.workers = max(1, parser["global"].getint("workers", fallback=1))
+        if self.transcode_threads:
+            self.transcode_jobs = max(
+                1, self.core_budget // (self.transcode_threads * self.workers)
+            )
+        else:
+            self.transcode_jobs = 1
+        logger.info(f"Processing {self.workers} import directories at a time")
+        logger.info(
+            f"Transcoding {self.transcode_jobs} MOV files at a time "
+            f"with {self.transcode_threads or 'default'} threads each"
+        )
+
+        # files and GB organized per work dir, so one failure or one huge
+        # backup never holds everything at once
+        self.batch_files = parser["global"].getint("batch_files", fallback=BATCH_FILES)
+        self.batch_size = parser["global"].getint(
+            "batch_size", fallback=BATCH_SIZE // 1000000000
+        )
+
+        # read JPEG, PNG and QuickTime dates without starting ExifTool
+        self.fast_metadata = parser["global"].getboolean("fast_metadata", fallback=True)
+
+        # per-stage timings of every run, the last report_history are kept
+        self.report_dir = parser["global"].get(
+            "report_dir", os.path.join(self.album_root, ".importrr-reports")
+        )
+        self.report_history = parser["global"].getint(
+            "report_history", fallback=REPORT_HISTORY
+        )
+
+        # serve Prometheus metrics on this port; off unless set
+        self.metrics_port = parser["global"].getint("metrics_port", fallback=None)
+
+        # import as soon as files settle instead of only on the schedule
+        self.watch = parser["global"].getboolean("watch", fallback=False)
+
+        # finished MP4s are kept here, keyed by source content, so re-imported
+        # clips are never encoded twice
+        self.transcode_cache = parser["global"].get("transcode_cache_dir", None)
+        self.transcode_cache_size = parser["global"].getint(
+            "transcode_cache_size", fallback=50
+        )
+        if self.transcode_cache:
+            logger.info(
+                f"Transcode cache: {self.transcode_cache} "
+                f"({self.transcode_cache_size} GB)"
+            )
+
         self.data = []
 
         for section_name in parser.sections():
@@ -67,11 +128,59 @@ class Config:
             )  # Use get() to avoid KeyError
             archive_dir = os.path.join(self.archive_root, section_name)
 
+            # write backfilled dates to .xmp sidecars instead of the media
+            sidecar = parser[section_name].getboolean("sidecar", fallback=False)
+
+            # also import files from folders inside the import dirs
+            recursive = parser[section_name].getboolean("recursive", fallback=False)
+
+            # what to do with files whose content is already in the album
+            duplicates = parser[section_name].get("duplicates", "keep")
+            if duplicates not in ("keep", "skip", "link"):
+                raise ValueError(
+                    f"Invalid 'duplicates' value '{duplicates}' in section '{section_name}'"
+                )
+
+            # tar volumes, or a mirror of the album linked or cloned into
+            # the archive dir
+            archive_mode = parser[section_name].get("archive_mode", "tar")
+            if archive_mode not in ("tar", "mirror"):
+                raise ValueError(
+                    f"Invalid 'archive_mode' value '{archive_mode}' in section '{section_name}'"
+                )
+
+            # tar volumes side by side, or in a yyyy/mm folder per month
+            archive_layout = parser[section_name].get("archive_layout", "flat")
+            if archive_layout not in ("flat", "month"):
+                raise ValueError(
+                    f"Invalid 'archive_layout' value '{archive_layout}' in section '{section_name}'"
+                )
+
+            # store every file, or only content no volume holds yet
+            archive_policy = parser[section_name].get("archive_policy", "full")
+            if archive_policy not in ("full", "incremental"):
+                raise ValueError(
+                    f"Invalid 'archive_policy' value '{archive_policy}' in section '{section_name}'"
+                )
+
             d = {
                 "album": album_dir,
                 "archive": archive_dir,
                 "import": import_value,
                 "serial": serial,
+                "sidecar": sidecar,
+                "duplicates": duplicates,
+                "archive_mode": archive_mode,
+                "archive_layout": archive_layout,
+                "archive_policy": archive_policy,
+                "recursive": recursive,
+                "transcode_jobs": self.transcode_jobs,
+                "transcode_threads": self.transcode_threads,
+                "batch_files": self.batch_files,
+                "batch_size": self.batch_size,
+                "fast_metadata": self.fast_metadata,
+                "report_dir": self.report_dir,
+                "report_history": self.report_history,
             }
             self.data.append(d)
             logger.debug(
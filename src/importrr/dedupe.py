@@ -0,0 +1,207 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from importrr import hashing
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = ".importrr-index.sqlite"
+HASH_WORKERS = 4
+POLICIES = ("keep", "skip", "link")
+
+# only the sorted yyyy/mm tree is indexed, never the import dirs
+YEAR_DIR = re.compile(r"^\d{4}$")
+MONTH_DIR = re.compile(r"^\d{2}$")
+
+
+def safe_digest(path):
+    try:
+        return hashing.file_digest(path)
+    except OSError as e:
+        logger.warning(f"Cannot hash {path}: {e}")
+        return None
+
+
+def hash_files(paths, workers=HASH_WORKERS):
+    # hashlib releases the GIL on large buffers, so threads scale with disks
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return dict(zip(paths, pool.map(safe_digest, paths)))
+
+
+def album_files(album_dir):
+    for year in os.scandir(album_dir):
+        if not year.is_dir() or not YEAR_DIR.match(year.name):
+            continue
+        for month in os.scandir(year.path):
+            if not month.is_dir() or not MONTH_DIR.match(month.name):
+                continue
+            for entry in os.scandir(month.path):
+                if entry.is_file():
+                    yield entry
+
+
+class DuplicateIndex:
+    """Persistent map of content hash to album path for one section."""
+
+    def __init__(self, album_dir, policy="skip", workers=HASH_WORKERS):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown duplicate policy: {policy}")
+        self.album_dir = album_dir
+        self.policy = policy
+        self.workers = workers
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(
+            os.path.join(album_dir, INDEX_FILE), check_same_thread=False
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, hash TEXT NOT NULL, "
+            "size INTEGER NOT NULL, mtime INTEGER NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS files_hash ON files (hash)")
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def refresh(self):
+        # only files which are new or changed since the last run are hashed
+        known = {
+            path: (size, mtime)
+            for path, size, mtime in self.db.execute(
+                "SELECT path, size, mtime FROM files"
+            )
+        }
+        seen = set()
+        changed = []
+        for entry in album_files(self.album_dir):
+            path = os.path.relpath(entry.path, self.album_dir)
+            seen.add(path)
+            stat = entry.stat()
+            if known.get(path) != (stat.st_size, stat.st_mtime_ns):
+                changed.append(path)
+
+        digests = hash_files(
+            [os.path.join(self.album_dir, p) for p in changed], self.workers
+        )
+        for path in changed:
+            digest = digests.get(os.path.join(self.album_dir, path))
+            if digest:
+                self.add(path, digest, commit=False)
+
+        removed = [(path,) for path in known if path not in seen]
+        with self._lock:
+            self.db.executemany("DELETE FROM files WHERE path = ?", removed)
+            self.db.commit()
+        logger.info(
+            f"Duplicate index refreshed: {len(changed)} hashed, {len(removed)} removed"
+        )
+
+    def lookup(self, digest):
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT path FROM files WHERE hash = ? ORDER BY path", (digest,)
+            ).fetchall()
+        for (path,) in rows:
+            if os.path.exists(os.path.join(self.album_dir, path)):
+                return path
+        return None
+
+    def add(self, path, digest, commit=True):
+        stat = os.stat(os.path.join(self.album_dir, path))
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO files (path, hash, size, mtime) "
+                "VALUES (?, ?, ?, ?)",
+                (path, digest, stat.st_size, stat.st_mtime_ns),
+            )
+            if commit:
+                self.db.commit()
+
+
+def link_duplicate(album_dir, existing, source):
+    # stored next to the existing copy with the same -c suffix ExifTool uses
+    stem, ext = os.path.splitext(existing)
+    n = 1
+    while os.path.lexists(os.path.join(album_dir, f"{stem}-{n}{ext}")):
+        n += 1
+    target = f"{stem}-{n}{ext}"
+    os.link(os.path.join(album_dir, existing), os.path.join(album_dir, target))
+    if source is not None:
+        os.remove(source)
+    return target
+
+
+def filter_duplicates(index, root_dir, import_dir):
+    """Handle exact duplicates in import_dir.
+
+    Returns the digests of the files left to organize, and the digests of
+    same-batch duplicates which still have to be linked once the first copy
+    is organized.
+    """
+    names = sorted(
+        os.path.relpath(os.path.join(dirpath, f), import_dir)
+        for dirpath, _, filenames in os.walk(import_dir)
+        for f in filenames
+    )
+    paths = [os.path.join(import_dir, n) for n in names]
+    digests = hash_files(paths, index.workers)
+
+    result = {}
+    pending = []
+    first_seen = {}
+    duplicates = 0
+    for name, path in zip(names, paths):
+        digest = digests.get(path)
+        if digest is None:
+            continue
+        existing = index.lookup(digest)
+        if existing is None and digest not in first_seen:
+            first_seen[digest] = name
+            result[name] = digest
+            continue
+
+        duplicates += 1
+        if existing is None:
+            # same content twice in one batch, the first copy is organized
+            logger.info(f"Duplicate of {first_seen[digest]} in the same batch: {name}")
+            if index.policy == "link":
+                # linked once the first copy has its album name
+                pending.append(digest)
+            os.remove(path)
+        elif index.policy == "link":
+            target = link_duplicate(root_dir, existing, path)
+            logger.info(f"Duplicate of {existing}, hardlinked as {target}: {name}")
+        else:
+            os.remove(path)
+            logger.info(f"Duplicate of {existing}, skipped: {name}")
+
+    if duplicates:
+        logger.info(f"Found {duplicates} duplicate files")
+    return result, pending
+
+
+def record_organized(index, root_dir, import_dir, plans, renames, digests, pending):
+    original = {p.final_name: p.name for p in plans}
+    organized = {}
+    for old, new in renames:
+        name = os.path.relpath(os.path.join(root_dir, old), import_dir)
+        digest = digests.get(original.get(name, name))
+        if digest is None:
+            continue
+        organized[digest] = new
+        try:
+            index.add(new, digest)
+        except OSError as e:
+            logger.warning(f"Cannot index {new}: {e}")
+
+    for digest in pending:
+        if digest not in organized:
+            logger.warning(f"First copy of {digest} was not organized, nothing to link")
+            continue
+        target = link_duplicate(root_dir, organized[digest], None)
+        logger.info(f"Hardlinked duplicate of {organized[digest]} as {target}")
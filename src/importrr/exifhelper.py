@@ -1,84 +1,256 @@
+import json
 import logging
 import os
+import re
+import subprocess
+import threading
+import time
 
 from exiftool import ExifToolHelper
-from exiftool.exceptions import ExifToolExecuteError
+from exiftool.exceptions import ExifToolException, ExifToolExecuteError
+
+from importrr import fastmeta, report
 
 logger = logging.getLogger(__name__)
 
+# in seconds; a command gets this plus its share for every file and GB it
+# reads, so a full batch of large videos is never killed halfway through
+COMMAND_TIMEOUT = 600
+TIMEOUT_PER_FILE = 1
+TIMEOUT_PER_GB = 60
+# in seconds, how often a running command checks that ExifTool is alive
+LIVENESS_INTERVAL = 1
 
-def organize(import_dir, root_dir):
-    logger.info("Organizing files by date and renaming")
-    logger.debug(f"Processing files in: {import_dir}")
-    # verbose because we need to get the new names of the files
-    params = [
-        "-verbose",
-        '-filename<${DateTimeOriginal#;DateFmt("%Y/%m")}/$DateTimeOriginal%-c.%e',
-        "-d",
-        "%Y%m%d-%H%M%S",
-        import_dir,
-    ]
+# sidecars are named after the full media file name so that a JPG and a MOV
+# taken in the same second don't share one
+SIDECAR_EXT = ".xmp"
 
-    output = run_exiftool(root_dir, params, False)
-    # split string
-    splits = output.split("\n")
-    logger.debug(f"ExifTool returned {len(splits)} output lines")
-    return splits
+# the planner only backfills files without a date, ExifTool checks again so a
+# misread file never has its real dates overwritten
+BACKFILL_GUARD = ["-if", "not $datetimeoriginal"]
 
+# how ExifTool reports what a write command changed
+UPDATED = re.compile(r"(\d+) image files? updated")
+
+# every tag the planner needs, read once per work dir
+METADATA_TAGS = [
+    "FileTypeExtension",
+    "DateTimeOriginal",
+    "CreateDate",
+    "CreationDate",
+    "XMP:DateCreated",
+    "PNG:CreateDate",
+    "FileModifyDate",
+]
+
+
+class ExifToolSession:
+    """A single -stay_open ExifTool process shared across a whole import run.
+
+    The process is started lazily, restarted if it has died, and killed if a
+    command runs longer than ``timeout`` seconds plus the allowance for the
+    files it names, see command_timeout(). pyexiftool has the process killed
+    when the thread which started it exits, so start() belongs on a thread
+    which lives as long as the session.
+    """
+
+    def __init__(self, root_dir, timeout=COMMAND_TIMEOUT):
+        self.root_dir = os.path.abspath(root_dir)
+        self.timeout = timeout
+        self.invocations = 0
+        self.restarts = 0
+        self.files_rewritten = 0
+        self.bytes_rewritten = 0
+        self._et = None
+        self._timed_out = False
+        self._died = False
+        self._lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        with self._lock:
+            if self._et is not None and self._et.running:
+                return
+            if self._et is not None:
+                logger.warning("ExifTool process died, restarting")
+                self.restarts += 1
+            # exiftool resolves relative target paths against its own cwd
+            os.chdir(self.root_dir)
+            self._et = ExifToolHelper(common_args=[])
+            self._et.run()
+            logger.debug(f"Started ExifTool session in {self.root_dir}")
+
+    def cpu_time(self):
+        # read without the lock, which a long command may be holding
+        et = self._et
+        if et is None or not et.running:
+            return 0.0
+        return report.process_cpu(et._process.pid)
+
+    @property
+    def version(self):
+        et = self._et
+        return et.version if et is not None and et.running else None
+
+    def record_rewrites(self, files, size):
+        with self._lock:
+            self.bytes_rewritten += size
+            self.files_rewritten += files
+
+    def close(self):
+        with self._lock:
+            if self._et is None:
+                return
+            try:
+                self._et.terminate()
+                logger.debug("ExifTool session closed")
+            except (OSError, subprocess.SubprocessError, ExifToolException) as e:
+                logger.warning(f"Failed to terminate ExifTool cleanly: {e}")
+            self._et = None
+
+    def execute(self, *params):
+        with self._lock:
+            self.start()
+            self.invocations += 1
+            self._timed_out = self._died = False
+            timeout = command_timeout(self.root_dir, params, self.timeout)
+            done = threading.Event()
+            watchdog = threading.Thread(
+                target=self._watch, args=(self._et, timeout, done), daemon=True
+            )
+            watchdog.start()
+            try:
+                return self._et.execute(*params)
+            except (OSError, ValueError) as e:
+                if self._died:
+                    raise OSError("ExifTool process died during the command") from e
+                if not self._timed_out:
+                    raise
+                self._et = None
+                raise TimeoutError(
+                    f"ExifTool command timed out after {timeout:.0f}s"
+                ) from e
+            finally:
+                done.set()
+                watchdog.join()
+
+    def _watch(self, et, timeout, done):
+        # pyexiftool keeps reading the pipes of a dead process at EOF, so a
+        # command whose process is gone is ended like one which runs too long
+        deadline = time.monotonic() + timeout
+        while not done.wait(
+            max(0.0, min(LIVENESS_INTERVAL, deadline - time.monotonic()))
+        ):
+            if not et.running:
+                logger.error("ExifTool process died during a command")
+                self._died = True
+                close_pipes(et._process)
+                return
+            if time.monotonic() >= deadline:
+                logger.error(
+                    f"ExifTool command exceeded {timeout:.0f}s, killing process"
+                )
+                self._timed_out = True
+                et._process.kill()
+                close_pipes(et._process)
+                return
+
+
+def close_pipes(process):
+    # pyexiftool blocks reading the pipes, so closing them is the only way to
+    # make the pending execute() return once the process is gone
+    process.stdout.close()
+    process.stderr.close()
 
-def adjust_extensions(import_dir, root_dir):
-    logger.info("Adjusting file extensions based on MIME types")
-    logger.debug(f"Processing files in: {import_dir}")
-    # adjust the names of the files based on their MIME type so Exiftool doesn't error out
-    params = [
-        "-filename<%f.$fileTypeExtension",
-        "-ext",
-        "GIF",
-        "-ext",
-        "JPG",
-        "-ext",
-        "PNG",
-        "-ext",
-        "3GP",
-        "-ext",
-        "MOV",
-        "-ext",
-        "MP4",
-        import_dir,
-    ]
-    run_exiftool(root_dir, params)
 
+def command_timeout(root_dir, params, base=COMMAND_TIMEOUT):
+    """base, plus the allowance for every file and directory in params."""
+    files = 0
+    size = 0
+    for param in params:
+        if param.startswith("-"):
+            continue
+        path = os.path.join(root_dir, param)
+        if os.path.isdir(path):
+            for dirpath, _, filenames in os.walk(path):
+                for f in filenames:
+                    files += 1
+                    size += file_size(os.path.join(dirpath, f))
+        elif os.path.isfile(path):
+            files += 1
+            size += file_size(path)
+    return base + files * TIMEOUT_PER_FILE + size / 1000000000 * TIMEOUT_PER_GB
 
-def adjust_screenshots(import_dir, root_dir):
-    logger.info("Backfilling EXIF dates for screenshots and images")
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def read_metadata(import_dir, root_dir, session=None, fast=False):
+    logger.info("Reading metadata for all files")
     logger.debug(f"Processing files in: {import_dir}")
+    records = []
+    targets = [import_dir]
+    if fast:
+        # JPEG, PNG and QuickTime headers are parsed in-process; ExifTool only
+        # sees the files the fast reader can't fully answer for
+        with report.span("metadata.fast") as span:
+            records, targets = fastmeta.read_dir(import_dir)
+            span["files"] = len(records)
+        if not targets:
+            return records
 
-    common_params = [
-        "-if",
-        "not $datetimeoriginal",
-        "-ext",
-        "GIF",
-        "-ext",
-        "JPG",
-        "-ext",
-        "PNG",
-        import_dir,
-    ]
+    # one pass over every tag the later steps need, grouped so PNG:CreateDate
+    # and QuickTime:CreateDate can be told apart
+    # -r because the work dir keeps the layout of nested import folders
+    params = ["-r", "-json", "-G"] + ["-" + tag for tag in METADATA_TAGS] + targets
 
-    # if there is any date in the metadata then add it in
-    params = [
-        "-overwrite_original",
-        "-EXIF:DateTimeOriginal<FileModifyDate",
-        "-XMP:DateCreated<FileModifyDate",
-        "-EXIF:DateTimeOriginal<XMP:DateCreated",
-        "-XMP:DateCreated<XMP:DateCreated",
-        "-EXIF:DateTimeOriginal<PNG:CreateDate",
-        "-XMP:DateCreated<PNG:CreateDate",
-    ] + common_params
-    run_exiftool(root_dir, params)
+    with report.span("exiftool.read", session) as span:
+        try:
+            output = run_exiftool(root_dir, params, session=session)
+        except ExifToolExecuteError as e:
+            # unreadable files are reported in the JSON with an Error key
+            output = e.stdout
+        exiftool_records = json.loads(output) if output else []
+        span["files"] = len(exiftool_records)
+    if not exiftool_records:
+        return records
+    logger.debug(f"ExifTool returned metadata for {len(exiftool_records)} files")
+    return records + exiftool_records
+
+
+def adjust_screenshots(files, root_dir, source, session=None, sidecar=False):
+    logger.info(f"Backfilling EXIF dates for {len(files)} images from {source}")
 
+    if sidecar:
+        tags = [
+            "-XMP-exif:DateTimeOriginal<" + source,
+            "-XMP-photoshop:DateCreated<" + source,
+        ]
+        write_sidecars(files, root_dir, tags, session)
+        return
 
-def copy_tags(root_dir, input_file, output_file):
+    params = (
+        [
+            "-overwrite_original",
+            "-EXIF:DateTimeOriginal<" + source,
+            "-XMP:DateCreated<" + source,
+        ]
+        + BACKFILL_GUARD
+        + files
+    )
+    rewrite(root_dir, params, files, session)
+
+
+def copy_tags(root_dir, input_file, output_file, session=None):
     logger.debug(f"Copying EXIF tags: {input_file} -> {output_file}")
     params = [
         "-overwrite_original",
@@ -88,45 +260,94 @@ def copy_tags(root_dir, input_file, output_file):
         output_file,
     ]
 
-    run_exiftool(root_dir, params)
+    rewrite(root_dir, params, [output_file], session)
 
 
-def backfill_videos(import_dir, root_dir):
-    logger.info("Backfilling video metadata dates")
-    backfill_video_tag(import_dir, root_dir, "CreationDate")
-    backfill_video_tag(import_dir, root_dir, "CreateDate")
+def backfill_video_tag(files, root_dir, tag, session=None, sidecar=False):
+    logger.info(f"Backfilling dates for {len(files)} videos from {tag}")
 
+    if sidecar:
+        tags = [
+            "-XMP-exif:DateTimeOriginal<" + tag,
+            "-XMP-xmp:CreateDate<" + tag,
+        ]
+        write_sidecars(files, root_dir, tags, session)
+        return
 
-def backfill_video_tag(import_dir, root_dir, tag):
-    logger.debug(f"Backfilling video dates using {tag} metadata")
-    params = [
-        "-overwrite_original",
-        "-datetimeoriginal<" + tag,
-        "-time:all<$" + tag,
-        "-if",
-        "not $datetimeoriginal",
-        "-ext",
-        "3GP",
-        "-ext",
-        "MOV",
-        "-ext",
-        "MP4",
-        import_dir,
-    ]
-    run_exiftool(root_dir, params)
+    params = (
+        [
+            "-overwrite_original",
+            "-datetimeoriginal<" + tag,
+            "-time:all<$" + tag,
+        ]
+        + BACKFILL_GUARD
+        + files
+    )
+    rewrite(root_dir, params, files, session)
+
+
+def write_sidecars(files, root_dir, tags, session=None):
+    logger.debug(f"Writing XMP sidecars for {len(files)} files")
+    # the media files are only read, never rewritten
+    params = ["-tagsFromFile", "@"] + tags + ["-o", "%d%f.%e" + SIDECAR_EXT] + files
+    run_exiftool(root_dir, params, session=session)
+
+
+def rewrite(root_dir, params, files, session=None):
+    # counted once ExifTool has reported what it changed, so a failed
+    # command or a file skipped by -if is never counted
+    before = identities(root_dir, files)
+    output = run_exiftool(root_dir, params, session=session)
+    count_rewrites(session, root_dir, before, output)
 
 
-def run_exiftool(root_dir, params, on_error=True):
+def identities(root_dir, files):
+    result = {}
+    for f in files:
+        try:
+            st = os.stat(os.path.join(root_dir, f))
+        except OSError:
+            continue
+        result[f] = (st.st_ino, st.st_mtime_ns)
+    return result
+
+
+def count_rewrites(session, root_dir, before, output):
+    """Add what a write command reported to the session's rewrite counts.
+
+    -overwrite_original writes a full new copy of every file it updates, and
+    that copy replaces the file, so the updated files are the ones whose
+    inode or mtime changed.
+    """
+    # None when every file failed the -if condition
+    match = UPDATED.search(output) if isinstance(output, str) else None
+    if session is None or match is None or int(match.group(1)) == 0:
+        return
+    size = 0
+    for f, identity in before.items():
+        try:
+            st = os.stat(os.path.join(root_dir, f))
+        except OSError:
+            continue
+        if (st.st_ino, st.st_mtime_ns) != identity:
+            size += st.st_size
+    session.record_rewrites(int(match.group(1)), size)
+
+
+def run_exiftool(root_dir, params, on_error=True, session=None):
     logger.debug(
         f"Running ExifTool with params: {' '.join(params[:3])}..."
     )  # Show first few params
     os.chdir(root_dir)
 
     try:
-        with ExifToolHelper(common_args=[]) as et:
-            result = et.execute(*params)
-            logger.debug("ExifTool execution completed successfully")
-            return result
+        if session is not None:
+            result = session.execute(*params)
+        else:
+            with ExifToolHelper(common_args=[]) as et:
+                result = et.execute(*params)
+        logger.debug("ExifTool execution completed successfully")
+        return result
     except ExifToolExecuteError as e:
         # exiftool will return error code 2 when all files fail the condition
         if e.stdout is not None:
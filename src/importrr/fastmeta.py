@@ -0,0 +1,294 @@
+import logging
+import mmap
+import os
+import re
+import struct
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+EXIF_HEADER = b"Exif\x00\x00"
+
+# EXIF tags
+EXIF_IFD_POINTER = 0x8769
+DATE_TIME_ORIGINAL = 0x9003
+CREATE_DATE = 0x9004
+
+# ISO base media brands ExifTool reports with these extensions
+MOV_BRANDS = {b"qt  "}
+MP4_BRANDS = {b"isom", b"iso2", b"mp41", b"mp42", b"avc1", b"dash"}
+THREE_GP_BRANDS = {b"3gp4", b"3gp5", b"3gp6", b"3g2a"}
+
+QUICKTIME_EPOCH = datetime(1904, 1, 1)
+# user data ExifTool can read a DateTimeOriginal from: XMP, and the Exif
+# blocks cameras of Canon and Nikon write
+UDTA_DATES = {b"XMP_", b"uuid", b"CNTH", b"NCDT"}
+CREATION_DATE_KEY = b"com.apple.quicktime.creationdate"
+ISO_DATE = re.compile(
+    r"^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})([+-]\d{2}):?(\d{2})?"
+)
+
+
+def read(path):
+    """Return an ExifTool-like record for path, or None to fall back to ExifTool.
+
+    Only files whose dates can be read completely are answered here; anything
+    which would need a backfill source this reader doesn't know, or which is
+    malformed, is left to ExifTool.
+    """
+    try:
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_size < 16:
+                return None
+            # only the pages holding the headers are ever read from disk
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                record = parse(m)
+    except (OSError, ValueError, struct.error) as e:
+        logger.debug(f"Fast metadata reader gave up on {path}: {e}")
+        return None
+
+    if record is None:
+        return None
+    # keys use ExifTool's -G group names, like the records from read_metadata
+    record["SourceFile"] = path
+    record["File:FileModifyDate"] = format_local(stat.st_mtime)
+    return record
+
+
+def parse(m):
+    if m[:2] == b"\xff\xd8":
+        return parse_jpeg(m)
+    if m[:8] == PNG_SIGNATURE:
+        return parse_png(m)
+    if m[4:8] == b"ftyp":
+        return parse_quicktime(m)
+    return None
+
+
+def parse_jpeg(m):
+    offset = 2
+    while offset + 4 <= len(m):
+        if m[offset] != 0xFF:
+            return None
+        marker = m[offset + 1]
+        if marker == 0xFF:
+            # fill byte
+            offset += 1
+            continue
+        if marker == 0xDA or marker == 0xD9:
+            # start of scan, no metadata after this
+            break
+        (length,) = struct.unpack_from(">H", m, offset + 2)
+        start = offset + 4
+        if marker == 0xE1 and m[start : start + 6] == EXIF_HEADER:
+            dates = parse_tiff(m, start + 6, start + length - 2)
+            if not dates.get(DATE_TIME_ORIGINAL):
+                return None
+            return exif_record("jpg", dates)
+        offset = start + length - 2
+    return None
+
+
+def parse_png(m):
+    offset = 8
+    while offset + 8 <= len(m):
+        length, chunk = struct.unpack_from(">I4s", m, offset)
+        start = offset + 8
+        if chunk == b"eXIf":
+            dates = parse_tiff(m, start, start + length)
+            if not dates.get(DATE_TIME_ORIGINAL):
+                return None
+            return exif_record("png", dates)
+        if chunk == b"IEND":
+            break
+        offset = start + length + 4
+    # screenshots are dated from tEXt/XMP, which is left to ExifTool
+    return None
+
+
+def exif_record(file_type, dates):
+    record = {"File:FileTypeExtension": file_type}
+    record["EXIF:DateTimeOriginal"] = dates[DATE_TIME_ORIGINAL]
+    if dates.get(CREATE_DATE):
+        record["EXIF:CreateDate"] = dates[CREATE_DATE]
+    return record
+
+
+def parse_tiff(m, start, end):
+    """Read DateTimeOriginal and CreateDate from the Exif IFD of a TIFF block."""
+    order = m[start : start + 2]
+    if order == b"II":
+        endian = "<"
+    elif order == b"MM":
+        endian = ">"
+    else:
+        raise ValueError("Bad TIFF byte order")
+
+    def entries(ifd):
+        (count,) = struct.unpack_from(endian + "H", m, start + ifd)
+        for i in range(count):
+            entry = start + ifd + 2 + 12 * i
+            if entry + 12 > end:
+                raise ValueError("IFD runs past its segment")
+            yield entry, struct.unpack_from(endian + "HHII", m, entry)
+
+    def ascii(entry, count, value):
+        data_at = entry + 8 if count <= 4 else start + value
+        if data_at + count > end:
+            raise ValueError("Tag value runs past its segment")
+        return bytes(m[data_at : data_at + count]).split(b"\x00")[0].decode("ascii")
+
+    (ifd0,) = struct.unpack_from(endian + "I", m, start + 4)
+    exif_ifd = None
+    for _, (tag, _, _, value) in entries(ifd0):
+        if tag == EXIF_IFD_POINTER:
+            exif_ifd = value
+            break
+
+    dates = {}
+    if exif_ifd is None:
+        return dates
+    for entry, (tag, kind, count, value) in entries(exif_ifd):
+        if tag in (DATE_TIME_ORIGINAL, CREATE_DATE) and kind == 2:
+            dates[tag] = ascii(entry, count, value).strip()
+    return dates
+
+
+def boxes(m, start, end):
+    offset = start
+    while offset + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", m, offset)
+        header = 8
+        if size == 1:
+            (size,) = struct.unpack_from(">Q", m, offset + 8)
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header or offset + size > end:
+            raise ValueError(f"Bad {kind!r} box size")
+        yield kind, offset + header, offset + size
+        offset += size
+
+
+def parse_quicktime(m):
+    brand = bytes(m[8:12])
+    if brand in MOV_BRANDS:
+        file_type = "mov"
+    elif brand in MP4_BRANDS:
+        file_type = "mp4"
+    elif brand in THREE_GP_BRANDS:
+        file_type = "3gp"
+    else:
+        return None
+
+    record = None
+    for kind, start, end in boxes(m, 0, len(m)):
+        if kind == b"uuid":
+            # XMP, which may already hold a DateTimeOriginal
+            return None
+        if kind != b"moov":
+            continue
+        record = {"File:FileTypeExtension": file_type}
+        for child, child_start, child_end in boxes(m, start, end):
+            if child == b"mvhd":
+                record["QuickTime:CreateDate"] = mvhd_date(m, child_start)
+            elif child == b"meta":
+                date = creation_date(m, child_start, child_end)
+                if date:
+                    record["QuickTime:CreationDate"] = date
+            elif child == b"uuid":
+                return None
+            elif child == b"udta":
+                for data, _, _ in boxes(m, child_start, child_end):
+                    if data in UDTA_DATES:
+                        return None
+    # None when no movie header was found
+    return record
+
+
+def mvhd_date(m, start):
+    version = m[start]
+    if version == 1:
+        (seconds,) = struct.unpack_from(">Q", m, start + 4)
+    else:
+        (seconds,) = struct.unpack_from(">I", m, start + 4)
+    if seconds == 0:
+        return "0000:00:00 00:00:00"
+    # ExifTool shows the stored value as is, which is UTC by convention
+    date = QUICKTIME_EPOCH + timedelta(seconds=seconds)
+    return date.strftime("%Y:%m:%d %H:%M:%S")
+
+
+def creation_date(m, start, end):
+    # Apple's mdta metadata: 'keys' names every item, 'ilst' holds the values
+    # with the 1-based key index as the box type
+    keys = []
+    values = {}
+    for kind, box_start, box_end in boxes(m, start, end):
+        if kind == b"keys":
+            (count,) = struct.unpack_from(">I", m, box_start + 4)
+            offset = box_start + 8
+            for _ in range(count):
+                # the count comes from the file, so each entry has to fit
+                if offset + 8 > box_end:
+                    raise ValueError("keys run past their box")
+                (size,) = struct.unpack_from(">I", m, offset)
+                if size < 8 or offset + size > box_end:
+                    raise ValueError(f"Bad key size {size}")
+                keys.append(bytes(m[offset + 8 : offset + size]))
+                offset += size
+        elif kind == b"ilst":
+            for item, item_start, item_end in boxes(m, box_start, box_end):
+                for data, data_start, data_end in boxes(m, item_start, item_end):
+                    if data == b"data":
+                        (index,) = struct.unpack(">I", item)
+                        values[index] = bytes(m[data_start + 8 : data_end])
+
+    for i, key in enumerate(keys, 1):
+        if key == CREATION_DATE_KEY and i in values:
+            return format_iso(values[i].decode("utf-8", "replace"))
+    return None
+
+
+def format_iso(value):
+    # 2024-01-02T03:04:05+0100 as ExifTool prints it: 2024:01:02 03:04:05+01:00
+    match = ISO_DATE.match(value)
+    if match is None:
+        return None
+    y, mo, d, h, mi, s, tz_h, tz_m = match.groups()
+    result = f"{y}:{mo}:{d} {h}:{mi}:{s}"
+    if tz_h:
+        result += f"{tz_h}:{tz_m or '00'}"
+    return result
+
+
+def format_local(timestamp):
+    # FileModifyDate as ExifTool prints it, in local time with the offset
+    local = datetime.fromtimestamp(timestamp).astimezone()
+    offset = local.strftime("%z")
+    return local.strftime("%Y:%m:%d %H:%M:%S") + offset[:3] + ":" + offset[3:]
+
+
+def read_dir(import_dir):
+    """Read every file below import_dir.
+
+    Returns the records which were read here and the paths which still need
+    ExifTool.
+    """
+    records = []
+    fallback = []
+    for dirpath, _, filenames in os.walk(import_dir):
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            record = read(path)
+            if record is None:
+                fallback.append(path)
+            else:
+                records.append(record)
+    logger.info(
+        f"Read metadata of {len(records)} files directly, "
+        f"{len(fallback)} left for ExifTool"
+    )
+    return records, fallback
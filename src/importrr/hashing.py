@@ -0,0 +1,17 @@
+import hashlib
+
+# large reads keep the syscall count down on multi-GB videos
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def file_digest(path, algorithm="sha256", chunk_size=CHUNK_SIZE):
+    digest = hashlib.new(algorithm)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
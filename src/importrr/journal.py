@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# hidden, so neither the scan nor ExifTool ever picks the journals up
+JOURNAL_DIR = ".importrr"
+JOURNAL_EXT = ".journal"
+
+
+def unfinished(import_dir):
+    """Names of the batches an earlier run left unfinished, oldest first."""
+    try:
+        names = os.listdir(os.path.join(import_dir, JOURNAL_DIR))
+    except FileNotFoundError:
+        return []
+    return sorted(n[: -len(JOURNAL_EXT)] for n in names if n.endswith(JOURNAL_EXT))
+
+
+class Journal:
+    """Append-only record of what a batch has finished, one JSON line a step.
+
+    Stages are "started", "renamed", "backfilled", "organized", "transcoded",
+    "archiving" and "archived". Every line is written out at once, so a
+    killed process loses at most the step it was in.
+    """
+
+    def __init__(self, import_dir, name):
+        self.path = os.path.join(import_dir, JOURNAL_DIR, name + JOURNAL_EXT)
+        self.lock = threading.Lock()
+        self.fd = None
+        self.entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            # the last line was cut off when the process was killed
+            logger.warning(f"Dropping incomplete last entry of {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+        return [json.loads(line) for line in data[:end].splitlines() if line]
+
+    @property
+    def resumed(self):
+        return bool(self.entries)
+
+    def record(self, stage, **fields):
+        entry = {"stage": stage, **fields}
+        line = json.dumps(entry) + "\n"
+        with self.lock:
+            if self.fd is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+                self.fd = os.open(self.path, flags, 0o644)
+            # unbuffered, every line reaches the file in one write
+            os.write(self.fd, line.encode())
+            self.entries.append(entry)
+
+    def files(self, stage):
+        result = set()
+        for e in self.entries:
+            if e["stage"] == stage:
+                result.update(e.get("files") or [e["file"]])
+        return result
+
+    def transcoded(self):
+        return {e["file"]: e["to"] for e in self.entries if e["stage"] == "transcoded"}
+
+    def unarchived(self):
+        """Organized files which never made it into a finished tar, in order."""
+        archived = self.files("archived")
+        transcoded = self.transcoded()
+        return [
+            e["to"]
+            for e in self.entries
+            if e["stage"] == "organized"
+            and e["to"] not in archived
+            and transcoded.get(e["to"]) not in archived
+        ]
+
+    def stale_parts(self):
+        # tars that were being written when the run stopped
+        finished = {e.get("part") for e in self.entries if e["stage"] == "archived"}
+        return [
+            e["part"]
+            for e in self.entries
+            if e["stage"] == "archiving" and e["part"] not in finished
+        ]
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+    def remove(self):
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            return
+        try:
+            os.rmdir(os.path.dirname(self.path))
+        except OSError:
+            # journals of other batches are still in there
+            pass
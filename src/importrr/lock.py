@@ -0,0 +1,31 @@
+import contextlib
+import fcntl
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILE = ".importrr.lock"
+
+
+@contextlib.contextmanager
+def album_lock(album_dir):
+    """Hold an exclusive lock on album_dir while files are organized into it.
+
+    flock is released by the kernel if the worker dies, so a crashed run never
+    leaves a stale lock behind.
+    """
+    path = os.path.join(album_dir, LOCK_FILE)
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info(f"Waiting for another worker to release {album_dir}")
+            start = time.time()
+            fcntl.flock(f, fcntl.LOCK_EX)
+            logger.info(f"Acquired {album_dir} after {time.time() - start:.2f}s")
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
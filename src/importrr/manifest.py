@@ -0,0 +1,194 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import tarfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_EXT = ".manifest.json"
+TAR_EXT = ".tar"
+
+
+def manifest_path(tar_file):
+    # prefix-0.tar -> prefix-0.manifest.json
+    return tar_file[: -len(TAR_EXT)] + MANIFEST_EXT
+
+
+def listing(tar):
+    """Every member of an open TarWriter with its size, SHA-256 and offsets."""
+    files = []
+    for member in tar.getmembers():
+        entry = {
+            "path": member.name,
+            "size": member.size,
+            "mtime": int(member.mtime),
+            "offset": member.offset,
+            "offset_data": member.offset_data,
+        }
+        if member.islnk():
+            entry["link"] = member.linkname
+        elif member.isreg():
+            entry["sha256"] = tar.digests[member.offset]
+        files.append(entry)
+    return files
+
+
+def save(tar_file, files):
+    """Write the manifest of a finished tar next to it."""
+    manifest = {
+        "tar": os.path.basename(tar_file),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "files": files,
+    }
+    path = manifest_path(tar_file)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp, path)
+    logger.debug(f"Wrote manifest {path}")
+    return path
+
+
+def sha256(mm, offset, size):
+    # hashlib reads straight from the mapped pages, nothing is copied
+    with memoryview(mm) as view:
+        return hashlib.sha256(view[offset : offset + size]).hexdigest()
+
+
+def verify_mirror(archive_dir, manifest):
+    # mirrored files are plain files in the archive dir, hardlinked ones
+    # share their data with the album, so only their presence is checked
+    problems = []
+    for entry in manifest["files"]:
+        name = entry.get("archived_as", entry["path"])
+        try:
+            size = os.stat(os.path.join(archive_dir, name)).st_size
+        except OSError as e:
+            problems.append(f"{name}: {e.strerror}")
+            continue
+        if size != entry["size"]:
+            problems.append(f"{name}: {size} bytes, expected {entry['size']}")
+    return problems
+
+
+def verify_references(tar_file, references):
+    # content archived before is only checked against the manifest of the
+    # volume holding it; that volume's own check covers the data
+    problems = []
+    listed = {}
+    for entry in references:
+        volume = os.path.normpath(os.path.join(os.path.dirname(tar_file), entry["ref"]))
+        if volume not in listed:
+            try:
+                with open(manifest_path(volume)) as f:
+                    listed[volume] = {e["path"]: e for e in json.load(f)["files"]}
+            except (OSError, ValueError, KeyError):
+                listed[volume] = None
+        if listed[volume] is None:
+            problems.append(f"{entry['path']}: {entry['ref']} has no manifest")
+        elif listed[volume].get(entry["link"], {}).get("sha256") != entry["sha256"]:
+            problems.append(f"{entry['path']}: not stored in {entry['ref']}")
+    return problems
+
+
+def verify_volume(path):
+    """Check the tar of a manifest against it; returns a list of problems.
+
+    Only the member headers are parsed, the data of each member is hashed
+    where it lies in the tar, so nothing is extracted.
+    """
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        return [f"unreadable manifest: {e}"]
+    if "tar" not in manifest:
+        return verify_mirror(os.path.dirname(path), manifest)
+
+    tar_file = os.path.join(os.path.dirname(path), manifest["tar"])
+    # a name can be in a tar more than once, its entries are in tar order
+    expected = {}
+    for item in manifest["files"]:
+        if "ref" not in item:
+            expected.setdefault(item["path"], []).append(item)
+    problems = verify_references(tar_file, [e for e in manifest["files"] if "ref" in e])
+    try:
+        with tarfile.open(tar_file) as tar, open(tar_file, "rb") as f:
+            members = tar.getmembers()
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if members else None
+            try:
+                for member in members:
+                    entries = expected.get(member.name)
+                    entry = entries.pop(0) if entries else None
+                    if entry is None:
+                        problems.append(f"{member.name}: not in the manifest")
+                    elif member.size != entry["size"]:
+                        problems.append(
+                            f"{member.name}: {member.size} bytes, "
+                            f"expected {entry['size']}"
+                        )
+                    elif entry.get("offset_data", member.offset_data) != (
+                        member.offset_data
+                    ):
+                        # the restore index would read the wrong bytes
+                        problems.append(f"{member.name}: offset changed")
+                    elif member.islnk():
+                        if member.linkname != entry.get("link"):
+                            problems.append(f"{member.name}: link changed")
+                    elif member.isreg() and entry.get("sha256") != sha256(
+                        mm, member.offset_data, member.size
+                    ):
+                        problems.append(f"{member.name}: checksum mismatch")
+            finally:
+                if mm is not None:
+                    mm.close()
+    except (OSError, tarfile.TarError, ValueError) as e:
+        return [f"unreadable {manifest['tar']}: {e}"]
+    problems += [
+        f"{name}: missing from the tar"
+        for name, entries in expected.items()
+        for _ in entries
+    ]
+    return problems
+
+
+def walk(path):
+    # the dir and its yyyy/mm volume folders, without hidden ones
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for name in sorted(filenames):
+            yield os.path.join(dirpath, name)
+
+
+def find(paths):
+    """Manifests in the given dirs, and the given manifests themselves."""
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            result += [p for p in walk(path) if p.endswith(MANIFEST_EXT)]
+        else:
+            result.append(path)
+    return result
+
+
+def unlisted(paths):
+    # tars written before manifests existed, or whose manifest is lost
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            result += [
+                p
+                for p in walk(path)
+                if p.endswith(TAR_EXT) and not os.path.exists(manifest_path(p))
+            ]
+    return result
+
+
+def verify(manifests, jobs=None):
+    """{manifest: problems} for every manifest, checked in parallel."""
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return dict(zip(manifests, pool.map(verify_volume, manifests)))
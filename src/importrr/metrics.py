@@ -0,0 +1,247 @@
+import logging
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from importrr import journal, report, scanner
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# in seconds
+TRANSCODE_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+RUN_BUCKETS = (1, 10, 60, 300, 900, 1800, 3600, 7200, 14400)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # labels -> [count per bucket, sum, count]
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts, total, count = self.series.get(labels, ([0] * len(self.buckets), 0, 0))
+        counts = [c + (value <= b) for c, b in zip(counts, self.buckets)]
+        self.series[labels] = (counts, total + value, count + 1)
+
+    def render(self, name):
+        lines = []
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            for bucket, c in zip(self.buckets, counts):
+                le = format_labels(labels + (("le", bucket),))
+                lines.append(f"{name}_bucket{le} {c}")
+            le = format_labels(labels + (("le", "+Inf"),))
+            lines.append(f"{name}_bucket{le} {count}")
+            lines.append(f"{name}_sum{format_labels(labels)} {round(total, 3)}")
+            lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return lines
+
+
+class Metrics:
+    """Prometheus metrics built from the run reports and the import dirs.
+
+    Imports may run in worker processes, so nothing is counted in memory
+    while importing; every report which appears in report_dir is added to
+    the counters once, and the backlog is measured on each scrape. Reports
+    already there at startup only set the gauges, so the counters restart
+    from zero instead of jumping by every report kept.
+    """
+
+    def __init__(self, report_dir, sections):
+        self.report_dir = report_dir
+        self.sections = sections
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.counters = {
+            "importrr_runs_total": {},
+            "importrr_files_imported_total": {},
+            "importrr_bytes_archived_total": {},
+            "importrr_exiftool_invocations_total": {},
+            "importrr_transcode_seconds_total": {},
+            "importrr_transcode_media_seconds_total": {},
+        }
+        self.last_success = {}
+        self.speed_ratio = {}
+        self.transcode_seconds = Histogram(TRANSCODE_BUCKETS)
+        self.run_seconds = Histogram(RUN_BUCKETS)
+        self.collect(count=False)
+
+    def count(self, name, labels, value):
+        series = self.counters[name]
+        series[labels] = series.get(labels, 0) + value
+
+    def collect(self, count=True):
+        try:
+            names = set(os.listdir(self.report_dir))
+        except FileNotFoundError:
+            return
+        names = {n for n in names if n.endswith(report.REPORT_EXT)}
+        # pruned reports are forgotten, their counts stay
+        self.seen &= names
+        for name in sorted(names - self.seen):
+            run = report.load_one(os.path.join(self.report_dir, name))
+            if run is not None:
+                self.add(run, count)
+            self.seen.add(name)
+
+    def add(self, run, count=True):
+        section = (("section", run.get("section", "")),)
+        stages = run.get("stages", {})
+        ok = run.get("failed_batches") == 0 and not any(
+            s.get("failed") for s in run.get("spans", [])
+        )
+
+        wall = media = 0.0
+        transcodes = []
+        for s in run.get("spans", []):
+            if s.get("stage") != "transcode" or s.get("failed"):
+                continue
+            transcodes.append(s["wall"])
+            if s.get("duration"):
+                wall += s["wall"]
+                media += s["duration"]
+        if wall:
+            self.speed_ratio[section] = media / wall
+        if ok and run.get("finished", 0) > self.last_success.get(section, 0):
+            self.last_success[section] = run["finished"]
+        if not count:
+            return
+
+        result = (("result", "success" if ok else "failure"),)
+        self.count("importrr_runs_total", section + result, 1)
+        self.count(
+            "importrr_files_imported_total",
+            section,
+            stages.get("organize", {}).get("files", 0),
+        )
+        self.count(
+            "importrr_bytes_archived_total",
+            section,
+            stages.get("tar", {}).get("bytes", 0)
+            + stages.get("mirror", {}).get("bytes", 0),
+        )
+        self.count(
+            "importrr_exiftool_invocations_total",
+            section,
+            run.get("exiftool_invocations", 0),
+        )
+        self.count("importrr_transcode_seconds_total", section, wall)
+        self.count("importrr_transcode_media_seconds_total", section, media)
+        self.run_seconds.observe(section, run.get("wall", 0))
+        for seconds in transcodes:
+            self.transcode_seconds.observe(section, seconds)
+
+    def backlog(self):
+        """Per import dir: files and bytes waiting, files left in work dirs
+        and batches waiting to be resumed."""
+        result = []
+        for d in self.sections:
+            album = d.get("album")
+            section = os.path.basename(os.path.normpath(album))
+            for import_dir in d.get("import"):
+                path = os.path.join(album, import_dir)
+                labels = (("section", section), ("import_dir", import_dir))
+                if not os.path.isdir(path):
+                    continue
+                waiting = waiting_bytes = failed = 0
+                # a work dir with a journal is the running batch, or one the
+                # next run resumes; only files a finished batch left are failed
+                try:
+                    unfinished = journal.unfinished(path)
+                    for _, stat in scanner.walk(path, d.get("recursive", False)):
+                        waiting += 1
+                        waiting_bytes += stat.st_size
+                    for entry in os.scandir(path):
+                        if (
+                            entry.is_dir()
+                            and scanner.WORK_DIR.match(entry.name)
+                            and entry.name not in unfinished
+                        ):
+                            failed += sum(1 for _ in scanner.walk(entry.path, True))
+                except OSError as e:
+                    logger.warning(f"Cannot measure backlog of {path}: {e}")
+                    continue
+                result.append((labels, waiting, waiting_bytes, failed, len(unfinished)))
+        return result
+
+    def render(self):
+        with self.lock:
+            self.collect()
+            lines = []
+            for name, series in self.counters.items():
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in sorted(series.items()):
+                    lines.append(f"{name}{format_labels(labels)} {round(value, 3)}")
+
+            lines.append("# TYPE importrr_transcode_duration_seconds histogram")
+            lines += self.transcode_seconds.render(
+                "importrr_transcode_duration_seconds"
+            )
+            lines.append("# TYPE importrr_run_duration_seconds histogram")
+            lines += self.run_seconds.render("importrr_run_duration_seconds")
+
+            lines.append("# TYPE importrr_transcode_speed_ratio gauge")
+            for labels, value in sorted(self.speed_ratio.items()):
+                line = f"importrr_transcode_speed_ratio{format_labels(labels)}"
+                lines.append(f"{line} {round(value, 3)}")
+            lines.append("# TYPE importrr_last_success_timestamp_seconds gauge")
+            for labels, value in sorted(self.last_success.items()):
+                line = f"importrr_last_success_timestamp_seconds{format_labels(labels)}"
+                lines.append(f"{line} {value}")
+
+        backlog = self.backlog()
+        gauges = [
+            ("importrr_backlog_files", 1),
+            ("importrr_backlog_bytes", 2),
+            ("importrr_failed_files", 3),
+            ("importrr_unfinished_batches", 4),
+        ]
+        for name, i in gauges:
+            lines.append(f"# TYPE {name} gauge")
+            for row in backlog:
+                lines.append(f"{name}{format_labels(row[0])} {row[i]}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    metrics: Metrics
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        try:
+            body = self.metrics.render().encode()
+        except (OSError, KeyError, TypeError, ValueError) as e:
+            logger.error(f"Failed to render metrics: {e}")
+            self.send_error(500)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+def serve(metrics, port, host=""):
+    """Serve /metrics from a daemon thread; returns the server."""
+    handler = type("Handler", (MetricsHandler,), {"metrics": metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics", daemon=True)
+    thread.start()
+    logger.info(f"Serving metrics on port {server.server_address[1]}")
+    return server
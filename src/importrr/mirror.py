@@ -0,0 +1,167 @@
+import errno
+import fcntl
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+
+from importrr.manifest import MANIFEST_EXT
+
+logger = logging.getLogger(__name__)
+
+# from linux/fs.h, _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# the filesystems can't do it for any file, so the method is given up on
+UNSUPPORTED = {
+    errno.EXDEV,
+    errno.EPERM,
+    errno.EMLINK,
+    errno.EINVAL,
+    errno.ENOTTY,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+}
+
+
+def hardlink(src, dst):
+    os.link(src, dst)
+
+
+def reflink(src, dst):
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+
+def copy_range(src, dst):
+    # the kernel clones or copies server-side where it can, and never passes
+    # the data through this process
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        left = os.fstat(s.fileno()).st_size
+        while left > 0:
+            n = os.copy_file_range(s.fileno(), d.fileno(), left)
+            if n == 0:
+                break
+            left -= n
+
+
+def copy(src, dst):
+    # sendfile on Linux
+    shutil.copyfile(src, dst)
+
+
+METHODS = {
+    "hardlink": hardlink,
+    "reflink": reflink,
+    "copy_file_range": copy_range,
+    "copy": copy,
+}
+
+
+def same_file(st, other):
+    # the same inode, or a copy an interrupted run already finished
+    return os.path.samestat(st, other) or (
+        st.st_size == other.st_size and st.st_mtime_ns == other.st_mtime_ns
+    )
+
+
+class Mirror:
+    """Places album files into an archive dir under the same relative paths.
+
+    A hardlink costs neither time nor space when both dirs are on one
+    filesystem. Otherwise the file is cloned with FICLONE (btrfs, XFS), then
+    copy_file_range is tried, and a plain copy is the last resort. A method
+    the filesystems don't support is not tried again by this mirror.
+    """
+
+    def __init__(self, root_dir, archive_dir):
+        self.root_dir = root_dir
+        self.archive_dir = archive_dir
+        self.methods = [
+            m
+            for m in METHODS
+            if m != "copy_file_range" or hasattr(os, "copy_file_range")
+        ]
+        self.placed = []
+
+    def target(self, f, st):
+        """Where f goes in the archive, or None if it is already there."""
+        base, ext = os.path.splitext(f)
+        target = f
+        c = 0
+        while True:
+            try:
+                other = os.stat(os.path.join(self.archive_dir, target))
+            except FileNotFoundError:
+                return target
+            if same_file(st, other):
+                return None
+            # an album file which was deleted and whose name was reused
+            c += 1
+            target = f"{base}-{c}{ext}"
+
+    def write(self, src, dst):
+        for method in list(self.methods):
+            try:
+                METHODS[method](src, dst)
+            except OSError as e:
+                if os.path.exists(dst):
+                    os.remove(dst)
+                if method == "copy" or e.errno not in UNSUPPORTED:
+                    raise
+                logger.info(f"Cannot {method} into {self.archive_dir}: {e}")
+                self.methods.remove(method)
+                continue
+            if method != "hardlink":
+                shutil.copystat(src, dst)
+            return method
+
+    def place(self, f):
+        """Archive f; returns how, or None if it was archived before."""
+        src = os.path.join(self.root_dir, f)
+        st = os.stat(src)
+        target = self.target(f, st)
+        if target is None:
+            logger.debug(f"Already archived: {f}")
+            return None
+
+        dst = os.path.join(self.archive_dir, target)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        # written next to the destination first so an interrupted copy never
+        # looks archived
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        method = self.write(src, tmp)
+        os.replace(tmp, dst)
+        logger.debug(f"Archived {f} by {method}")
+
+        entry = {"path": f, "size": st.st_size, "mtime": st.st_mtime, "method": method}
+        if target != f:
+            entry["archived_as"] = target
+        self.placed.append(entry)
+        return method
+
+    def write_manifest(self, prefix):
+        """List the files placed as <prefix>-<index>.manifest.json."""
+        if not self.placed:
+            return None
+        manifest = {
+            "prefix": prefix,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "files": self.placed,
+        }
+        tmp = os.path.join(self.archive_dir, f"{prefix}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        index = 0
+        while True:
+            path = os.path.join(self.archive_dir, f"{prefix}-{index}{MANIFEST_EXT}")
+            try:
+                os.link(tmp, path)
+                break
+            except FileExistsError:
+                # a resumed batch adds a manifest for what it placed
+                index += 1
+        os.remove(tmp)
+        logger.info(f"Wrote manifest {path} with {len(self.placed)} files")
+        return path
@@ -0,0 +1,89 @@
+import logging
+import os
+
+from importrr import exifhelper
+
+logger = logging.getLogger(__name__)
+
+# archiving converts a MOV to an MP4 of the same name next to it, so a stem
+# taken by one of them is taken for both
+CONVERTED = {".mov": ".mp4", ".mp4": ".mov"}
+
+
+class MonthIndex:
+    """Names taken in each yyyy/mm dir, listed once instead of probed per file."""
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+        self.taken = {}
+
+    def names(self, month_dir):
+        if month_dir not in self.taken:
+            try:
+                self.taken[month_dir] = set(
+                    os.listdir(os.path.join(self.root_dir, month_dir))
+                )
+            except FileNotFoundError:
+                self.taken[month_dir] = set()
+        return self.taken[month_dir]
+
+    def claim(self, target, ext):
+        # same names as ExifTool's %-c: no suffix for the first file, then -1,
+        # -2, ... for every later file taken in the same second
+        month_dir, base = os.path.split(target)
+        names = self.names(month_dir)
+        exts = [ext, CONVERTED[ext]] if ext in CONVERTED else [ext]
+        stem = base
+        c = 0
+        while any(stem + e in names for e in exts):
+            c += 1
+            stem = f"{base}-{c}"
+        names.update(stem + e for e in exts)
+        return os.path.join(month_dir, stem + ext)
+
+
+def organize(root_dir, import_dir, plans, sidecar=False):
+    """Move every dated file to yyyy/mm/yyyymmdd-hhmmss[-c].ext.
+
+    Yields (old path, new name relative to root_dir) after each move, with a
+    sidecar right after its media file.
+    """
+    logger.info("Organizing files by date and renaming")
+    index = MonthIndex(root_dir)
+    moved = 0
+    for p in plans:
+        if sidecar and p.final_name.endswith(exifhelper.SIDECAR_EXT):
+            # moved together with its media file below
+            continue
+        if p.target is None:
+            logger.warning(f"No capture date, leaving in place: {p.final_name}")
+            continue
+
+        old = os.path.join(import_dir, p.final_name)
+        xmp = old + exifhelper.SIDECAR_EXT
+        if sidecar and p.backfill and not os.path.exists(xmp):
+            # without it the file would be stored with no date at all
+            logger.warning(f"No sidecar was written, leaving in place: {p.final_name}")
+            continue
+
+        new = index.claim(p.target, os.path.splitext(p.final_name)[1])
+        try:
+            os.makedirs(os.path.dirname(os.path.join(root_dir, new)), exist_ok=True)
+            os.rename(old, os.path.join(root_dir, new))
+        except OSError as e:
+            logger.error(f"Failed to move {p.final_name}: {e}")
+            continue
+        moved += 1
+        logger.debug(f"Moved {p.final_name} -> {new}")
+        yield old, new
+
+        if sidecar and os.path.exists(xmp):
+            xmp_to = new + exifhelper.SIDECAR_EXT
+            if os.path.exists(os.path.join(root_dir, xmp_to)):
+                logger.warning(f"Sidecar already exists, leaving in place: {xmp_to}")
+                continue
+            os.rename(xmp, os.path.join(root_dir, xmp_to))
+            logger.debug(f"Moved sidecar with {new}")
+            yield xmp, xmp_to
+
+    logger.info(f"Moved {moved} files into {root_dir}")
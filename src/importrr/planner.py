@@ -0,0 +1,137 @@
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+IMAGE_TYPES = ("gif", "jpg", "png")
+VIDEO_TYPES = ("3gp", "mov", "mp4")
+
+# backfill sources in order of preference, the first one present is used
+SCREENSHOT_SOURCES = ["PNG:CreateDate", "XMP:DateCreated", "FileModifyDate"]
+VIDEO_SOURCES = ["CreationDate", "CreateDate"]
+
+
+class FilePlan:
+    def __init__(self, name, file_type=None):
+        self.name = name
+        self.file_type = file_type
+        # new name when the extension doesn't match the file type
+        self.rename = None
+        # "screenshot" or "video" when DateTimeOriginal has to be backfilled
+        self.backfill = None
+        # tag the backfilled date is copied from
+        self.source = None
+        # capture date as ExifTool reports it, after backfilling
+        self.date = None
+        # yyyy/mm/yyyymmdd-hhmmss, without collision suffix or extension
+        self.target = None
+
+    @property
+    def final_name(self):
+        return self.rename or self.name
+
+
+def get_tag(record, tag):
+    # records are read with -G so keys look like "EXIF:DateTimeOriginal"
+    if ":" in tag:
+        return record.get(tag)
+    for key, value in record.items():
+        if key.rsplit(":", 1)[-1] == tag:
+            return value
+    return None
+
+
+def valid_date(value):
+    if not isinstance(value, str) or len(value) < 19:
+        return None
+    if value.startswith("0000"):
+        return None
+    return value
+
+
+def format_target(date):
+    return f"{date[0:4]}/{date[5:7]}/{date[0:4]}{date[5:7]}{date[8:10]}-{date[11:13]}{date[14:16]}{date[17:19]}"
+
+
+def plan_file(name, record):
+    file_type = get_tag(record, "FileTypeExtension")
+    plan = FilePlan(name, file_type.lower() if file_type else None)
+
+    # same as ExifTool's -filename<%f.$FileTypeExtension, which also
+    # normalises upper case extensions
+    stem, ext = os.path.splitext(name)
+    ext = ext[1:]
+    if (
+        plan.file_type
+        and ext.lower() in IMAGE_TYPES + VIDEO_TYPES
+        and ext != plan.file_type
+    ):
+        plan.rename = f"{stem}.{plan.file_type}"
+
+    kind_ext = os.path.splitext(plan.final_name)[1][1:].lower()
+    date = valid_date(get_tag(record, "DateTimeOriginal"))
+    if date is None:
+        if kind_ext in IMAGE_TYPES:
+            kind, sources = "screenshot", SCREENSHOT_SOURCES
+        elif kind_ext in VIDEO_TYPES:
+            kind, sources = "video", VIDEO_SOURCES
+        else:
+            kind, sources = None, []
+        for source in sources:
+            date = valid_date(get_tag(record, source))
+            if date:
+                plan.backfill = kind
+                plan.source = source
+                break
+
+    plan.date = date
+    if date:
+        plan.target = format_target(date)
+    return plan
+
+
+def plan(import_dir, records):
+    plans = []
+    for record in records:
+        source = record.get("SourceFile")
+        if not source:
+            continue
+        plans.append(plan_file(os.path.relpath(source, import_dir), record))
+
+    renames = sum(1 for p in plans if p.rename)
+    backfills = sum(1 for p in plans if p.backfill)
+    undated = sum(1 for p in plans if p.target is None)
+    logger.info(
+        f"Planned {len(plans)} files: {renames} renames, {backfills} date backfills"
+    )
+    if undated:
+        logger.warning(f"{undated} files have no usable capture date")
+    return plans
+
+
+def apply_renames(import_dir, plans):
+    for p in plans:
+        if not p.rename:
+            continue
+        f_from = os.path.join(import_dir, p.name)
+        f_to = os.path.join(import_dir, p.rename)
+        if os.path.exists(f_to):
+            logger.warning(f"Cannot fix extension, target exists: {p.rename}")
+            p.rename = None
+            continue
+        try:
+            os.rename(f_from, f_to)
+            logger.debug(f"Renamed {p.name} -> {p.rename}")
+        except OSError as e:
+            logger.error(f"Failed to rename {p.name}: {e}")
+            p.rename = None
+
+
+def group_backfills(import_dir, plans):
+    """Group files by the single write they need, keyed by (kind, source)."""
+    groups = {}
+    for p in plans:
+        if p.backfill:
+            files = groups.setdefault((p.backfill, p.source), [])
+            files.append(os.path.join(import_dir, p.final_name))
+    return groups
@@ -0,0 +1,216 @@
+import json
+import logging
+import os
+import resource
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# reports kept in the report dir, the oldest are removed first
+REPORT_HISTORY = 100
+REPORT_EXT = ".json"
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+
+# the report of the import running in this process, if any
+_active = None
+
+# spans open in the current thread, innermost last
+_open = threading.local()
+
+
+def children_cpu():
+    # user and system time of every child process which has been waited for
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def max_rss():
+    # peak resident set of this process and of its largest waited-for child,
+    # in bytes; ru_maxrss is in kilobytes on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own * 1024, child * 1024
+
+
+def process_cpu(pid):
+    """CPU seconds a running process has used so far, or 0 if unknown."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # the command name may contain spaces, the fields after it don't
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+class Report:
+    """Timings of one import run, one span per stage a batch went through.
+
+    Each span has its wall time, the CPU time of this process and the CPU
+    time of the subprocesses it ran, and the peak memory reached by its end.
+    Subprocess time comes from the rusage of finished children, so spans
+    which overlap in time (parallel transcodes) may each include some of the
+    other's.
+    """
+
+    def __init__(self, name, **info):
+        self.name = name
+        self.info = info
+        self.tools = {}
+        self.spans = []
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+        self._cpu = time.process_time()
+        self._child_cpu = children_cpu()
+
+    @contextmanager
+    def span(self, stage, session=None, **fields):
+        """Time a stage; the yielded dict takes counts only known at the end.
+
+        ``session`` is an ExifToolSession whose -stay_open process counts as
+        a subprocess of the span, as it is only reaped when the run ends.
+        """
+        counts = dict(fields)
+        start = time.monotonic()
+        cpu = time.process_time()
+        child_cpu = children_cpu()
+        session_cpu = session.cpu_time() if session is not None else 0.0
+        stack = _open.__dict__.setdefault("spans", [])
+        stack.append(counts)
+        try:
+            yield counts
+        except BaseException:
+            counts["failed"] = True
+            raise
+        finally:
+            stack.pop()
+            child = children_cpu() - child_cpu
+            rss, child_rss = max_rss()
+            if session is not None:
+                child += max(0.0, session.cpu_time() - session_cpu)
+            entry = {
+                "stage": stage,
+                "start": round(start - self._start, 3),
+                "wall": round(time.monotonic() - start, 3),
+                "cpu": round(time.process_time() - cpu, 3),
+                "child_cpu": round(child, 3),
+                "max_rss": rss,
+                "child_max_rss": child_rss,
+                **counts,
+            }
+            with self._lock:
+                self.spans.append(entry)
+
+    def stages(self):
+        """Totals per stage, in the order the stages first ran."""
+        totals = {}
+        with self._lock:
+            spans = list(self.spans)
+        for s in spans:
+            total = totals.setdefault(
+                s["stage"],
+                {"count": 0, "wall": 0.0, "cpu": 0.0, "child_cpu": 0.0},
+            )
+            total["count"] += 1
+            for key in ("wall", "cpu", "child_cpu", "files", "bytes"):
+                if isinstance(s.get(key), (int, float)):
+                    total[key] = round(total.get(key, 0) + s[key], 3)
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "name": self.name,
+            "started": self.started,
+            **self.info,
+            "finished": round(time.time(), 3),
+            "wall": round(time.monotonic() - self._start, 3),
+            "cpu": round(time.process_time() - self._cpu, 3),
+            "child_cpu": round(children_cpu() - self._child_cpu, 3),
+            "tools": self.tools,
+            "stages": self.stages(),
+            "spans": spans,
+        }
+
+    def save(self, report_dir, history=REPORT_HISTORY):
+        os.makedirs(report_dir, exist_ok=True)
+        path = os.path.join(report_dir, self.name + REPORT_EXT)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+        logger.info(f"Wrote run report {path}")
+        prune(report_dir, history)
+        return path
+
+
+def prune(report_dir, history=REPORT_HISTORY):
+    # names start with the run's timestamp, so they sort oldest first
+    reports = sorted(n for n in os.listdir(report_dir) if n.endswith(REPORT_EXT))
+    for name in reports[: max(0, len(reports) - history)]:
+        try:
+            os.remove(os.path.join(report_dir, name))
+        except FileNotFoundError:
+            # another worker pruned it first
+            pass
+
+
+def load_one(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Skipping unreadable report {path}: {e}")
+        return None
+
+
+def load(report_dir):
+    """Every report in report_dir, oldest first."""
+    result = []
+    for name in sorted(os.listdir(report_dir)):
+        if name.endswith(REPORT_EXT):
+            run = load_one(os.path.join(report_dir, name))
+            if run is not None:
+                result.append(run)
+    return result
+
+
+def start(name, **info):
+    global _active
+    _active = Report(name, **info)
+    return _active
+
+
+def stop():
+    global _active
+    _active = None
+
+
+@contextmanager
+def span(stage, session=None, **fields):
+    """Time a stage of the active report; a no-op when there is none."""
+    if _active is None:
+        yield dict(fields)
+        return
+    with _active.span(stage, session, **fields) as counts:
+        yield counts
+
+
+def note(**fields):
+    """Add counts to the innermost span open in this thread, if any."""
+    stack = getattr(_open, "spans", None)
+    if stack:
+        stack[-1].update(fields)
+
+
+def count(name, n=1):
+    """Add n to a count of the innermost span open in this thread, if any."""
+    stack = getattr(_open, "spans", None)
+    if stack:
+        stack[-1][name] = stack[-1].get(name, 0) + n
@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# sizes and mtimes of the files that were not ready at the last scan
+STATE_FILE = ".importrr-scan.json"
+
+# timestamped work dirs left behind by earlier runs hold failed files
+WORK_DIR = re.compile(r"^\d{14}(-\d+)?$")
+
+
+def settled(stat, time_cutoff):
+    return max(stat.st_ctime, stat.st_mtime, stat.st_atime) <= time_cutoff
+
+
+def walk(import_dir, recursive=False):
+    """Yield (relative path, stat) for every file in import_dir.
+
+    DirEntry caches its stat, so each file costs a single syscall.
+    """
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(import_dir, rel_dir)) as it:
+            for entry in it:
+                rel = os.path.join(rel_dir, entry.name)
+                try:
+                    if entry.is_file():
+                        if rel != STATE_FILE:
+                            yield rel, entry.stat()
+                    elif entry.is_dir():
+                        if WORK_DIR.match(entry.name) or entry.name.startswith("."):
+                            logger.debug(f"Skipping directory: {rel}")
+                        elif recursive:
+                            stack.append(rel)
+                        else:
+                            logger.debug(f"Skipping directory: {rel}")
+                    else:
+                        logger.warning(f"Cannot resolve file type for: {rel}")
+                except OSError as e:
+                    logger.warning(f"Cannot access {rel}: {e}")
+
+
+def load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable scan state {path}: {e}")
+        return {}
+
+
+def save_state(path, state):
+    try:
+        if not state:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Cannot save scan state {path}: {e}")
+
+
+def scan(import_dir, time_cutoff, recursive=False):
+    """Return {relative path: size} of the files ready to import, sorted.
+
+    A file is ready once it is older than time_cutoff, or as soon as its size
+    and mtime are unchanged since the previous scan.
+    """
+    state_path = os.path.join(import_dir, STATE_FILE)
+    previous = load_state(state_path)
+    pending = {}
+    result = {}
+
+    for rel, stat in walk(import_dir, recursive):
+        signature = [stat.st_size, stat.st_mtime_ns]
+        # an empty file is usually one a copy has only just created
+        if settled(stat, time_cutoff) or (
+            stat.st_size and previous.get(rel) == signature
+        ):
+            result[rel] = stat.st_size
+            logger.debug(f"Added file for processing: {rel}")
+        else:
+            pending[rel] = signature
+            logger.debug(f"Skipping file which is still changing: {rel}")
+
+    save_state(state_path, pending)
+    if pending:
+        logger.info(f"{len(pending)} files in {import_dir} are still changing")
+    return dict(sorted(result.items()))
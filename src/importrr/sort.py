@@ -1,15 +1,52 @@
+import contextlib
+import functools
 import logging
 import os
+import sqlite3
+import tarfile
+import threading
 import time
 from datetime import datetime
 
-from importrr import archive, exifhelper
+from exiftool.exceptions import ExifToolException
+
+from importrr import (
+    archive,
+    dedupe,
+    exifhelper,
+    journal,
+    lock,
+    organizer,
+    planner,
+    report,
+    scanner,
+    transcode,
+)
 
 logger = logging.getLogger(__name__)
 
 # in minutes
 TIME_CUTOFF = 2
 
+# most files and bytes handed to ExifTool in one work dir
+BATCH_FILES = 2000
+BATCH_SIZE = 10000000000
+
+# what a failed batch can raise; the next batch goes ahead regardless
+BATCH_ERRORS = (
+    OSError,
+    ValueError,
+    RuntimeError,
+    sqlite3.Error,
+    tarfile.TarError,
+    ExifToolException,
+    *transcode.FFMPEG_ERRORS,
+)
+
+# set on shutdown: the current batch finishes what it started and keeps its
+# journal, so the next run resumes it
+stopping = threading.Event()
+
 
 def cleanup(work_dir):
     try:
@@ -20,74 +57,123 @@ def cleanup(work_dir):
         logger.error(f"Failed to remove directory {work_dir}: {e}")
 
 
-def sort_media(root_dir, import_dir):
-    exifhelper.adjust_extensions(import_dir, root_dir)
-    exifhelper.adjust_screenshots(import_dir, root_dir)
-    exifhelper.backfill_videos(import_dir, root_dir)
-    splits = exifhelper.organize(import_dir, root_dir)
-
-    result = []
-    for split in splits:
-        if not split or not split.strip():  # Skip empty lines
+def sort_media(
+    root_dir,
+    import_dir,
+    session=None,
+    sidecar=False,
+    index=None,
+    on_organized=None,
+    fast_metadata=False,
+    batch_journal=None,
+    album_lock=None,
+):
+    # workers importing into the same album take turns only while they read
+    # or write it, metadata and backfills of their work dirs run side by side
+    hold = album_lock or contextlib.nullcontext
+    digests, pending = {}, []
+    if index is not None:
+        with hold():
+            index.refresh()
+            digests, pending = dedupe.filter_duplicates(index, root_dir, import_dir)
+
+    records = exifhelper.read_metadata(import_dir, root_dir, session, fast_metadata)
+    plans = planner.plan(import_dir, records)
+    planner.apply_renames(import_dir, plans)
+    renamed = [p.rename for p in plans if p.rename]
+    if batch_journal is not None and renamed:
+        batch_journal.record("renamed", files=renamed)
+
+    # only the files which are missing a date are sent back to ExifTool, and
+    # each of them is rewritten exactly once
+    backfilled = (
+        batch_journal.files("backfilled") if batch_journal is not None else set()
+    )
+    for (kind, source), files in planner.group_backfills(import_dir, plans).items():
+        # sidecars written before a restart still look like missing dates
+        files = [f for f in files if os.path.relpath(f, import_dir) not in backfilled]
+        if not files:
             continue
-
-        index = split.find(" --> ")
-        if index != -1:  # More pythonic comparison
-            try:
-                s = split[index + 6 : -1]
-                if s and s.strip():  # Only add non-empty results
-                    result.append(s.strip())
-            except IndexError:
-                logger.warning(f"Failed to parse ExifTool output line: {split}")
-                continue
-
+        with report.span(
+            f"exiftool.backfill.{kind}", session, files=len(files), source=source
+        ):
+            if kind == "screenshot":
+                exifhelper.adjust_screenshots(files, root_dir, source, session, sidecar)
+            else:
+                exifhelper.backfill_video_tag(files, root_dir, source, session, sidecar)
+        if batch_journal is not None:
+            batch_journal.record(
+                "backfilled", files=[os.path.relpath(f, import_dir) for f in files]
+            )
+
+    # each file is handed on as soon as it is moved
+    renames = []
+
+    def organized(old, new):
+        renames.append((old, new))
+        if batch_journal is not None:
+            batch_journal.record(
+                "organized", file=os.path.relpath(old, import_dir), to=new
+            )
+        if on_organized is not None:
+            on_organized(new)
+
+    with hold():
+        with report.span("organize") as span:
+            for old, new in organizer.organize(root_dir, import_dir, plans, sidecar):
+                organized(old, new)
+            span["files"] = len(renames)
+
+        if index is not None:
+            dedupe.record_organized(
+                index, root_dir, import_dir, plans, renames, digests, pending
+            )
+
+    result = [new for _, new in renames]
     logger.info(f"Organized {len(result)} files to {root_dir}")
     return result
 
 
-def get_media_files(import_dir, time_cutoff):
+def get_media_files(import_dir, time_cutoff, recursive=False):
+    # file name -> size, so batches can be cut without another stat
     if not os.path.exists(import_dir):
         logger.warning(f"Import directory does not exist: {import_dir}")
-        return []
+        return {}
 
     if not os.path.isdir(import_dir):
         logger.error(f"Import path is not a directory: {import_dir}")
-        return []
+        return {}
 
     try:
-        entries = os.listdir(import_dir)
+        result = scanner.scan(import_dir, time_cutoff, recursive)
     except PermissionError as e:
         logger.error(f"Permission denied accessing directory {import_dir}: {e}")
-        return []
+        return {}
     except OSError as e:
         logger.error(f"Error accessing directory {import_dir}: {e}")
-        return []
-
-    result = []
-    logger.debug(f"Scanning {len(entries)} entries in {import_dir}")
-
-    for d in entries:
-        f = os.path.join(import_dir, d)
-        try:
-            if os.path.isfile(f):
-                last_time = last_accessed(f)
-                if last_time <= time_cutoff:
-                    result.append(d)
-                    logger.debug(f"Added file for processing: {d}")
-                else:
-                    logger.debug(f"Skipping recently accessed file: {d}")
-            elif os.path.isdir(f):
-                logger.debug(f"Skipping directory: {d}")
-            else:
-                logger.warning(f"Cannot resolve file type for: {d}")
-        except (OSError, PermissionError) as e:
-            logger.warning(f"Cannot access {d}: {e}")
-            continue
+        return {}
 
     logger.info(f"Found {len(result)} files ready for processing in {import_dir}")
     return result
 
 
+def split_batches(files, max_files=BATCH_FILES, max_size=BATCH_SIZE):
+    # files maps name -> size; a file bigger than max_size gets its own batch
+    batches = []
+    batch = []
+    size = 0
+    for f, file_size in files.items():
+        if batch and (len(batch) >= max_files or size + file_size > max_size):
+            batches.append(batch)
+            batch = []
+            size = 0
+        batch.append(f)
+        size += file_size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
 def make_work_dir(cur_dir, work_dir, file_list):
     if not file_list:
         logger.debug("No files to move, skipping work directory creation")
@@ -117,6 +203,9 @@ def make_work_dir(cur_dir, work_dir, file_list):
                 logger.warning(f"Target file already exists, skipping: {f}")
                 continue
 
+            # files from nested folders keep their relative path
+            if os.path.dirname(f):
+                os.makedirs(os.path.dirname(f_to), exist_ok=True)
             os.rename(f_from, f_to)
             logger.debug(f"Moved file: {f}")
 
@@ -126,23 +215,73 @@ def make_work_dir(cur_dir, work_dir, file_list):
         raise
 
 
-def last_accessed(file):
-    created = os.stat(file).st_ctime
-    modified = os.stat(file).st_mtime
-    accessed = os.stat(file).st_atime
-    return max(created, modified, accessed)
+def remaining_files(work_dir):
+    # nested folders which were emptied by organizing are removed on the way
+    result = []
+    for dirpath, dirnames, filenames in os.walk(work_dir, topdown=False):
+        result.extend(
+            os.path.relpath(os.path.join(dirpath, f), work_dir) for f in filenames
+        )
+        if dirpath != work_dir and not filenames and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    return sorted(result)
 
 
 class Sort:
-    def __init__(self, root_dir, archive_dir=None):
+    def __init__(
+        self,
+        root_dir,
+        archive_dir=None,
+        session=None,
+        sidecar=False,
+        transcode_jobs=1,
+        transcode_threads=None,
+        transcode_cache=None,
+        duplicates="keep",
+        recursive=False,
+        batch_files=BATCH_FILES,
+        batch_size=BATCH_SIZE,
+        fast_metadata=True,
+        archive_mode="tar",
+        archive_layout="flat",
+        archive_policy="full",
+        report_dir=None,
+        report_history=report.REPORT_HISTORY,
+    ):
         if not os.path.isdir(root_dir):
             raise IOError("Directory doesn't exist " + root_dir)
         if archive_dir is not None and not os.path.isdir(archive_dir):
             raise IOError("Directory doesn't exist " + archive_dir)
         self.root_dir = root_dir
         self.archive_dir = archive_dir
+        self.session = session
+        self.sidecar = sidecar
+        self.transcode_jobs = transcode_jobs
+        self.transcode_threads = transcode_threads
+        self.transcode_cache = transcode_cache
+        self.duplicates = duplicates
+        self.recursive = recursive
+        self.batch_files = batch_files
+        self.batch_size = batch_size
+        self.fast_metadata = fast_metadata
+        self.archive_mode = archive_mode
+        self.archive_layout = archive_layout
+        self.archive_policy = archive_policy
+        self.report_dir = report_dir
+        self.report_history = report_history
 
     def launch(self, import_dir):
+        if self.session is not None:
+            return self._launch(import_dir, self.session)
+
+        # one ExifTool process for the whole run instead of one per command
+        with exifhelper.ExifToolSession(self.root_dir) as session:
+            # here and not lazily, where it may be a transcode thread which
+            # starts the process and takes it along when its pool shuts down
+            session.start()
+            return self._launch(import_dir, session)
+
+    def _launch(self, import_dir, session):
         logger.info(f"Starting processing for import directory: {import_dir}")
         start = time.time()
         time_cutoff = start - 60 * TIME_CUTOFF
@@ -156,29 +295,162 @@ class Sort:
             return
 
         import_dir = abs_import_dir
-        result = get_media_files(import_dir, time_cutoff)
-
-        if result:
-            logger.info(f"Processing {len(result)} files")
-            work_dir = os.path.join(import_dir, prefix)
-            make_work_dir(import_dir, work_dir, result)
-            sorted_media = sort_media(self.root_dir, work_dir)  # Use work_dir directly
-
-            remaining_files = os.listdir(work_dir) if os.path.exists(work_dir) else []
-            if remaining_files:
-                logger.warning(
-                    f"Unable to process {len(remaining_files)} files - they remain in {work_dir}"
+        run_report = None
+        if self.report_dir is not None:
+            section = os.path.basename(os.path.normpath(self.root_dir))
+            run_report = report.start(
+                f"{datetime.fromtimestamp(start):%Y%m%d%H%M%S}-{section}-"
+                f"{os.path.basename(import_dir)}",
+                section=section,
+                album=self.root_dir,
+                import_dir=import_dir,
+            )
+        invocations = session.invocations
+        failed = None
+        try:
+            failed = self._import(import_dir, session, start, time_cutoff, prefix)
+        finally:
+            if run_report is not None:
+                # None when the run itself was aborted
+                run_report.info["failed_batches"] = failed
+                run_report.info["exiftool_invocations"] = (
+                    session.invocations - invocations
                 )
-                logger.debug(f"Remaining files: {remaining_files}")
-            else:
-                logger.info("Successfully processed all files")
-                cleanup(work_dir)
+                self._save_report(run_report, session)
+
+    def _import(self, import_dir, session, start, time_cutoff, prefix):
+        failed = 0
+        # batches a stopped or crashed run left behind go first
+        for name in journal.unfinished(import_dir):
+            if stopping.is_set():
+                return failed
+            logger.info(f"Resuming unfinished batch {name}")
+            try:
+                self._process_batch(import_dir, name, [], session)
+            except BATCH_ERRORS as e:
+                logger.error(f"Resuming batch {name} failed: {e}")
+                failed += 1
+
+        with report.span("scan") as span:
+            result = get_media_files(import_dir, time_cutoff, self.recursive)
+            span["files"] = len(result)
+            span["bytes"] = sum(result.values())
 
-            if self.archive_dir is not None:
-                logger.info(f"Creating archive with {len(sorted_media)} files")
-                archive.copy(self.root_dir, sorted_media, self.archive_dir, prefix)
+        if result:
+            batches = split_batches(result, self.batch_files, self.batch_size)
+            logger.info(f"Processing {len(result)} files in {len(batches)} batches")
+            for n, batch in enumerate(batches):
+                if stopping.is_set():
+                    logger.info("Stopping, the remaining files wait for the next run")
+                    break
+                # the first batch keeps the plain prefix, so a run which fits
+                # in one batch names its work dir and tars as before
+                name = prefix if n == 0 else f"{prefix}-{n}"
+                try:
+                    self._process_batch(import_dir, name, batch, session)
+                except BATCH_ERRORS as e:
+                    logger.error(f"Batch {name} failed, continuing with the next: {e}")
+                    failed += 1
         else:
             logger.info("No files found for processing")
 
         elapsed = time.time() - start
         logger.info(f"Completed processing {len(result)} files in {elapsed:.2f}s")
+        logger.info(
+            f"ExifTool rewrote {session.bytes_rewritten} bytes in {session.files_rewritten} files"
+        )
+        return failed
+
+    def _save_report(self, run_report, session):
+        # tool versions show which upgrade a slower stage came with
+        run_report.tools["exiftool"] = session.version
+        if "transcode" in run_report.stages():
+            run_report.tools["ffmpeg"] = transcode.version()
+        try:
+            run_report.save(self.report_dir, self.report_history)
+        except OSError as e:
+            logger.warning(f"Cannot write run report to {self.report_dir}: {e}")
+        finally:
+            report.stop()
+
+    def _process_batch(self, import_dir, name, files, session):
+        logger.info(f"Processing batch {name} with {len(files)} files")
+        work_dir = os.path.join(import_dir, name)
+        # written before any file moves, so a crash at any point can be resumed
+        batch_journal = journal.Journal(import_dir, name)
+        if files:
+            batch_journal.record("started", files=files)
+        with report.span("move", files=len(files)):
+            make_work_dir(import_dir, work_dir, files)
+
+        for part in batch_journal.stale_parts():
+            if os.path.exists(part):
+                logger.info(f"Removing incomplete archive {part}")
+                os.remove(part)
+
+        archiver = None
+        if self.archive_dir is not None:
+            # tars and transcodes are built while ExifTool is still organizing
+            archiver = archive.Archiver(
+                self.root_dir,
+                self.archive_dir,
+                name,
+                session=session,
+                jobs=self.transcode_jobs,
+                threads=self.transcode_threads,
+                cache=self.transcode_cache,
+                journal=batch_journal,
+                stop=stopping,
+                mode=self.archive_mode,
+                layout=self.archive_layout,
+                policy=self.archive_policy,
+            )
+            archiver.start()
+            for f in batch_journal.unarchived():
+                archiver.put(f)
+
+        try:
+            if os.path.isdir(work_dir):
+                self._sort_media(
+                    work_dir, session, archiver and archiver.put, batch_journal
+                )
+        finally:
+            # whatever was organized before a failure is archived all the same
+            try:
+                if archiver is not None:
+                    archiver.finish()
+            finally:
+                batch_journal.close()
+
+        if not stopping.is_set():
+            batch_journal.remove()
+
+        if not os.path.exists(work_dir):
+            # a resumed batch whose files were all organized before the stop
+            return
+        remaining = remaining_files(work_dir)
+        if remaining:
+            logger.warning(
+                f"Unable to process {len(remaining)} files - they remain in {work_dir}"
+            )
+            logger.debug(f"Remaining files: {remaining}")
+        else:
+            logger.info("Successfully processed all files")
+            cleanup(work_dir)
+
+    def _sort_media(self, work_dir, session, on_organized=None, batch_journal=None):
+        kwargs = {
+            "sidecar": self.sidecar,
+            "on_organized": on_organized,
+            "fast_metadata": self.fast_metadata,
+            "batch_journal": batch_journal,
+            "album_lock": functools.partial(lock.album_lock, self.root_dir),
+        }
+        if self.duplicates == "keep":
+            return sort_media(self.root_dir, work_dir, session, **kwargs)
+
+        index = dedupe.DuplicateIndex(self.root_dir, self.duplicates)
+        try:
+            return sort_media(self.root_dir, work_dir, session, index=index, **kwargs)
+        finally:
+            index.close()
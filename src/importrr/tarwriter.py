@@ -0,0 +1,145 @@
+import copy
+import errno
+import hashlib
+import io
+import mmap
+import os
+import tarfile
+
+from importrr.hashing import CHUNK_SIZE
+
+# copy_file_range can't copy between these two files, sendfile can
+NO_COPY_RANGE = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.EBADF}
+
+# plain files, whose descriptor is the archive itself and not a compressor's
+PLAIN = (io.FileIO, io.BufferedWriter, io.BufferedRandom)
+
+
+def kernel_copy(src_fd, dst_fd, size):
+    """Copy size bytes from and to the current offsets of two descriptors.
+
+    The data never enters this process: copy_file_range first, which also
+    clones or copies server-side where the filesystem can, then sendfile.
+    """
+    use_range = hasattr(os, "copy_file_range")
+    left = size
+    while left > 0:
+        if use_range:
+            try:
+                n = os.copy_file_range(src_fd, dst_fd, left)
+            except OSError as e:
+                if e.errno not in NO_COPY_RANGE:
+                    raise
+                # the offsets only moved by what was copied, so sendfile
+                # carries on from there
+                use_range = False
+                continue
+        else:
+            n = os.sendfile(dst_fd, src_fd, None, left)
+        if n == 0:
+            raise OSError("unexpected end of data")
+        left -= n
+
+
+def copy_hashed(src_fd, dst_fd, size, digest):
+    """kernel_copy, hashing each chunk just before the kernel copies it.
+
+    The chunk is hashed through a mapping of the source, which reads it into
+    the page cache, and the copy takes it from there, so the file is read
+    from disk only once.
+    """
+    if size == 0:
+        return
+    start = os.lseek(src_fd, 0, os.SEEK_CUR)
+    with mmap.mmap(src_fd, 0, access=mmap.ACCESS_READ) as mm:
+        if len(mm) < start + size:
+            raise OSError("unexpected end of data")
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+        with memoryview(mm) as view:
+            for pos in range(start, start + size, CHUNK_SIZE):
+                n = min(CHUNK_SIZE, start + size - pos)
+                digest.update(view[pos : pos + n])
+                kernel_copy(src_fd, dst_fd, n)
+
+
+class HashingReader:
+    # for the members tarfile copies itself
+    def __init__(self, fileobj, digest):
+        self.fileobj = fileobj
+        self.digest = digest
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.digest.update(data)
+        return data
+
+
+def source_fd(fileobj):
+    # only a real file whose buffer holds nothing that was read ahead
+    try:
+        fd = fileobj.fileno()
+        return fd if os.lseek(fd, 0, os.SEEK_CUR) == fileobj.tell() else None
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+
+class TarWriter(tarfile.TarFile):
+    """A TarFile which moves member data with kernel-side copies.
+
+    tarfile copies every member through 16 KiB reads and writes. Here the
+    header is still built by TarInfo.tobuf and written the same way, and only
+    the payload is copied by the kernel, so the archive is byte for byte what
+    tarfile writes. Compressed archives and file objects without a
+    descriptor are left to tarfile.
+
+    The SHA-256 of every regular member is taken in the same pass and kept
+    in ``digests``, keyed by member offset, as a name can be in a tar more
+    than once. Members also get the ``offset`` and ``offset_data`` tarfile
+    sets when reading, so they can be indexed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.digests = {}
+
+    def addfile(self, tarinfo, fileobj=None):
+        start = self.offset
+        digest = self._addfile(tarinfo, fileobj)
+        if digest is not None:
+            self.digests[start] = digest
+        # the header, with any pax header, begins where the last member ended
+        # and the data fills the blocks at the end
+        member = self.members[-1]
+        member.offset = start
+        member.offset_data = self.offset
+        if fileobj is not None:
+            member.offset_data -= (
+                -(-member.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            )
+
+    def _addfile(self, tarinfo, fileobj):
+        if fileobj is None:
+            super().addfile(tarinfo, fileobj)
+            return None
+        digest = hashlib.sha256()
+        src_fd = source_fd(fileobj)
+        if src_fd is None or not isinstance(self.fileobj, PLAIN):
+            super().addfile(tarinfo, HashingReader(fileobj, digest))
+            return digest.hexdigest()
+
+        self._check("awx")
+        tarinfo = copy.copy(tarinfo)
+        buf = tarinfo.tobuf(self.format, self.encoding, self.errors)
+        self.fileobj.write(buf)
+        self.offset += len(buf)
+        # the header has to be in the file before the data goes in after it
+        self.fileobj.flush()
+
+        copy_hashed(src_fd, self.fileobj.fileno(), tarinfo.size, digest)
+        blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
+        if remainder > 0:
+            self.fileobj.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+            blocks += 1
+        self.offset += blocks * tarfile.BLOCKSIZE
+        self.members.append(tarinfo)
+        return digest.hexdigest()
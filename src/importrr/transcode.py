@@ -1,16 +1,23 @@
+import json
 import logging
 import os.path
+import subprocess
 
 import ffmpy
 
-from importrr import exifhelper
+from importrr import exifhelper, report
 
 FFMPEG_PARAMS = "-c:v libx264 -preset slower -crf 20 -c:a aac -b:a 160k -vf format=yuv420p -movflags +faststart"
+# used when the streams already match what FFMPEG_PARAMS would produce
+REMUX_PARAMS = "-c copy -movflags +faststart"
+FFPROBE_PARAMS = "-v error -show_streams -of json"
+# what running ffmpeg or ffprobe can fail with
+FFMPEG_ERRORS = (OSError, ffmpy.FFRuntimeError, ffmpy.FFExecutableNotFoundError)
 
 logger = logging.getLogger(__name__)
 
 
-def convert(root_dir, source_file):
+def convert(root_dir, source_file, session=None, threads=None, cache=None):
     logger.info(f"Converting MOV to MP4: {source_file}")
     result = source_file[:-3] + "mp4"
     output_file = os.path.join(root_dir, result)
@@ -21,7 +28,20 @@ def convert(root_dir, source_file):
         return None  # Return None to skip file if conversion fails
 
     try:
-        transcode(input_file, output_file)
+        key = None
+        if cache is not None:
+            # whether a file is remuxed only depends on its content, so both
+            # parameter sets are part of the key
+            key = cache.key(input_file, FFMPEG_PARAMS + REMUX_PARAMS)
+            if cache.fetch(key, output_file):
+                return result
+
+        remux = can_remux(input_file)
+        if remux:
+            logger.info(f"Remuxing {source_file}: streams are already H.264/AAC")
+        else:
+            logger.info(f"Re-encoding {source_file}")
+        transcode(input_file, output_file, threads, remux)
         if not os.path.exists(output_file):
             logger.error(f"Output file was not created: {output_file}")
             return None
@@ -33,19 +53,68 @@ def convert(root_dir, source_file):
             f"Conversion successful: {source_file} ({input_size} bytes) -> {result} ({output_size} bytes)"
         )
 
-        exifhelper.copy_tags(root_dir, input_file, output_file)
+        exifhelper.copy_tags(root_dir, input_file, output_file, session)
+        if key is not None:
+            cache.store(key, output_file)
         return result
     except Exception as e:
         logger.error(f"Failed to convert {source_file}: {e}")
         return None  # Return None to skip file if conversion fails
 
 
-def transcode(input_file, output_file):
+def version():
+    # first line of ffmpeg -version, recorded in run reports
+    try:
+        ff = ffmpy.FFmpeg(global_options="-version")
+        stdout, _ = ff.run(stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return stdout.decode(errors="replace").split("\n", 1)[0]
+    except FFMPEG_ERRORS as e:
+        logger.debug(f"Cannot read the FFmpeg version: {e}")
+        return None
+
+
+def probe_streams(input_file):
+    ff = ffmpy.FFprobe(global_options=FFPROBE_PARAMS, inputs={input_file: None})
+    logger.debug(f"FFprobe command: {ff.cmd}")
+    stdout, _ = ff.run(stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return json.loads(stdout).get("streams", [])
+
+
+def can_remux(input_file):
+    try:
+        streams = probe_streams(input_file)
+    except (*FFMPEG_ERRORS, ValueError) as e:
+        logger.warning(f"Cannot inspect streams of {input_file}, re-encoding: {e}")
+        return False
+
+    video = [s for s in streams if s.get("codec_type") == "video"]
+    audio = [s for s in streams if s.get("codec_type") == "audio"]
+    # the run report compares it with the conversion time
+    report.note(duration=media_duration(video))
+    if len(video) != 1:
+        return False
+    if video[0].get("codec_name") != "h264" or video[0].get("pix_fmt") != "yuv420p":
+        return False
+    return all(a.get("codec_name") == "aac" for a in audio)
+
+
+def media_duration(streams):
+    for stream in streams:
+        try:
+            return float(stream["duration"])
+        except (KeyError, ValueError):
+            continue
+    return None
+
+
+def transcode(input_file, output_file, threads=None, remux=False):
     logger.debug(f"Starting FFmpeg transcoding: {input_file} -> {output_file}")
+    params = REMUX_PARAMS if remux else FFMPEG_PARAMS
+    if threads and not remux:
+        # keep concurrent jobs from each grabbing every core
+        params += f" -threads {threads}"
     try:
-        ff = ffmpy.FFmpeg(
-            inputs={input_file: "-y"}, outputs={output_file: FFMPEG_PARAMS}
-        )
+        ff = ffmpy.FFmpeg(inputs={input_file: "-y"}, outputs={output_file: params})
         logger.debug(f"FFmpeg command: {ff.cmd}")
         ff.run()
         logger.debug("FFmpeg transcoding completed successfully")
@@ -0,0 +1,166 @@
+import ctypes
+import logging
+import os
+import select
+import struct
+import time
+
+from importrr.scanner import STATE_FILE, load_state
+from importrr.sort import TIME_CUTOFF
+
+logger = logging.getLogger(__name__)
+
+# from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# every event that means a file in the import dir is still being written
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+# struct inotify_event without the trailing name
+EVENT = struct.Struct("iIII")
+BUFFER_SIZE = 64 * 1024
+
+# in seconds; one more than Sort's cutoff so the file times are behind it
+QUIET_TIME = 60 * TIME_CUTOFF + 1
+
+
+class Inotify:
+    """Minimal ctypes binding for the Linux inotify API."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+
+    def fileno(self):
+        return self.fd
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, f"Cannot watch {path}: {os.strerror(err)}")
+        return wd
+
+    def read(self):
+        try:
+            data = os.read(self.fd, BUFFER_SIZE)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class Watcher:
+    """Calls on_ready(key) once files in a watched dir have been quiet.
+
+    ``dirs`` maps each import dir to the key passed to on_ready, usually the
+    album of its section. Every file is debounced on its own, so a slow copy
+    into one import dir never holds back another. Files an import left for
+    still changing are debounced again from its scan state.
+    """
+
+    def __init__(self, dirs, on_ready, quiet=QUIET_TIME):
+        self.on_ready = on_ready
+        self.quiet = quiet
+        self.inotify = Inotify()
+        self.watches = {}
+        self.paths = {}
+        self.pending = {}
+        for path, key in dirs.items():
+            if not os.path.isdir(path):
+                logger.warning(f"Import directory does not exist, not watching: {path}")
+                continue
+            wd = self.inotify.add_watch(path)
+            self.watches[wd] = key
+            self.paths[wd] = path
+            logger.info(f"Watching {path}")
+
+    def close(self):
+        self.inotify.close()
+
+    def run(self, stop=None):
+        while stop is None or not stop.is_set():
+            self.poll()
+
+    def poll(self, max_wait=1.0):
+        timeout = max_wait
+        if self.pending:
+            next_due = min(self.pending.values()) + self.quiet
+            timeout = min(max_wait, max(0.0, next_due - time.monotonic()))
+
+        readable, _, _ = select.select([self.inotify], [], [], timeout)
+        if readable:
+            self.record(self.inotify.read())
+
+        ready = self.ready(time.monotonic())
+        for key in ready:
+            logger.info(f"Files settled, importing {key}")
+            try:
+                self.on_ready(key)
+            except (OSError, ValueError, RuntimeError) as e:
+                logger.error(f"Import triggered by watcher failed for {key}: {e}")
+            self.rearm(key)
+        return ready
+
+    def rearm(self, key):
+        # the scan skipped files which were still changing; no event may
+        # come for them again, so they wait for another quiet time
+        now = time.monotonic()
+        for wd, path in self.paths.items():
+            if self.watches.get(wd) != key:
+                continue
+            for name in load_state(os.path.join(path, STATE_FILE)):
+                logger.debug(f"Still changing after the import: {name}")
+                self.pending[(key, name)] = now
+
+    def record(self, events):
+        now = time.monotonic()
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped, so every watched dir gets a full sweep
+                logger.warning("Inotify queue overflowed, rescanning all dirs")
+                for key in self.watches.values():
+                    self.pending[(key, None)] = now
+                continue
+            if mask & IN_IGNORED:
+                key = self.watches.pop(wd, None)
+                logger.warning(f"Watch removed for {key}, the dir is gone")
+                continue
+            if mask & IN_ISDIR or wd not in self.watches:
+                # includes the work dirs Sort creates inside the import dir
+                continue
+            if name.startswith(STATE_FILE):
+                # written by the scan itself
+                continue
+            self.pending[(self.watches[wd], name)] = now
+
+    def ready(self, now):
+        due = [k for k, last in self.pending.items() if now - last >= self.quiet]
+        for k in due:
+            del self.pending[k]
+        return sorted({key for key, _ in due})
@@ -1,13 +1,21 @@
 import logging
+import multiprocessing
+import os
 import signal
 import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
 
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.triggers.cron import CronTrigger
 
+from importrr import metrics, sort
+from importrr.cache import TranscodeCache
 from importrr.config import Config
-from importrr.sort import Sort
+from importrr.report import REPORT_HISTORY
+from importrr.sort import BATCH_FILES, BATCH_SIZE, Sort
+from importrr.watch import Watcher
 
 logging.basicConfig(
     level=logging.INFO,
@@ -18,28 +26,93 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def main_process():
-    """Main processing function that can be called from scheduler or directly"""
+def run_import(d, import_dir, cache_dir=None, cache_size=None):
+    """Import one directory of one section, in this process or a worker"""
+    cache = None
+    if cache_dir:
+        cache = TranscodeCache(cache_dir, cache_size * 1000000000)
+
+    sort = Sort(
+        d.get("album"),
+        d.get("archive"),
+        sidecar=d.get("sidecar", False),
+        transcode_jobs=d.get("transcode_jobs", 1),
+        transcode_threads=d.get("transcode_threads"),
+        transcode_cache=cache,
+        duplicates=d.get("duplicates", "keep"),
+        recursive=d.get("recursive", False),
+        batch_files=d.get("batch_files", BATCH_FILES),
+        batch_size=d.get("batch_size", BATCH_SIZE // 1000000000) * 1000000000,
+        fast_metadata=d.get("fast_metadata", True),
+        archive_mode=d.get("archive_mode", "tar"),
+        archive_layout=d.get("archive_layout", "flat"),
+        archive_policy=d.get("archive_policy", "full"),
+        report_dir=d.get("report_dir"),
+        report_history=d.get("report_history", REPORT_HISTORY),
+    )
+    sort.launch(import_dir)
+
+
+def init_worker():
+    # a worker finishes its current conversions on SIGTERM instead of dying
+    # halfway through them; the parent forwards the signal
+    signal.signal(signal.SIGTERM, lambda signum, frame: sort.stopping.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def main_process(albums=None):
+    """Main processing function that can be called from scheduler or directly
+
+    When ``albums`` is given only the sections of those albums are imported.
+    """
     try:
         logger.info("Starting importrr application")
         config = Config()
 
-        total_sections = len(config.get_data())
+        sections = [
+            d for d in config.get_data() if albums is None or d.get("album") in albums
+        ]
+        total_sections = len(sections)
         logger.info(f"Processing {total_sections} configuration sections")
 
-        for i, d in enumerate(config.get_data(), 1):
-            try:
-                logger.info(
-                    f"Processing section {i}/{total_sections}: {d.get('album')}"
-                )
-                sort = Sort(d.get("album"), d.get("archive"))
-                for import_dir in d.get("import"):
-                    sort.launch(import_dir)
-            except Exception as e:
-                logger.error(f"Failed to process section {i}: {e}")
-                logger.debug(f"Section details: {d}")
-                # Continue with next section instead of crashing
-                continue
+        jobs = [
+            (i, d, import_dir)
+            for i, d in enumerate(sections, 1)
+            for import_dir in d.get("import")
+        ]
+        cache_args = (config.transcode_cache, config.transcode_cache_size)
+
+        if config.workers == 1:
+            for i, d, import_dir in jobs:
+                try:
+                    logger.info(
+                        f"Processing section {i}/{total_sections}: {d.get('album')}"
+                    )
+                    run_import(d, import_dir, *cache_args)
+                except Exception as e:
+                    log_failure(i, d, import_dir, e)
+                    # Continue with next directory instead of crashing
+                    continue
+        else:
+            # separate processes, because ExifTool sessions change the cwd;
+            # sections on different disks then don't wait on each other
+            # the scheduler and watcher threads make forking this process
+            # unsafe, workers start from a clean forkserver instead
+            with ProcessPoolExecutor(
+                max_workers=config.workers,
+                initializer=init_worker,
+                mp_context=multiprocessing.get_context("forkserver"),
+            ) as pool:
+                futures = {
+                    pool.submit(run_import, job[1], job[2], *cache_args): job
+                    for job in jobs
+                }
+                for future in as_completed(futures):
+                    # any failure is logged per section as in the loop above,
+                    # and the remaining sections are still collected
+                    error = future.exception()
+                    if error is not None:
+                        log_failure(*futures[future], error)
 
         logger.info("Importrr application completed successfully")
 
@@ -49,9 +122,17 @@ def main_process():
         raise  # Re-raise for scheduler to handle
 
 
+def log_failure(i, d, import_dir, e):
+    logger.error(f"Failed to process section {i} ({import_dir}): {e}")
+    logger.debug(f"Section details: {d}")
+
+
 class ImportrrScheduler:
     def __init__(self):
         self.scheduler = BlockingScheduler()
+        # the watcher and the cron sweep never import at the same time
+        self.import_lock = threading.Lock()
+        self.stop = threading.Event()
         self.setup_signal_handlers()
 
     def setup_signal_handlers(self):
@@ -59,22 +140,37 @@ class ImportrrScheduler:
 
         def signal_handler(signum, frame):
             logger.info(f"Received signal {signum}, shutting down gracefully...")
-            self.scheduler.shutdown()
-            sys.exit(0)
+            self.stop.set()
+            # a running import finishes its current conversions and keeps
+            # its journal, the next start resumes it
+            sort.stopping.set()
+            for child in multiprocessing.active_children():
+                os.kill(child.pid, signal.SIGTERM)
+            if self.scheduler.running:
+                self.scheduler.shutdown(wait=False)
+            if not self.import_lock.locked():
+                sys.exit(0)
 
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
 
-    def run_import_job(self):
+    def run_import_job(self, albums=None):
         """Wrapper function to run the import process with proper logging"""
+        with self.import_lock:
+            self._run_import_job(albums)
+
+    def _run_import_job(self, albums):
         job_start = datetime.now()
         logger.info("=" * 60)
-        logger.info(f"Starting scheduled import job at {job_start}")
+        if albums is None:
+            logger.info(f"Starting scheduled import job at {job_start}")
+        else:
+            logger.info(f"Starting import job for {', '.join(albums)} at {job_start}")
         logger.info("=" * 60)
 
         try:
             # Run the main import process
-            main_process()
+            main_process(albums)
 
             job_end = datetime.now()
             duration = job_end - job_start
@@ -93,6 +189,42 @@ class ImportrrScheduler:
             logger.error("=" * 60)
             # Don't re-raise - we want the scheduler to continue running
 
+    def start_watcher(self):
+        """Import a section as soon as new files in it have settled"""
+        config = Config()
+        if not config.watch:
+            return
+
+        dirs = {
+            os.path.join(d.get("album"), import_dir): d.get("album")
+            for d in config.get_data()
+            for import_dir in d.get("import")
+        }
+        try:
+            watcher = Watcher(dirs, lambda album: self.run_import_job({album}))
+        except OSError as e:
+            logger.error(f"Cannot start watcher, relying on scheduled runs: {e}")
+            return
+
+        thread = threading.Thread(
+            target=watcher.run, args=(self.stop,), name="watcher", daemon=True
+        )
+        thread.start()
+        logger.info(f"Watching {len(watcher.watches)} import directories")
+
+    def start_metrics(self):
+        """Serve /metrics when a port is configured"""
+        config = Config()
+        if config.metrics_port is None:
+            return
+        try:
+            metrics.serve(
+                metrics.Metrics(config.report_dir, config.get_data()),
+                config.metrics_port,
+            )
+        except OSError as e:
+            logger.error(f"Cannot serve metrics on port {config.metrics_port}: {e}")
+
     def start(self):
         """Start the scheduler"""
         try:
@@ -112,14 +244,26 @@ class ImportrrScheduler:
                 "Scheduler configured with max_instances=1 to prevent overlapping jobs"
             )
 
+            # up before the first run, so a long initial import is visible
+            self.start_metrics()
+
             # Run once on startup
             logger.info("Running initial import on startup...")
             self.run_import_job()
+            if self.stop.is_set():
+                return
+
+            # the scheduled runs stay as a sweep for anything the watcher missed
+            self.start_watcher()
 
             # Start the scheduler for future runs
             logger.info("Starting scheduled runs...")
             self.scheduler.start()
 
+            # returns on shutdown; wait for an import that is still draining
+            with self.import_lock:
+                pass
+
         except (KeyboardInterrupt, SystemExit):
             logger.info("Scheduler shutdown requested")
         except Exception as e:
@@ -0,0 +1,66 @@
+"""Restore single files from the tar volumes of a section.
+
+python3 src/restore.py [--archive DIR] [--output DIR] 2024/01/20240101-090000.jpg ...
+
+Files are named by their path in the album. Without --archive, the archive
+dir of every configured section is searched, in order. --rebuild indexes
+the volumes again from their manifests first, e.g. for tars written before
+the catalog existed.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+from importrr import catalog
+from importrr.config import Config
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)-8s [%(name)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="album paths of the files")
+    parser.add_argument("--archive", action="append", help="archive dir to search")
+    parser.add_argument("--output", default=".", help="where to write the files")
+    parser.add_argument("--rebuild", action="store_true", help="re-index first")
+    args = parser.parse_args(argv)
+
+    archive_dirs = args.archive or [d.get("archive") for d in Config().get_data()]
+    if args.rebuild:
+        for archive_dir in archive_dirs:
+            c = catalog.Catalog(archive_dir)
+            try:
+                c.rebuild()
+            finally:
+                c.close()
+
+    failed = 0
+    for path in args.paths:
+        dest = os.path.join(args.output, path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        for archive_dir in archive_dirs:
+            try:
+                catalog.restore(archive_dir, path, dest)
+                break
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.error(f"Cannot restore {path} from {archive_dir}: {e}")
+                failed += 1
+                break
+        else:
+            logger.error(f"{path} is in none of {', '.join(archive_dirs)}")
+            failed += 1
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""Check archived volumes against their manifests.
+
+python3 src/verify.py [--jobs N] [archive dir or manifest ...]
+
+Without paths, the archive dir of every configured section is checked.
+Exits with status 1 when any volume doesn't match its manifest.
+"""
+
+import argparse
+import logging
+import sys
+
+from importrr import manifest
+from importrr.config import Config
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s %(levelname)-8s [%(name)s] %(message)s",
+    datefmt="%Y-%m-%d %H:%M:%S",
+)
+
+logger = logging.getLogger(__name__)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="archive dirs or manifests")
+    parser.add_argument(
+        "--jobs", type=int, default=None, help="volumes checked at once"
+    )
+    args = parser.parse_args(argv)
+
+    paths = args.paths or [d.get("archive") for d in Config().get_data()]
+    for tar_file in manifest.unlisted(paths):
+        logger.warning(f"No manifest for {tar_file}, it can't be verified")
+
+    manifests = manifest.find(paths)
+    logger.info(f"Verifying {len(manifests)} volumes")
+    failed = 0
+    for path, problems in manifest.verify(manifests, args.jobs).items():
+        if problems:
+            failed += 1
+            logger.error(f"FAILED {path}")
+            for problem in problems:
+                logger.error(f"  {problem}")
+        else:
+            logger.info(f"OK {path}")
+
+    logger.info(f"{len(manifests) - failed} volumes OK, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,6 +12,17 @@ class FFmpeg:
         pass
 
 
+class FFprobe:
+    def __init__(self, executable="ffprobe", global_options=None, inputs=None):
+        self.executable = executable
+        self.global_options = global_options
+        self.inputs = inputs
+        self.cmd = "ffprobe mock command"
+
+    def run(self, input_data=None, stdout=None, stderr=None):
+        return b'{"streams": []}', b""
+
+
 class FFRuntimeError(Exception):
     def __init__(self, cmd, exit_code, stdout, stderr):
         self.cmd = cmd
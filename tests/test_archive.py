@@ -1,9 +1,13 @@
 import os
+import threading
+import time
 from unittest.mock import MagicMock, call, patch
 
 import pytest
 
-from src.importrr.archive import copy, create_tar
+from src.importrr import catalog, manifest
+from src.importrr.archive import Archiver, convert, copy, create_tar
+from src.importrr.journal import Journal
 
 # --- Tests for copy ---
 
@@ -50,7 +54,13 @@ def test_copy_single_tar(mock_stat, mock_create_tar):
     copy(root_dir, sorted_files, archive_dir, prefix)
 
     mock_create_tar.assert_called_once_with(
-        root_dir, ["image1.jpg", "image2.jpg"], archive_dir, prefix, 0
+        root_dir,
+        ["image1.jpg", "image2.jpg"],
+        archive_dir,
+        prefix,
+        0,
+        None,
+        content=None,
     )
 
 
@@ -93,13 +103,98 @@ def test_copy_create_multiple_tars(mock_stat, mock_create_tar):
     assert calls[2].args[4] == 2  # index of final archive
 
 
+@patch("src.importrr.archive.create_tar")
+@patch("src.importrr.archive.os.stat")
+@patch("src.importrr.archive.MAX_SIZE", 1500)
+def test_copy_keeps_sidecar_with_media(mock_stat, mock_create_tar):
+    sizes = {"a.jpg": 1000, "b.jpg": 400, "b.jpg.xmp": 200}
+    mock_stat.side_effect = lambda path: MagicMock(
+        st_size=sizes[os.path.basename(path)]
+    )
+
+    copy("/test/root", ["a.jpg", "b.jpg", "b.jpg.xmp"], "/test/archive", "prefix")
+
+    # b.jpg alone would fit with a.jpg, but not together with its sidecar
+    assert mock_create_tar.call_count == 2
+    assert mock_create_tar.mock_calls[1].args[1] == ["b.jpg", "b.jpg.xmp"]
+
+
+@patch("src.importrr.archive.create_tar")
+@patch("src.importrr.archive.os.stat")
+@patch("src.importrr.archive.transcode.convert")
+def test_copy_sidecar_follows_converted_mov(mock_convert, mock_stat, mock_create_tar):
+    mock_convert.return_value = "clip.mp4"
+    mock_stat.return_value = MagicMock(st_size=10)
+
+    copy("/test/root", ["clip.mov", "clip.mov.xmp"], "/test/archive", "prefix")
+
+    mock_create_tar.assert_called_once_with(
+        "/test/root",
+        ["clip.mp4", "clip.mov.xmp"],
+        "/test/archive",
+        "prefix",
+        0,
+        None,
+        content=None,
+    )
+
+
+@patch("src.importrr.archive.create_tar")
+@patch("src.importrr.archive.os.stat")
+@patch("src.importrr.archive.transcode.convert")
+def test_copy_parallel_conversions_keep_order(mock_convert, mock_stat, mock_create_tar):
+    finished = []
+
+    def convert(root_dir, f, session, threads, cache):
+        # the first clip takes longest, so it finishes last
+        time.sleep(0.05 if f == "a.mov" else 0)
+        finished.append(f)
+        return f[:-3] + "mp4"
+
+    mock_convert.side_effect = convert
+    mock_stat.return_value = MagicMock(st_size=10)
+
+    copy(
+        "/test/root",
+        ["a.mov", "b.jpg", "c.mov"],
+        "/test/archive",
+        "prefix",
+        jobs=2,
+        threads=4,
+    )
+
+    assert finished[-1] == "a.mov"
+    mock_create_tar.assert_called_once_with(
+        "/test/root",
+        ["a.mp4", "b.jpg", "c.mp4"],
+        "/test/archive",
+        "prefix",
+        0,
+        None,
+        content=None,
+    )
+    mock_convert.assert_any_call("/test/root", "c.mov", None, 4, None)
+
+
 # --- Tests for create_tar ---
 
 
+@patch("src.importrr.archive.catalog")
+@patch("src.importrr.archive.manifest")
+@patch("src.importrr.archive.os.remove")
+@patch("src.importrr.archive.os.link")
 @patch("src.importrr.archive.os.path.getsize")
 @patch("src.importrr.archive.os.path.exists")
-@patch("src.importrr.archive.tarfile.open")
-def test_create_tar_success(mock_tarfile_open, mock_exists, mock_getsize):
+@patch("src.importrr.archive.tarwriter.TarWriter.open")
+def test_create_tar_success(
+    mock_tarfile_open,
+    mock_exists,
+    mock_getsize,
+    mock_link,
+    mock_remove,
+    mock_manifest,
+    mock_catalog,
+):
     mock_exists.return_value = True
     mock_getsize.return_value = 2048
 
@@ -117,7 +212,9 @@ def test_create_tar_success(mock_tarfile_open, mock_exists, mock_getsize):
 
     expected_tar_file = os.path.join(archive_dir, f"{prefix}-{index}.tar")
 
-    mock_tarfile_open.assert_called_once_with(expected_tar_file, "w")
+    mock_tarfile_open.assert_called_once_with(expected_tar_file + ".part", "x")
+    mock_link.assert_called_once_with(expected_tar_file + ".part", expected_tar_file)
+    mock_remove.assert_called_once_with(expected_tar_file + ".part")
 
     expected_add_calls = [
         call(os.path.join(root_dir, "file1.jpg"), arcname="file1.jpg", recursive=False),
@@ -127,12 +224,23 @@ def test_create_tar_success(mock_tarfile_open, mock_exists, mock_getsize):
     mock_getsize.assert_called_once_with(expected_tar_file)
 
 
+@patch("src.importrr.archive.catalog")
+@patch("src.importrr.archive.manifest")
+@patch("src.importrr.archive.os.remove")
+@patch("src.importrr.archive.os.link")
 @patch("src.importrr.archive.logger")
 @patch("src.importrr.archive.os.path.getsize")
 @patch("src.importrr.archive.os.path.exists")
-@patch("src.importrr.archive.tarfile.open")
+@patch("src.importrr.archive.tarwriter.TarWriter.open")
 def test_create_tar_file_not_found(
-    mock_tarfile_open, mock_exists, mock_getsize, mock_logger
+    mock_tarfile_open,
+    mock_exists,
+    mock_getsize,
+    mock_logger,
+    mock_link,
+    mock_remove,
+    mock_manifest,
+    mock_catalog,
 ):
     # first file exists, second does not
     mock_exists.side_effect = [True, False]
@@ -161,7 +269,7 @@ def test_create_tar_file_not_found(
 
 
 @patch("src.importrr.archive.logger")
-@patch("src.importrr.archive.tarfile.open")
+@patch("src.importrr.archive.tarwriter.TarWriter.open")
 def test_create_tar_exception(mock_tarfile_open, mock_logger):
     mock_tarfile_open.side_effect = PermissionError("Permission denied")
 
@@ -178,3 +286,223 @@ def test_create_tar_exception(mock_tarfile_open, mock_logger):
     mock_logger.error.assert_called_once_with(
         f"Failed to create archive {expected_tar_file}: Permission denied"
     )
+
+
+def test_create_tar_skips_taken_names(tmp_path):
+    (tmp_path / "a.jpg").write_bytes(b"a")
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+    (archive_dir / "prefix-0.tar").write_bytes(b"other worker")
+
+    create_tar(str(tmp_path), ["a.jpg"], str(archive_dir), "prefix", 0)
+
+    assert (archive_dir / "prefix-0.tar").read_bytes() == b"other worker"
+    assert (archive_dir / "prefix-1.tar").exists()
+
+
+@patch("src.importrr.archive.create_tar")
+@patch("src.importrr.archive.os.stat")
+@patch("src.importrr.archive.transcode.convert")
+def test_copy_converts_while_files_still_arrive(
+    mock_convert, mock_stat, mock_create_tar
+):
+    converting = threading.Event()
+
+    def convert(root_dir, f, session, threads, cache):
+        converting.set()
+        return f[:-3] + "mp4"
+
+    def organized():
+        yield "a.mov"
+        yield "b.jpg"
+        # a.mov is converting before organize has finished
+        assert converting.wait(2)
+        yield "b.jpg.xmp"
+        yield "c.jpg"
+
+    mock_convert.side_effect = convert
+    mock_stat.return_value = MagicMock(st_size=10)
+
+    copy("/test/root", organized(), "/test/archive", "prefix")
+
+    mock_create_tar.assert_called_once_with(
+        "/test/root",
+        ["a.mp4", "b.jpg", "b.jpg.xmp", "c.jpg"],
+        "/test/archive",
+        "prefix",
+        0,
+        None,
+        content=None,
+    )
+
+
+@patch("src.importrr.archive.create_tar")
+@patch("src.importrr.archive.os.stat")
+def test_copy_raises_when_files_fail_to_arrive(mock_stat, mock_create_tar):
+    def organized():
+        yield "a.jpg"
+        # held back until the next file shows it has no sidecar
+        yield "b.jpg"
+        raise RuntimeError("organize died")
+
+    mock_stat.return_value = MagicMock(st_size=10)
+
+    # a.jpg is archived, but the copy doesn't pass for a complete one
+    with pytest.raises(RuntimeError, match="organize died"):
+        copy("/test/root", organized(), "/test/archive", "prefix")
+    assert mock_create_tar.call_args[0][1] == ["a.jpg"]
+
+
+@patch("src.importrr.archive.copy")
+def test_archiver_finish_raises_any_failure(mock_copy):
+    mock_copy.side_effect = RuntimeError("unexpected")
+    archiver = Archiver("/test/root", "/test/archive", "prefix")
+    archiver.start()
+
+    with pytest.raises(RuntimeError, match="unexpected"):
+        archiver.finish()
+
+
+@patch("src.importrr.archive.create_tar")
+@patch("src.importrr.archive.os.stat")
+@patch("src.importrr.archive.transcode.convert")
+def test_copy_stops_after_running_conversion(mock_convert, mock_stat, mock_create_tar):
+    stop = threading.Event()
+    converting = threading.Event()
+
+    def convert(root_dir, f, session, threads, cache):
+        converting.set()
+        assert stop.wait(2)
+        return f[:-3] + "mp4"
+
+    def organized():
+        yield "a.mov"
+        yield "b.jpg"
+        # shutdown arrives while the first clip is converting
+        assert converting.wait(2)
+        stop.set()
+        yield "c.mov"
+        yield "d.jpg"
+
+    mock_convert.side_effect = convert
+    mock_stat.return_value = MagicMock(st_size=10)
+
+    copy("/test/root", organized(), "/test/archive", "prefix", stop=stop)
+
+    mock_convert.assert_called_once_with("/test/root", "a.mov", None, None, None)
+    mock_create_tar.assert_called_once_with(
+        "/test/root", ["a.mp4"], "/test/archive", "prefix", 0, None, content=None
+    )
+
+
+@patch("src.importrr.archive.transcode.convert")
+def test_convert_reuses_journaled_conversion(mock_convert, tmp_path):
+    (tmp_path / "a.mp4").write_bytes(b"converted")
+    journal = Journal(str(tmp_path), "batch")
+    journal.record("transcoded", file="a.mov", to="a.mp4")
+    mock_convert.return_value = "b.mp4"
+
+    assert convert(str(tmp_path), "a.mov", None, None, None, journal) == "a.mp4"
+    assert convert(str(tmp_path), "b.mov", None, None, None, journal) == "b.mp4"
+
+    mock_convert.assert_called_once_with(str(tmp_path), "b.mov", None, None, None)
+    assert journal.transcoded() == {"a.mov": "a.mp4", "b.mov": "b.mp4"}
+    journal.close()
+
+
+def test_create_tar_records_finished_volume(tmp_path):
+    (tmp_path / "a.jpg").write_bytes(b"a")
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+    journal = Journal(str(tmp_path), "batch")
+
+    create_tar(str(tmp_path), ["a.jpg"], str(archive_dir), "prefix", 0, journal)
+
+    assert sorted(os.listdir(archive_dir)) == [
+        ".importrr-catalog.sqlite",
+        "prefix-0.manifest.json",
+        "prefix-0.tar",
+    ]
+    assert journal.files("archived") == {"a.jpg"}
+    assert journal.stale_parts() == []
+    journal.close()
+
+
+def test_copy_mirror_mode_places_files_and_journals_them(tmp_path):
+    (tmp_path / "2024").mkdir()
+    (tmp_path / "2024" / "a.jpg").write_bytes(b"a")
+    (tmp_path / "2024" / "a.jpg.xmp").write_bytes(b"x")
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+    journal = Journal(str(tmp_path), "batch")
+
+    copy(
+        str(tmp_path),
+        ["2024/a.jpg", "2024/a.jpg.xmp"],
+        str(archive_dir),
+        "prefix",
+        journal=journal,
+        mode="mirror",
+    )
+
+    assert sorted(os.listdir(archive_dir)) == ["2024", "prefix-0.manifest.json"]
+    assert sorted(os.listdir(archive_dir / "2024")) == ["a.jpg", "a.jpg.xmp"]
+    assert journal.files("archived") == {"2024/a.jpg", "2024/a.jpg.xmp"}
+    assert journal.stale_parts() == []
+    journal.close()
+
+
+@patch("src.importrr.archive.create_tar")
+@patch("src.importrr.archive.os.stat")
+@patch("src.importrr.archive.MAX_SIZE", 1500)
+def test_copy_month_layout_splits_volumes_by_month(mock_stat, mock_create_tar):
+    mock_stat.return_value = MagicMock(st_size=1000)
+    sorted_files = [
+        "2024/01/a.jpg",
+        "2024/02/b.jpg",
+        "2024/01/c.jpg",
+        "2024/02/b.jpg.xmp",
+        "other.jpg",
+    ]
+
+    copy("/test/root", sorted_files, "/test/archive", "prefix", layout="month")
+
+    volumes = sorted(
+        (c.kwargs["partition"], c.args[4], c.args[1])
+        for c in mock_create_tar.mock_calls
+    )
+    assert volumes == [
+        ("", 0, ["other.jpg"]),
+        ("2024/01", 0, ["2024/01/a.jpg"]),
+        ("2024/01", 1, ["2024/01/c.jpg"]),
+        ("2024/02", 0, ["2024/02/b.jpg"]),
+        ("2024/02", 1, ["2024/02/b.jpg.xmp"]),
+    ]
+
+
+def test_copy_month_layout_writes_volumes_into_month_folders(tmp_path):
+    for name in ["2024/01/a.jpg", "2024/02/b.jpg"]:
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_bytes(name.encode())
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+
+    copy(
+        str(tmp_path),
+        ["2024/01/a.jpg", "2024/02/b.jpg"],
+        str(archive_dir),
+        "prefix",
+        layout="month",
+    )
+
+    for month in ["2024/01", "2024/02"]:
+        assert sorted(os.listdir(archive_dir / month)) == [
+            "prefix-0.manifest.json",
+            "prefix-0.tar",
+        ]
+    assert manifest.verify(manifest.find([str(archive_dir)]), jobs=1) == {
+        str(archive_dir / "2024/01/prefix-0.manifest.json"): [],
+        str(archive_dir / "2024/02/prefix-0.manifest.json"): [],
+    }
+    catalog.restore(str(archive_dir), "2024/02/b.jpg", str(tmp_path / "b.jpg"))
+    assert (tmp_path / "b.jpg").read_bytes() == b"2024/02/b.jpg"
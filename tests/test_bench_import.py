@@ -0,0 +1,30 @@
+import os
+import subprocess
+
+from benchmarks import bench_import
+
+
+def test_run_size_with_fake_tools(tmp_path, monkeypatch):
+    # 20 files hold every kind of the corpus, videos to backfill too.
+    # run_size changes PATH and the fake tool settings, and counts Popen;
+    # all of them are put back afterwards
+    for name in (
+        "PATH",
+        "IMPORTRR_FAKE_COMMAND",
+        "IMPORTRR_FAKE_FILE",
+        "IMPORTRR_FAKE_SPEED",
+        "IMPORTRR_FAKE_DURATION",
+    ):
+        monkeypatch.setenv(name, os.environ.get(name, ""))
+    monkeypatch.setattr(subprocess.Popen, "__init__", subprocess.Popen.__init__)
+    args = bench_import.build_parser().parse_args(
+        ["--dir", str(tmp_path), "--command-latency", "0", "--file-latency", "0"]
+    )
+
+    results = bench_import.run_size(20, args)
+
+    stages = results["import"]["stages"]
+    assert stages["organize"]["files"] == 20
+    assert "exiftool.backfill.video" in stages
+    # the album now also holds the MP4s of its 3 MOVs
+    assert results["archive"]["stages"]["archive.copy"]["files"] == 23
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import time
+from unittest.mock import MagicMock, patch
+
+from src.importrr.cache import TranscodeCache
+from src.importrr.hashing import file_digest
+from src.importrr.transcode import convert
+
+
+def test_file_digest(tmp_path):
+    f = tmp_path / "a.bin"
+    f.write_bytes(b"abc" * 1000)
+
+    expected = hashlib.sha256(b"abc" * 1000).hexdigest()
+    assert file_digest(str(f)) == expected
+    # a tiny chunk size exercises the read loop
+    assert file_digest(str(f), chunk_size=7) == expected
+
+
+def test_key_depends_on_content_and_params(tmp_path):
+    a = tmp_path / "a.mov"
+    b = tmp_path / "b.mov"
+    c = tmp_path / "c.mov"
+    a.write_bytes(b"same")
+    b.write_bytes(b"same")
+    c.write_bytes(b"other")
+    cache = TranscodeCache(str(tmp_path / "cache"))
+
+    assert cache.key(str(a), "p") == cache.key(str(b), "p")
+    assert cache.key(str(a), "p") != cache.key(str(c), "p")
+    assert cache.key(str(a), "p") != cache.key(str(a), "q")
+
+
+def test_store_and_fetch(tmp_path):
+    cache = TranscodeCache(str(tmp_path / "cache"))
+    output = tmp_path / "first.mp4"
+    output.write_bytes(b"encoded")
+
+    assert not cache.fetch("k", str(tmp_path / "second.mp4"))
+    cache.store("k", str(output))
+
+    assert cache.fetch("k", str(tmp_path / "second.mp4"))
+    assert (tmp_path / "second.mp4").read_bytes() == b"encoded"
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = TranscodeCache(str(tmp_path / "cache"), max_size=25)
+    for i, key in enumerate(["used", "old"]):
+        f = tmp_path / f"{key}.mp4"
+        f.write_bytes(b"x" * 10)
+        cache.store(key, str(f))
+        stamp = time.time() - 100 + i
+        os.utime(cache.path(key), (stamp, os.stat(cache.path(key)).st_mtime))
+
+    # touching an entry makes it the most recent one
+    cache.fetch("used", str(tmp_path / "out.mp4"))
+    (tmp_path / "new.mp4").write_bytes(b"x" * 10)
+    cache.store("new", str(tmp_path / "new.mp4"))
+
+    assert not os.path.exists(cache.path("old"))
+    assert os.path.exists(cache.path("used"))
+    assert os.path.exists(cache.path("new"))
+
+
+def test_fetch_keeps_mtime_of_linked_files(tmp_path):
+    cache = TranscodeCache(str(tmp_path / "cache"))
+    output = tmp_path / "first.mp4"
+    output.write_bytes(b"encoded")
+    os.utime(output, (1000, 1000))
+    cache.store("k", str(output))
+
+    cache.fetch("k", str(tmp_path / "second.mp4"))
+
+    assert os.stat(output).st_mtime == 1000
+
+
+@patch("src.importrr.transcode.transcode")
+@patch("src.importrr.transcode.can_remux")
+def test_convert_cache_hit_skips_transcode(mock_can_remux, mock_transcode, tmp_path):
+    (tmp_path / "clip.mov").write_bytes(b"mov")
+    cache = MagicMock()
+    cache.fetch.return_value = True
+
+    assert convert(str(tmp_path), "clip.mov", cache=cache) == "clip.mp4"
+
+    mock_can_remux.assert_not_called()
+    mock_transcode.assert_not_called()
+    cache.store.assert_not_called()
+
+
+@patch("src.importrr.transcode.exifhelper.copy_tags")
+@patch("src.importrr.transcode.transcode")
+@patch("src.importrr.transcode.can_remux", return_value=False)
+def test_convert_cache_miss_stores_result(
+    mock_can_remux, mock_transcode, mock_copy_tags, tmp_path
+):
+    (tmp_path / "clip.mov").write_bytes(b"mov")
+    mock_transcode.side_effect = lambda i, o, t, r: open(o, "wb").close()
+    cache = MagicMock()
+    cache.key.return_value = "k"
+    cache.fetch.return_value = False
+
+    assert convert(str(tmp_path), "clip.mov", cache=cache) == "clip.mp4"
+
+    cache.store.assert_called_once_with("k", os.path.join(str(tmp_path), "clip.mp4"))
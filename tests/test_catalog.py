@@ -0,0 +1,207 @@
+import json
+import os
+import sqlite3
+import tarfile
+
+import pytest
+
+from src.importrr import catalog, manifest
+from src.importrr.archive import copy, create_tar
+
+
+def archive(tmp_path, files, index=0):
+    root = tmp_path / "album"
+    for name, data in files.items():
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_bytes(data)
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir(exist_ok=True)
+    create_tar(str(root), sorted(files), str(archive_dir), "prefix", index)
+    return str(archive_dir)
+
+
+def test_restore_reads_file_from_its_volume(tmp_path):
+    data = os.urandom(70001)
+    archive(tmp_path, {"2024/01/a.jpg": b"a"})
+    archive_dir = archive(tmp_path, {"2024/02/b.jpg": data}, index=1)
+    dest = tmp_path / "b.jpg"
+
+    volume = catalog.restore(archive_dir, "2024/02/b.jpg", str(dest))
+
+    assert volume == "prefix-1.tar"
+    assert dest.read_bytes() == data
+    mtime = os.stat(tmp_path / "album/2024/02/b.jpg").st_mtime
+    assert dest.stat().st_mtime == int(mtime)
+
+
+def test_restore_follows_hardlink_members(tmp_path):
+    root = tmp_path / "album" / "2024"
+    root.mkdir(parents=True)
+    (root / "a.jpg").write_bytes(b"photo")
+    os.link(root / "a.jpg", root / "a-1.jpg")
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+    create_tar(
+        str(tmp_path / "album"),
+        ["2024/a.jpg", "2024/a-1.jpg"],
+        str(archive_dir),
+        "p",
+        0,
+    )
+    dest = tmp_path / "restored.jpg"
+
+    catalog.restore(str(archive_dir), "2024/a-1.jpg", str(dest))
+
+    assert dest.read_bytes() == b"photo"
+
+
+def test_restore_refuses_corrupted_data(tmp_path):
+    archive_dir = archive(tmp_path, {"2024/a.jpg": b"abc"})
+    c = catalog.Catalog(archive_dir)
+    offset = c.lookup("2024/a.jpg")["offset_data"]
+    c.close()
+    with open(os.path.join(archive_dir, "prefix-0.tar"), "r+b") as f:
+        f.seek(offset)
+        f.write(b"x")
+    dest = tmp_path / "a.jpg"
+
+    with pytest.raises(OSError, match="Checksum mismatch"):
+        catalog.restore(archive_dir, "2024/a.jpg", str(dest))
+    assert not dest.exists()
+
+
+def test_restore_takes_last_member_of_a_name(tmp_path):
+    root = tmp_path / "album"
+    root.mkdir()
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+    (root / "a.jpg").write_bytes(b"first")
+    tar_file = archive_dir / "p-0.tar"
+    with tarfile.open(tar_file, "w") as tar:
+        tar.add(root / "a.jpg", arcname="a.jpg")
+        (root / "a.jpg").write_bytes(b"second")
+        tar.add(root / "a.jpg", arcname="a.jpg")
+    with tarfile.open(tar_file) as tar:
+        first, last = tar.getmembers()
+    files = [
+        {"path": "a.jpg", "size": m.size, "offset_data": m.offset_data}
+        for m in (first, last)
+    ]
+
+    catalog.add_volume(str(archive_dir), str(tar_file), files)
+    catalog.restore(str(archive_dir), "a.jpg", str(tmp_path / "a.jpg"))
+
+    assert (tmp_path / "a.jpg").read_bytes() == b"second"
+
+
+def test_restore_unknown_file(tmp_path):
+    archive_dir = archive(tmp_path, {"2024/a.jpg": b"abc"})
+
+    with pytest.raises(FileNotFoundError):
+        catalog.restore(archive_dir, "2024/b.jpg", str(tmp_path / "b.jpg"))
+
+
+def test_rebuild_reads_offsets_missing_from_old_manifests(tmp_path):
+    archive_dir = archive(tmp_path, {"2024/a.jpg": b"abc"})
+    path = os.path.join(archive_dir, "prefix-0.manifest.json")
+    with open(path) as f:
+        saved = json.load(f)
+    for entry in saved["files"]:
+        del entry["offset"], entry["offset_data"]
+    with open(path, "w") as f:
+        json.dump(saved, f)
+    os.remove(os.path.join(archive_dir, catalog.CATALOG_FILE))
+
+    c = catalog.Catalog(archive_dir)
+    assert c.rebuild() == 1
+    c.close()
+    catalog.restore(archive_dir, "2024/a.jpg", str(tmp_path / "a.jpg"))
+
+    assert (tmp_path / "a.jpg").read_bytes() == b"abc"
+
+
+def import_twice(tmp_path, first, second, layout="flat"):
+    root = tmp_path / "album"
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+    for prefix, name in [("p1", first), ("p2", second)]:
+        (root / name).parent.mkdir(parents=True, exist_ok=True)
+        (root / name).write_bytes(b"same photo")
+        copy(
+            str(root),
+            [name],
+            str(archive_dir),
+            prefix,
+            layout=layout,
+            policy="incremental",
+        )
+    return archive_dir
+
+
+def test_incremental_policy_references_archived_content(tmp_path):
+    archive_dir = import_twice(tmp_path, "2024/01/a.jpg", "2024/01/a-1.jpg")
+
+    with tarfile.open(archive_dir / "p2-0.tar") as tar:
+        assert tar.getnames() == []
+    with open(archive_dir / "p2-0.manifest.json") as f:
+        (entry,) = json.load(f)["files"]
+    assert entry["link"] == "2024/01/a.jpg"
+    assert entry["ref"] == "p1-0.tar"
+
+    assert manifest.verify(manifest.find([str(archive_dir)]), jobs=1) == {
+        str(archive_dir / "p1-0.manifest.json"): [],
+        str(archive_dir / "p2-0.manifest.json"): [],
+    }
+    catalog.restore(str(archive_dir), "2024/01/a-1.jpg", str(tmp_path / "a.jpg"))
+    assert (tmp_path / "a.jpg").read_bytes() == b"same photo"
+
+
+def test_incremental_references_volumes_of_other_months(tmp_path):
+    archive_dir = import_twice(
+        tmp_path, "2024/01/a.jpg", "2024/02/b.jpg", layout="month"
+    )
+
+    with open(archive_dir / "2024/02/p2-0.manifest.json") as f:
+        (entry,) = json.load(f)["files"]
+    assert entry["ref"] == "../01/p1-0.tar"
+    catalog.restore(str(archive_dir), "2024/02/b.jpg", str(tmp_path / "b.jpg"))
+    assert (tmp_path / "b.jpg").read_bytes() == b"same photo"
+
+
+def test_verify_reports_reference_to_lost_content(tmp_path):
+    archive_dir = import_twice(tmp_path, "2024/01/a.jpg", "2024/01/a-1.jpg")
+    path = archive_dir / "p1-0.manifest.json"
+    saved = json.loads(path.read_text())
+    saved["files"] = []
+    path.write_text(json.dumps(saved))
+
+    assert manifest.verify_volume(str(archive_dir / "p2-0.manifest.json")) == [
+        "2024/01/a-1.jpg: not stored in p1-0.tar"
+    ]
+
+
+def test_full_policy_stores_content_again(tmp_path):
+    root = tmp_path / "album"
+    root.mkdir()
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+    for prefix, name in [("p1", "a.jpg"), ("p2", "b.jpg")]:
+        (root / name).write_bytes(b"same photo")
+        copy(str(root), [name], str(archive_dir), prefix)
+
+    with tarfile.open(archive_dir / "p2-0.tar") as tar:
+        assert tar.getnames() == ["b.jpg"]
+
+
+def test_outdated_catalog_is_rebuilt(tmp_path):
+    archive_dir = archive(tmp_path, {"2024/a.jpg": b"abc"})
+    db = sqlite3.connect(os.path.join(archive_dir, catalog.CATALOG_FILE))
+    db.execute("DROP TABLE members")
+    db.execute("CREATE TABLE members (volume TEXT, path TEXT)")
+    db.execute("PRAGMA user_version = 0")
+    db.commit()
+    db.close()
+
+    catalog.restore(archive_dir, "2024/a.jpg", str(tmp_path / "a.jpg"))
+
+    assert (tmp_path / "a.jpg").read_bytes() == b"abc"
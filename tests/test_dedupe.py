@@ -0,0 +1,136 @@
+import os
+
+import pytest
+
+from src.importrr.dedupe import (
+    DuplicateIndex,
+    filter_duplicates,
+    hash_files,
+    record_organized,
+)
+from src.importrr.hashing import file_digest
+from src.importrr.planner import FilePlan
+
+
+@pytest.fixture
+def album(tmp_path):
+    month = tmp_path / "2024" / "01"
+    month.mkdir(parents=True)
+    (month / "20240102-030405.jpg").write_bytes(b"photo")
+    (tmp_path / "import").mkdir()
+    (tmp_path / "import" / "not-indexed.jpg").write_bytes(b"pending")
+    return tmp_path
+
+
+def test_hash_files(tmp_path):
+    a = tmp_path / "a"
+    a.write_bytes(b"a")
+    missing = str(tmp_path / "missing")
+
+    result = hash_files([str(a), missing], workers=2)
+
+    assert result == {str(a): file_digest(str(a)), missing: None}
+
+
+def test_refresh_only_indexes_sorted_tree(album):
+    index = DuplicateIndex(str(album))
+    index.refresh()
+
+    digest = file_digest(str(album / "2024" / "01" / "20240102-030405.jpg"))
+    assert index.lookup(digest) == os.path.join("2024", "01", "20240102-030405.jpg")
+    assert index.lookup(file_digest(str(album / "import" / "not-indexed.jpg"))) is None
+    index.close()
+
+
+def test_refresh_is_incremental(album, monkeypatch):
+    index = DuplicateIndex(str(album))
+    index.refresh()
+
+    hashed = []
+    monkeypatch.setattr(
+        "src.importrr.dedupe.hash_files",
+        lambda paths, workers: hashed.extend(paths) or {},
+    )
+    (album / "2024" / "01" / "20240102-030406.jpg").write_bytes(b"new")
+    index.refresh()
+
+    assert hashed == [str(album / "2024" / "01" / "20240102-030406.jpg")]
+    index.close()
+
+
+def test_refresh_drops_removed_files(album):
+    index = DuplicateIndex(str(album))
+    index.refresh()
+    digest = file_digest(str(album / "2024" / "01" / "20240102-030405.jpg"))
+
+    os.remove(album / "2024" / "01" / "20240102-030405.jpg")
+    index.refresh()
+
+    assert index.db.execute("SELECT COUNT(*) FROM files").fetchone()[0] == 0
+    assert index.lookup(digest) is None
+    index.close()
+
+
+def test_filter_duplicates_skip(album):
+    work = album / "import" / "work"
+    work.mkdir()
+    (work / "copy.jpg").write_bytes(b"photo")
+    (work / "new.jpg").write_bytes(b"new")
+    (work / "new-again.jpg").write_bytes(b"new")
+    index = DuplicateIndex(str(album), "skip")
+    index.refresh()
+
+    digests, pending = filter_duplicates(index, str(album), str(work))
+
+    remaining = os.listdir(work)
+    assert len(remaining) == 1 and remaining[0].startswith("new")
+    assert list(digests) == remaining
+    assert pending == []
+    index.close()
+
+
+def test_filter_duplicates_link(album):
+    work = album / "import" / "work"
+    work.mkdir()
+    (work / "copy.jpg").write_bytes(b"photo")
+    index = DuplicateIndex(str(album), "link")
+    index.refresh()
+
+    digests, _ = filter_duplicates(index, str(album), str(work))
+
+    linked = album / "2024" / "01" / "20240102-030405-1.jpg"
+    assert digests == {}
+    assert os.listdir(work) == []
+    assert linked.read_bytes() == b"photo"
+    assert (
+        os.stat(linked).st_ino
+        == os.stat(album / "2024" / "01" / "20240102-030405.jpg").st_ino
+    )
+    index.close()
+
+
+def test_record_organized_links_batch_duplicates(album):
+    work = album / "import" / "work"
+    work.mkdir()
+    (work / "a.jpg").write_bytes(b"same")
+    (work / "b.jpg").write_bytes(b"same")
+    index = DuplicateIndex(str(album), "link")
+
+    digests, pending = filter_duplicates(index, str(album), str(work))
+    assert os.listdir(work) == ["a.jpg"]
+
+    # what organize would have done with the first copy
+    os.rename(work / "a.jpg", album / "2024" / "01" / "20240105-000000.jpg")
+    renames = [(str(work / "a.jpg"), "2024/01/20240105-000000.jpg")]
+    record_organized(
+        index, str(album), str(work), [FilePlan("a.jpg")], renames, digests, pending
+    )
+
+    assert index.lookup(digests["a.jpg"]) == "2024/01/20240105-000000.jpg"
+    assert (album / "2024" / "01" / "20240105-000000-1.jpg").read_bytes() == b"same"
+    index.close()
+
+
+def test_unknown_policy(album):
+    with pytest.raises(ValueError, match="Unknown duplicate policy"):
+        DuplicateIndex(str(album), "merge")
@@ -1,55 +1,57 @@
-from unittest.mock import patch
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
 import pytest
+from exiftool.exceptions import ExifToolExecuteError
 
-from src.importrr.exifhelper import adjust_extensions
+from src.importrr.exifhelper import read_metadata
 
 
 @patch("src.importrr.exifhelper.run_exiftool")
-def test_adjust_extensions_params(mock_run_exiftool):
+def test_read_metadata_params(mock_run_exiftool):
     import_dir = "/test/import/dir"
     root_dir = "/test/root/dir"
 
-    adjust_extensions(import_dir, root_dir)
+    mock_run_exiftool.return_value = '[{"SourceFile": "/test/import/dir/a.jpg"}]'
+
+    result = read_metadata(import_dir, root_dir)
 
     expected_params = [
-        "-filename<%f.$fileTypeExtension",
-        "-ext",
-        "GIF",
-        "-ext",
-        "JPG",
-        "-ext",
-        "PNG",
-        "-ext",
-        "3GP",
-        "-ext",
-        "MOV",
-        "-ext",
-        "MP4",
+        "-r",
+        "-json",
+        "-G",
+        "-FileTypeExtension",
+        "-DateTimeOriginal",
+        "-CreateDate",
+        "-CreationDate",
+        "-XMP:DateCreated",
+        "-PNG:CreateDate",
+        "-FileModifyDate",
         import_dir,
     ]
+    mock_run_exiftool.assert_called_once_with(root_dir, expected_params, session=None)
+    assert result == [{"SourceFile": "/test/import/dir/a.jpg"}]
+
 
-    mock_run_exiftool.assert_called_once_with(root_dir, expected_params)
+@patch("src.importrr.exifhelper.run_exiftool")
+def test_read_metadata_keeps_output_on_error(mock_run_exiftool):
+
+    error = ExifToolExecuteError(1, '[{"SourceFile": "a.txt", "Error": "x"}]', "", [])
+    mock_run_exiftool.side_effect = error
 
-    # Verify the exact params list, particularly that the right extensions are present
-    actual_params = mock_run_exiftool.call_args[0][1]
-    assert "-ext" in actual_params
-    assert "GIF" in actual_params
-    assert "JPG" in actual_params
-    assert "PNG" in actual_params
-    assert "3GP" in actual_params
-    assert "MOV" in actual_params
-    assert "MP4" in actual_params
+    assert read_metadata("/import", "/root") == [{"SourceFile": "a.txt", "Error": "x"}]
 
 
 @patch("src.importrr.exifhelper.run_exiftool")
 @pytest.mark.parametrize("tag", ["CreationDate", "CreateDate"])
 def test_backfill_video_tag_params(mock_run_exiftool, tag):
-    import_dir = "/test/import/dir"
+    files = ["/test/import/dir/a.mov", "/test/import/dir/b.mp4"]
     root_dir = "/test/root/dir"
 
     from src.importrr.exifhelper import backfill_video_tag
 
-    backfill_video_tag(import_dir, root_dir, tag)
+    backfill_video_tag(files, root_dir, tag)
 
     expected_params = [
         "-overwrite_original",
@@ -57,49 +59,21 @@ def test_backfill_video_tag_params(mock_run_exiftool, tag):
         "-time:all<$" + tag,
         "-if",
         "not $datetimeoriginal",
-        "-ext",
-        "3GP",
-        "-ext",
-        "MOV",
-        "-ext",
-        "MP4",
-        import_dir,
-    ]
-
-    mock_run_exiftool.assert_called_once_with(root_dir, expected_params)
-
-
-@patch("src.importrr.exifhelper.run_exiftool")
-def test_organize_params(mock_run_exiftool):
-    import_dir = "/test/import/dir"
-    root_dir = "/test/root/dir"
-
-    mock_run_exiftool.return_value = "file1\nfile2\nfile3"
-
-    from src.importrr.exifhelper import organize
-
-    result = organize(import_dir, root_dir)
-
-    expected_params = [
-        "-verbose",
-        '-filename<${DateTimeOriginal#;DateFmt("%Y/%m")}/$DateTimeOriginal%-c.%e',
-        "-d",
-        "%Y%m%d-%H%M%S",
-        import_dir,
+        "/test/import/dir/a.mov",
+        "/test/import/dir/b.mp4",
     ]
 
-    mock_run_exiftool.assert_called_once_with(root_dir, expected_params, False)
-    assert result == ["file1", "file2", "file3"]
+    mock_run_exiftool.assert_called_once_with(root_dir, expected_params, session=None)
 
 
 @patch("src.importrr.exifhelper.run_exiftool")
 def test_adjust_screenshots_params(mock_run_exiftool):
-    import_dir = "/test/import/dir"
+    files = ["/test/import/dir/a.png"]
     root_dir = "/test/root/dir"
 
     from src.importrr.exifhelper import adjust_screenshots
 
-    adjust_screenshots(import_dir, root_dir)
+    adjust_screenshots(files, root_dir, "PNG:CreateDate")
 
     assert mock_run_exiftool.call_count == 1
 
@@ -107,22 +81,13 @@ def test_adjust_screenshots_params(mock_run_exiftool):
         root_dir,
         [
             "-overwrite_original",
-            "-EXIF:DateTimeOriginal<FileModifyDate",
-            "-XMP:DateCreated<FileModifyDate",
-            "-EXIF:DateTimeOriginal<XMP:DateCreated",
-            "-XMP:DateCreated<XMP:DateCreated",
             "-EXIF:DateTimeOriginal<PNG:CreateDate",
             "-XMP:DateCreated<PNG:CreateDate",
             "-if",
             "not $datetimeoriginal",
-            "-ext",
-            "GIF",
-            "-ext",
-            "JPG",
-            "-ext",
-            "PNG",
-            import_dir,
+            "/test/import/dir/a.png",
         ],
+        session=None,
     )
 
 
@@ -171,3 +136,195 @@ def test_run_exiftool_error_handling(
         run_exiftool("/test/root", ["-test"], on_error=on_error)
 
     mock_chdir.assert_called_once_with("/test/root")
+
+
+@patch("src.importrr.exifhelper.os.chdir")
+def test_run_exiftool_uses_session(mock_chdir):
+    from src.importrr.exifhelper import run_exiftool
+
+    session = MagicMock()
+    session.execute.return_value = "output"
+
+    assert run_exiftool("/test/root", ["-a", "-b"], session=session) == "output"
+    session.execute.assert_called_once_with("-a", "-b")
+
+
+@patch("src.importrr.exifhelper.os.chdir")
+@patch("src.importrr.exifhelper.ExifToolHelper")
+def test_session_reuses_process(mock_exiftool_helper, mock_chdir):
+    from src.importrr.exifhelper import ExifToolSession
+
+    et = mock_exiftool_helper.return_value
+    et.running = False
+    et.run.side_effect = lambda: setattr(et, "running", True)
+
+    with ExifToolSession("/test/root") as session:
+        session.execute("-ver")
+        session.execute("-ver")
+
+    mock_exiftool_helper.assert_called_once_with(common_args=[])
+    assert et.execute.call_count == 2
+    assert session.invocations == 2
+    assert session.restarts == 0
+    et.terminate.assert_called_once()
+    mock_chdir.assert_called_once_with("/test/root")
+
+
+@patch("src.importrr.exifhelper.os.chdir")
+@patch("src.importrr.exifhelper.ExifToolHelper")
+def test_session_restarts_dead_process(mock_exiftool_helper, mock_chdir):
+    from src.importrr.exifhelper import ExifToolSession
+
+    first, second = MagicMock(running=True), MagicMock(running=True)
+    mock_exiftool_helper.side_effect = [first, second]
+
+    session = ExifToolSession("/test/root")
+    session.execute("-ver")
+    first.running = False  # the process crashed between commands
+    session.execute("-ver")
+
+    assert mock_exiftool_helper.call_count == 2
+    assert session.restarts == 1
+    second.execute.assert_called_once_with("-ver")
+
+
+@patch("src.importrr.exifhelper.os.chdir")
+@patch("src.importrr.exifhelper.ExifToolHelper")
+def test_session_timeout_kills_process(mock_exiftool_helper, mock_chdir):
+    from src.importrr.exifhelper import ExifToolSession
+
+    et = mock_exiftool_helper.return_value
+    et.running = True
+    released = threading.Event()
+    et._process.kill.side_effect = released.set
+
+    def hang(*params):
+        released.wait(5)
+        raise OSError("Bad file descriptor")
+
+    et.execute.side_effect = hang
+
+    session = ExifToolSession("/test/root", timeout=0.01)
+    with pytest.raises(TimeoutError):
+        session.execute("-ver")
+
+    et._process.kill.assert_called_once()
+    et._process.stdout.close.assert_called_once()
+
+
+@patch("src.importrr.exifhelper.LIVENESS_INTERVAL", 0.01)
+@patch("src.importrr.exifhelper.os.chdir")
+@patch("src.importrr.exifhelper.ExifToolHelper")
+def test_session_ends_command_of_dead_process(mock_exiftool_helper, mock_chdir):
+    from src.importrr.exifhelper import ExifToolSession
+
+    et = mock_exiftool_helper.return_value
+    et.running = True
+    released = threading.Event()
+    et._process.stdout.close.side_effect = released.set
+
+    def die(*params):
+        # the process is gone, pyexiftool would read its pipes forever
+        et.running = False
+        released.wait(5)
+        raise OSError("Bad file descriptor")
+
+    et.execute.side_effect = die
+
+    session = ExifToolSession("/test/root")
+    with pytest.raises(OSError, match="died"):
+        session.execute("-ver")
+
+    assert released.is_set()
+    et._process.kill.assert_not_called()
+
+
+def test_count_rewrites(tmp_path):
+    from src.importrr.exifhelper import ExifToolSession, count_rewrites, identities
+
+    for name in ["a.mov", "b.mov"]:
+        (tmp_path / name).write_bytes(b"x" * 100)
+    session = ExifToolSession(str(tmp_path))
+    before = identities(str(tmp_path), ["a.mov", "b.mov", "missing.mov"])
+    # b.mov was skipped by -if, a.mov replaced by its rewritten copy
+    (tmp_path / "a.new").write_bytes(b"y" * 120)
+    os.replace(tmp_path / "a.new", tmp_path / "a.mov")
+
+    count_rewrites(session, str(tmp_path), before, "    1 image files updated\n")
+
+    assert session.bytes_rewritten == 120
+    assert session.files_rewritten == 1
+
+
+def test_count_rewrites_ignores_failed_commands(tmp_path):
+    from src.importrr.exifhelper import ExifToolSession, count_rewrites
+
+    session = ExifToolSession(str(tmp_path))
+
+    count_rewrites(session, str(tmp_path), {}, None)
+    count_rewrites(session, str(tmp_path), {}, "    0 image files updated\n")
+
+    assert session.files_rewritten == 0
+
+
+@patch("src.importrr.exifhelper.run_exiftool")
+def test_rewrite_counts_nothing_when_command_fails(mock_run_exiftool, tmp_path):
+    from src.importrr.exifhelper import ExifToolSession, backfill_video_tag
+
+    (tmp_path / "a.mov").write_bytes(b"x")
+    mock_run_exiftool.side_effect = TimeoutError("killed")
+    session = ExifToolSession(str(tmp_path))
+
+    with pytest.raises(TimeoutError):
+        backfill_video_tag(["a.mov"], str(tmp_path), "CreateDate", session)
+
+    assert session.files_rewritten == 0
+
+
+@patch("src.importrr.exifhelper.run_exiftool")
+def test_adjust_screenshots_sidecar_params(mock_run_exiftool):
+    from src.importrr.exifhelper import adjust_screenshots
+
+    adjust_screenshots(["/work/a.png"], "/root", "FileModifyDate", sidecar=True)
+
+    mock_run_exiftool.assert_called_once_with(
+        "/root",
+        [
+            "-tagsFromFile",
+            "@",
+            "-XMP-exif:DateTimeOriginal<FileModifyDate",
+            "-XMP-photoshop:DateCreated<FileModifyDate",
+            "-o",
+            "%d%f.%e.xmp",
+            "/work/a.png",
+        ],
+        session=None,
+    )
+
+
+@patch("src.importrr.exifhelper.run_exiftool")
+def test_backfill_video_tag_sidecar_does_not_rewrite(mock_run_exiftool):
+    from src.importrr.exifhelper import backfill_video_tag
+
+    session = MagicMock()
+    backfill_video_tag(["/work/a.mov"], "/root", "CreateDate", session, sidecar=True)
+
+    params = mock_run_exiftool.call_args[0][1]
+    assert "-overwrite_original" not in params
+    assert params[-3:] == ["-o", "%d%f.%e.xmp", "/work/a.mov"]
+    session.record_rewrites.assert_not_called()
+
+
+def test_command_timeout_grows_with_files_and_bytes(tmp_path):
+    from src.importrr.exifhelper import command_timeout
+
+    work = tmp_path / "work"
+    work.mkdir()
+    (work / "a.mov").write_bytes(b"x" * 1000)
+    (work / "b.jpg").write_bytes(b"x")
+
+    assert command_timeout(str(tmp_path), ["-ver"], base=10) == 10
+    # a directory target counts every file in it, options are never files
+    single = command_timeout(str(tmp_path), ["-r", "work/a.mov"], base=10)
+    whole = command_timeout(str(tmp_path), ["-json", "work"], base=10)
+    assert 11 < single < whole < 13
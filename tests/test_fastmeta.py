@@ -0,0 +1,137 @@
+import os
+import struct
+from datetime import date, datetime
+from unittest.mock import patch
+
+import pytest
+
+from benchmarks.corpus import box, jpeg, png, quicktime, tiff
+from src.importrr import fastmeta
+from src.importrr.exifhelper import read_metadata
+from src.importrr.planner import plan_file
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize("endian", ["<", ">"])
+def test_jpeg_exif_dates(tmp_path, endian):
+    path = write(tmp_path, "a.JPG", jpeg(tiff("2024:01:02 03:04:05", endian=endian)))
+
+    record = fastmeta.read(path)
+
+    assert record["SourceFile"] == path
+    assert record["File:FileTypeExtension"] == "jpg"
+    assert record["EXIF:DateTimeOriginal"] == "2024:01:02 03:04:05"
+    assert record["EXIF:CreateDate"] == "2024:01:02 03:04:05"
+    assert record["File:FileModifyDate"][:4] == str(
+        date.fromtimestamp(os.stat(path).st_mtime).year
+    )
+    plan = plan_file("a.JPG", record)
+    assert plan.rename == "a.jpg"
+    assert plan.target == "2024/01/20240102-030405"
+
+
+def test_jpeg_without_date_falls_back(tmp_path):
+    assert fastmeta.read(write(tmp_path, "a.jpg", jpeg())) is None
+    assert fastmeta.read(write(tmp_path, "b.jpg", jpeg(tiff(None, None)))) is None
+
+
+def test_truncated_exif_falls_back(tmp_path):
+    data = jpeg(tiff())
+    assert fastmeta.read(write(tmp_path, "a.jpg", data[:40])) is None
+
+
+def test_png(tmp_path):
+    record = fastmeta.read(write(tmp_path, "a.png", png(tiff())))
+    assert record["EXIF:DateTimeOriginal"] == "2024:01:02 03:04:05"
+    assert record["File:FileTypeExtension"] == "png"
+    # screenshots are dated from text chunks, which ExifTool reads
+    assert fastmeta.read(write(tmp_path, "b.png", png())) is None
+
+
+def test_quicktime(tmp_path):
+    seconds = (datetime(2024, 1, 2, 2, 34, 5) - fastmeta.QUICKTIME_EPOCH).days * 86400
+    seconds += 2 * 3600 + 34 * 60 + 5
+    data = quicktime(
+        brand=b"qt  ", seconds=seconds, creation_date="2024-01-02T03:04:05+0100"
+    )
+    record = fastmeta.read(write(tmp_path, "clip.MOV", data))
+
+    assert record["File:FileTypeExtension"] == "mov"
+    assert record["QuickTime:CreateDate"] == "2024:01:02 02:34:05"
+    assert record["QuickTime:CreationDate"] == "2024:01:02 03:04:05+01:00"
+    plan = plan_file("clip.MOV", record)
+    assert plan.backfill == "video"
+    assert plan.source == "CreationDate"
+
+
+def test_quicktime_without_keys(tmp_path):
+    record = fastmeta.read(write(tmp_path, "a.mp4", quicktime(b"mp42", seconds=0)))
+
+    assert record["File:FileTypeExtension"] == "mp4"
+    assert record["QuickTime:CreateDate"] == "0000:00:00 00:00:00"
+    assert "QuickTime:CreationDate" not in record
+
+
+XMP = (
+    b'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF><rdf:Description '
+    b'xmlns:exif="http://ns.adobe.com/exif/1.0/" '
+    b'exif:DateTimeOriginal="2020-05-06T07:08:09"/></rdf:RDF></x:xmpmeta>'
+)
+XMP_UUID = bytes.fromhex("be7acfcb97a942e89c71999491e3afac")
+
+
+def test_quicktime_with_date_original_falls_back(tmp_path):
+    # the movie header has the date of the edit, ExifTool reads the original
+    in_udta = quicktime(b"mp42", udta=box(b"XMP_", XMP))
+    in_uuid = quicktime(b"mp42") + box(b"uuid", XMP_UUID + XMP)
+
+    assert fastmeta.read(write(tmp_path, "a.mp4", in_udta)) is None
+    assert fastmeta.read(write(tmp_path, "b.mp4", in_uuid)) is None
+    # other user data doesn't date the file
+    other = quicktime(b"mp42", udta=box(b"\xa9xyz", b"+52.1+004.3/"))
+    assert fastmeta.read(write(tmp_path, "c.mp4", other)) is not None
+
+
+@pytest.mark.parametrize("size", [0, 4, 4096])
+def test_quicktime_with_bad_keys_falls_back(tmp_path, size):
+    # a count of 2^32 - 1 keys in a box which holds one, of a bad size
+    keys = box(b"keys", struct.pack(">II", 0, 0xFFFFFFFF) + struct.pack(">I", size))
+    moov = box(b"moov", box(b"meta", box(b"hdlr", b"\x00" * 24) + keys))
+    data = box(b"ftyp", b"qt  \x00\x00\x00\x00qt  ") + moov
+
+    assert fastmeta.read(write(tmp_path, "a.mov", data)) is None
+
+
+def test_unknown_files_fall_back(tmp_path):
+    assert fastmeta.read(write(tmp_path, "a.heic", quicktime(b"heic"))) is None
+    assert fastmeta.read(write(tmp_path, "a.gif", b"GIF89a" + b"\x00" * 32)) is None
+    assert fastmeta.read(write(tmp_path, "empty.jpg", b"")) is None
+
+
+@patch("src.importrr.exifhelper.run_exiftool")
+def test_read_metadata_only_sends_fallbacks_to_exiftool(mock_run_exiftool, tmp_path):
+    (tmp_path / "sub").mkdir()
+    write(tmp_path / "sub", "a.jpg", jpeg(tiff()))
+    screenshot = write(tmp_path, "b.png", png())
+    mock_run_exiftool.return_value = f'[{{"SourceFile": "{screenshot}"}}]'
+
+    records = read_metadata(str(tmp_path), "/root", fast=True)
+
+    assert sorted(r["SourceFile"] for r in records) == [
+        screenshot,
+        str(tmp_path / "sub" / "a.jpg"),
+    ]
+    assert mock_run_exiftool.call_args[0][1][-1:] == [screenshot]
+
+
+@patch("src.importrr.exifhelper.run_exiftool")
+def test_read_metadata_skips_exiftool_when_all_fast(mock_run_exiftool, tmp_path):
+    write(tmp_path, "a.jpg", jpeg(tiff()))
+
+    assert len(read_metadata(str(tmp_path), "/root", fast=True)) == 1
+    mock_run_exiftool.assert_not_called()
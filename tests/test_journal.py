@@ -0,0 +1,58 @@
+from src.importrr.journal import JOURNAL_DIR, Journal, unfinished
+
+
+def test_journal_survives_restart(tmp_path):
+    journal = Journal(str(tmp_path), "20240101000000")
+    assert not journal.resumed
+    journal.record("started", files=["a.jpg", "b.mov", "c.jpg"])
+    journal.record("organized", file="a.jpg", to="2024/01/a.jpg")
+    journal.record("organized", file="b.mov", to="2024/01/b.mov")
+    journal.record("transcoded", file="2024/01/b.mov", to="2024/01/b.mp4")
+    journal.record("archiving", part="/archive/x-0.tar.part")
+    journal.record(
+        "archived",
+        part="/archive/x-0.tar.part",
+        tar="/archive/x-0.tar",
+        files=["2024/01/b.mp4"],
+    )
+    journal.record("organized", file="c.jpg", to="2024/01/c.jpg")
+    journal.record("archiving", part="/archive/x-1.tar.part")
+    journal.close()
+
+    resumed = Journal(str(tmp_path), "20240101000000")
+
+    assert resumed.resumed
+    assert unfinished(str(tmp_path)) == ["20240101000000"]
+    assert resumed.unarchived() == ["2024/01/a.jpg", "2024/01/c.jpg"]
+    assert resumed.stale_parts() == ["/archive/x-1.tar.part"]
+    assert resumed.files("started") == {"a.jpg", "b.mov", "c.jpg"}
+
+
+def test_journal_drops_cut_off_line(tmp_path):
+    journal = Journal(str(tmp_path), "batch")
+    journal.record("organized", file="a.jpg", to="2024/01/a.jpg")
+    journal.close()
+    with open(journal.path, "a") as f:
+        f.write('{"stage": "organ')
+
+    resumed = Journal(str(tmp_path), "batch")
+    resumed.record("organized", file="b.jpg", to="2024/01/b.jpg")
+    resumed.close()
+
+    assert Journal(str(tmp_path), "batch").unarchived() == [
+        "2024/01/a.jpg",
+        "2024/01/b.jpg",
+    ]
+
+
+def test_remove(tmp_path):
+    first = Journal(str(tmp_path), "first")
+    first.record("started", files=["a.jpg"])
+    second = Journal(str(tmp_path), "second")
+    second.record("started", files=["b.jpg"])
+
+    first.remove()
+    assert unfinished(str(tmp_path)) == ["second"]
+    second.remove()
+    assert not (tmp_path / JOURNAL_DIR).exists()
+    assert unfinished(str(tmp_path)) == []
@@ -0,0 +1,28 @@
+import fcntl
+import os
+
+import pytest
+
+from src.importrr.lock import LOCK_FILE, album_lock
+
+
+def try_lock(album_dir):
+    with open(os.path.join(album_dir, LOCK_FILE), "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        fcntl.flock(f, fcntl.LOCK_UN)
+        return True
+
+
+def test_album_lock_is_exclusive(tmp_path):
+    with album_lock(str(tmp_path)):
+        assert not try_lock(str(tmp_path))
+    assert try_lock(str(tmp_path))
+
+
+def test_album_lock_released_on_error(tmp_path):
+    with pytest.raises(RuntimeError), album_lock(str(tmp_path)):
+        raise RuntimeError("organize failed")
+    assert try_lock(str(tmp_path))
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import tarfile
+
+from src.importrr import manifest
+from src.importrr.archive import create_tar
+from src.importrr.mirror import Mirror
+from src.importrr.tarwriter import TarWriter
+
+
+def archive(tmp_path):
+    root = tmp_path / "album"
+    (root / "2024").mkdir(parents=True)
+    files = {"2024/a.jpg": os.urandom(70001), "2024/b.jpg": b"b" * 512}
+    for name, data in files.items():
+        (root / name).write_bytes(data)
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+    create_tar(str(root), sorted(files), str(archive_dir), "prefix", 0)
+    return archive_dir, files
+
+
+def test_create_tar_writes_manifest_with_checksums(tmp_path):
+    archive_dir, files = archive(tmp_path)
+
+    with open(archive_dir / "prefix-0.manifest.json") as f:
+        saved = json.load(f)
+
+    assert saved["tar"] == "prefix-0.tar"
+    assert [e["path"] for e in saved["files"]] == sorted(files)
+    tar_data = (archive_dir / "prefix-0.tar").read_bytes()
+    for entry in saved["files"]:
+        data = files[entry["path"]]
+        assert entry["size"] == len(data)
+        assert entry["sha256"] == hashlib.sha256(data).hexdigest()
+        # the offsets point at the member as it lies in the tar
+        start = entry["offset_data"]
+        assert tar_data[start : start + len(data)] == data
+        assert entry["offset"] < start
+
+
+def test_verify_volume_passes_intact_tar(tmp_path):
+    archive_dir, _ = archive(tmp_path)
+
+    assert manifest.verify_volume(str(archive_dir / "prefix-0.manifest.json")) == []
+
+
+def test_verify_volume_detects_corrupted_byte(tmp_path):
+    archive_dir, _ = archive(tmp_path)
+    tar_file = archive_dir / "prefix-0.tar"
+    with tarfile.open(tar_file) as tar:
+        offset = tar.getmember("2024/a.jpg").offset_data
+    data = bytearray(tar_file.read_bytes())
+    data[offset] ^= 0xFF
+    tar_file.write_bytes(bytes(data))
+
+    problems = manifest.verify_volume(str(archive_dir / "prefix-0.manifest.json"))
+
+    assert problems == ["2024/a.jpg: checksum mismatch"]
+
+
+def test_verify_volume_detects_missing_and_extra_members(tmp_path):
+    archive_dir, _ = archive(tmp_path)
+    path = archive_dir / "prefix-0.manifest.json"
+    saved = json.loads(path.read_text())
+    saved["files"][1]["path"] = "2024/c.jpg"
+    path.write_text(json.dumps(saved))
+
+    assert manifest.verify_volume(str(path)) == [
+        "2024/b.jpg: not in the manifest",
+        "2024/c.jpg: missing from the tar",
+    ]
+
+
+def test_verify_volume_checks_every_member_of_a_name(tmp_path):
+    root = tmp_path / "album"
+    root.mkdir()
+    (root / "a.jpg").write_bytes(b"abc")
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+    create_tar(str(root), ["a.jpg", "a.jpg"], str(archive_dir), "prefix", 0)
+    path = archive_dir / "prefix-0.manifest.json"
+
+    assert manifest.verify_volume(str(path)) == []
+    saved = json.loads(path.read_text())
+    saved["files"].append(saved["files"][0])
+    path.write_text(json.dumps(saved))
+    assert manifest.verify_volume(str(path)) == ["a.jpg: missing from the tar"]
+
+
+def test_listing_keeps_the_digest_of_every_member_of_a_name(tmp_path):
+    (tmp_path / "old.jpg").write_bytes(b"old")
+    (tmp_path / "new.jpg").write_bytes(b"newer")
+    tar_file = str(tmp_path / "prefix-0.tar")
+    with TarWriter.open(tar_file, "x") as tar:
+        tar.add(tmp_path / "old.jpg", arcname="a.jpg")
+        tar.add(tmp_path / "new.jpg", arcname="a.jpg")
+        files = manifest.listing(tar)
+    path = manifest.save(tar_file, files)
+
+    assert [f["sha256"] for f in files] == [
+        hashlib.sha256(b"old").hexdigest(),
+        hashlib.sha256(b"newer").hexdigest(),
+    ]
+    assert manifest.verify_volume(path) == []
+
+
+def test_verify_volume_checks_mirror_manifest(tmp_path):
+    root = tmp_path / "album"
+    root.mkdir()
+    (root / "a.jpg").write_bytes(b"abc")
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+    mirror = Mirror(str(root), str(archive_dir))
+    mirror.place("a.jpg")
+    path = mirror.write_manifest("prefix")
+
+    assert manifest.verify_volume(path) == []
+    os.remove(archive_dir / "a.jpg")
+    assert manifest.verify_volume(path) == ["a.jpg: No such file or directory"]
+
+
+def test_verify_reports_every_manifest_and_finds_unlisted_tars(tmp_path):
+    archive_dir, _ = archive(tmp_path)
+    (archive_dir / "old-0.tar").write_bytes(b"")
+
+    manifests = manifest.find([str(archive_dir)])
+
+    assert manifest.verify(manifests, jobs=1) == {
+        str(archive_dir / "prefix-0.manifest.json"): []
+    }
+    assert manifest.unlisted([str(archive_dir)]) == [str(archive_dir / "old-0.tar")]
@@ -0,0 +1,127 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from src.importrr.journal import Journal
+from src.importrr.metrics import Histogram, Metrics, serve
+from src.importrr.report import Report
+
+
+def save_run(report_dir, name, failed_batches=0, spans=()):
+    run = Report(name, section="home", exiftool_invocations=2)
+    run.info["failed_batches"] = failed_batches
+    run.spans.extend(spans)
+    run.save(str(report_dir))
+    return run
+
+
+def span(stage, wall=1.0, **fields):
+    return {
+        "stage": stage,
+        "start": 0,
+        "wall": wall,
+        "cpu": 0,
+        "child_cpu": 0,
+        **fields,
+    }
+
+
+def test_histogram():
+    histogram = Histogram((1, 10))
+    histogram.observe((("section", "home"),), 0.5)
+    histogram.observe((("section", "home"),), 5)
+
+    assert histogram.render("t") == [
+        't_bucket{section="home",le="1"} 1',
+        't_bucket{section="home",le="10"} 2',
+        't_bucket{section="home",le="+Inf"} 2',
+        't_sum{section="home"} 5.5',
+        't_count{section="home"} 2',
+    ]
+
+
+def test_counters_from_reports(tmp_path):
+    report_dir = tmp_path / "reports"
+    metrics = Metrics(str(report_dir), [])
+    assert "importrr_runs_total" in metrics.render()
+
+    save_run(
+        report_dir,
+        "20240101000000-home-import",
+        spans=[
+            span("organize", files=3),
+            span("tar", bytes=1000),
+            span("transcode", wall=10.0, duration=30.0),
+            span("transcode", wall=20.0, duration=30.0),
+        ],
+    )
+    save_run(report_dir, "20240101000100-home-import", failed_batches=1)
+    text = metrics.render()
+    # reports are only counted once
+    assert (
+        metrics.render().split("# TYPE importrr_backlog")[0]
+        == (text.split("# TYPE importrr_backlog")[0])
+    )
+
+    assert 'importrr_runs_total{section="home",result="success"} 1' in text
+    assert 'importrr_runs_total{section="home",result="failure"} 1' in text
+    assert 'importrr_files_imported_total{section="home"} 3' in text
+    assert 'importrr_bytes_archived_total{section="home"} 1000' in text
+    assert 'importrr_exiftool_invocations_total{section="home"} 4' in text
+    assert 'importrr_transcode_seconds_total{section="home"} 30.0' in text
+    assert 'importrr_transcode_speed_ratio{section="home"} 2.0' in text
+    assert 'importrr_transcode_duration_seconds_count{section="home"} 2' in text
+    assert 'importrr_last_success_timestamp_seconds{section="home"}' in text
+
+
+def test_backlog(tmp_path):
+    album = tmp_path / "home"
+    import_dir = album / "import"
+    (import_dir / "20240101000000").mkdir(parents=True)
+    (import_dir / "20240101000000" / "bad.jpg").write_bytes(b"x")
+    (import_dir / "a.jpg").write_bytes(b"abc")
+    (import_dir / "b.jpg").write_bytes(b"de")
+    Journal(str(import_dir), "20240101000100").record("started", files=["c.jpg"])
+    # the running batch's work dir holds files, not failures
+    (import_dir / "20240101000100").mkdir()
+    (import_dir / "20240101000100" / "c.jpg").write_bytes(b"x")
+    sections = [{"album": str(album), "import": ["import", "missing"]}]
+
+    text = Metrics(str(tmp_path / "reports"), sections).render()
+
+    labels = '{section="home",import_dir="import"}'
+    assert f"importrr_backlog_files{labels} 2" in text
+    assert f"importrr_backlog_bytes{labels} 5" in text
+    assert f"importrr_failed_files{labels} 1" in text
+    assert f"importrr_unfinished_batches{labels} 1" in text
+    assert "missing" not in text
+
+
+def test_serve(tmp_path):
+    server = serve(Metrics(str(tmp_path), []), 0, "127.0.0.1")
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert response.headers["Content-Type"].startswith("text/plain")
+            assert b"# TYPE importrr_runs_total counter" in response.read()
+        with pytest.raises(urllib.error.HTTPError, match="404"):
+            urllib.request.urlopen(url + "/other")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_restart_counts_only_new_reports(tmp_path):
+    report_dir = tmp_path / "reports"
+    save_run(report_dir, "20240101000000-home-import", spans=[span("organize")])
+
+    # a restarted exporter doesn't count the runs it already served again
+    metrics = Metrics(str(report_dir), [])
+    text = metrics.render()
+    assert "importrr_runs_total{" not in text
+    assert 'importrr_last_success_timestamp_seconds{section="home"}' in text
+
+    save_run(report_dir, "20240101000100-home-import")
+    text = metrics.render()
+    assert 'importrr_runs_total{section="home",result="success"} 1' in text
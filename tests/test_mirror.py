@@ -0,0 +1,82 @@
+import errno
+import json
+import os
+from unittest.mock import patch
+
+from src.importrr.mirror import Mirror
+
+
+def album(tmp_path):
+    root = tmp_path / "album"
+    (root / "2024" / "01").mkdir(parents=True)
+    (root / "2024" / "01" / "a.jpg").write_bytes(b"aaa")
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+    return str(root), str(archive_dir)
+
+
+def test_place_hardlinks_on_one_filesystem(tmp_path):
+    root, archive_dir = album(tmp_path)
+    placer = Mirror(root, archive_dir)
+
+    assert placer.place("2024/01/a.jpg") == "hardlink"
+
+    src = os.stat(os.path.join(root, "2024/01/a.jpg"))
+    dst = os.stat(os.path.join(archive_dir, "2024/01/a.jpg"))
+    assert os.path.samestat(src, dst)
+    assert os.listdir(os.path.join(archive_dir, "2024/01")) == ["a.jpg"]
+
+
+@patch("src.importrr.mirror.os.link")
+def test_place_falls_back_to_copy_across_filesystems(mock_link, tmp_path):
+    mock_link.side_effect = OSError(errno.EXDEV, "Invalid cross-device link")
+    root, archive_dir = album(tmp_path)
+    (tmp_path / "album" / "2024" / "01" / "b.jpg").write_bytes(b"bbb")
+    placer = Mirror(root, archive_dir)
+
+    first = placer.place("2024/01/a.jpg")
+    placer.place("2024/01/b.jpg")
+
+    assert first in ("reflink", "copy_file_range", "copy")
+    # hardlinks are not tried again for the second file
+    mock_link.assert_called_once()
+    assert "hardlink" not in placer.methods
+    dst = os.path.join(archive_dir, "2024/01/a.jpg")
+    with open(dst, "rb") as f:
+        assert f.read() == b"aaa"
+    src_stat = os.stat(os.path.join(root, "2024/01/a.jpg"))
+    assert os.stat(dst).st_mtime_ns == src_stat.st_mtime_ns
+
+
+def test_place_skips_archived_and_renames_reused_names(tmp_path):
+    root, archive_dir = album(tmp_path)
+    placer = Mirror(root, archive_dir)
+    placer.place("2024/01/a.jpg")
+    assert placer.place("2024/01/a.jpg") is None
+
+    # the album file was replaced by a different one with the same name
+    os.remove(os.path.join(root, "2024/01/a.jpg"))
+    (tmp_path / "album" / "2024" / "01" / "a.jpg").write_bytes(b"other")
+    placer.place("2024/01/a.jpg")
+
+    assert sorted(os.listdir(os.path.join(archive_dir, "2024/01"))) == [
+        "a-1.jpg",
+        "a.jpg",
+    ]
+    assert placer.placed[-1]["archived_as"] == "2024/01/a-1.jpg"
+
+
+def test_write_manifest_takes_the_next_free_index(tmp_path):
+    root, archive_dir = album(tmp_path)
+    assert Mirror(root, archive_dir).write_manifest("prefix") is None
+
+    for _ in range(2):
+        placer = Mirror(root, archive_dir)
+        os.makedirs(os.path.join(archive_dir, "2024/01"), exist_ok=True)
+        placer.placed.append({"path": "2024/01/a.jpg", "size": 3})
+        path = placer.write_manifest("prefix")
+
+    assert path == os.path.join(archive_dir, "prefix-1.manifest.json")
+    with open(path) as f:
+        assert json.load(f)["files"] == [{"path": "2024/01/a.jpg", "size": 3}]
+    assert not [n for n in os.listdir(archive_dir) if n.endswith(".tmp")]
@@ -0,0 +1,97 @@
+import os
+from unittest.mock import patch
+
+from src.importrr.organizer import MonthIndex, organize
+from src.importrr.planner import plan_file
+
+
+def dated(name, date="2024:01:02 03:04:05"):
+    return plan_file(name, {"EXIF:DateTimeOriginal": date})
+
+
+def test_claim_matches_exiftool_counter(tmp_path):
+    (tmp_path / "2024" / "01").mkdir(parents=True)
+    (tmp_path / "2024" / "01" / "20240102-030405.jpg").write_bytes(b"")
+    index = MonthIndex(str(tmp_path))
+
+    names = [index.claim("2024/01/20240102-030405", ".jpg") for _ in range(3)]
+
+    assert names == [
+        os.path.join("2024", "01", "20240102-030405-1.jpg"),
+        os.path.join("2024", "01", "20240102-030405-2.jpg"),
+        os.path.join("2024", "01", "20240102-030405-3.jpg"),
+    ]
+    # a different extension is a different name, as with %e
+    assert index.claim("2024/01/20240102-030405", ".mov") == os.path.join(
+        "2024", "01", "20240102-030405.mov"
+    )
+
+
+def test_claim_keeps_converted_mp4_name_free(tmp_path):
+    (tmp_path / "2024" / "01").mkdir(parents=True)
+    (tmp_path / "2024" / "01" / "20240102-030405.mp4").write_bytes(b"")
+    index = MonthIndex(str(tmp_path))
+
+    # converting the MOV would overwrite the MP4 of the same second
+    mov = index.claim("2024/01/20240102-030405", ".mov")
+    mp4 = index.claim("2024/01/20240102-030405", ".mp4")
+
+    assert mov == os.path.join("2024", "01", "20240102-030405-1.mov")
+    assert mp4 == os.path.join("2024", "01", "20240102-030405-2.mp4")
+
+
+def test_month_dir_is_listed_once(tmp_path):
+    index = MonthIndex(str(tmp_path))
+
+    with patch("src.importrr.organizer.os.listdir", return_value=[]) as listdir:
+        for _ in range(100):
+            index.claim("2024/01/20240102-030405", ".jpg")
+
+    listdir.assert_called_once_with(os.path.join(str(tmp_path), "2024/01"))
+
+
+def test_organize_moves_burst(tmp_path):
+    work = tmp_path / "work"
+    work.mkdir()
+    for name in ["a.jpg", "b.jpg", "c.jpg", "undated.jpg"]:
+        (work / name).write_bytes(name.encode())
+    plans = [
+        dated("a.jpg"),
+        dated("b.jpg"),
+        dated("c.jpg"),
+        plan_file("undated.jpg", {}),
+    ]
+
+    result = list(organize(str(tmp_path), str(work), plans))
+
+    assert result == [
+        (str(work / "a.jpg"), "2024/01/20240102-030405.jpg"),
+        (str(work / "b.jpg"), "2024/01/20240102-030405-1.jpg"),
+        (str(work / "c.jpg"), "2024/01/20240102-030405-2.jpg"),
+    ]
+    assert (tmp_path / "2024" / "01" / "20240102-030405-1.jpg").read_bytes() == b"b.jpg"
+    assert os.listdir(work) == ["undated.jpg"]
+
+
+def test_organize_moves_sidecar_with_media(tmp_path):
+    work = tmp_path / "work"
+    work.mkdir()
+    (work / "a.png").write_bytes(b"png")
+    (work / "a.png.xmp").write_bytes(b"xmp")
+    (work / "b.png").write_bytes(b"png")
+    plans = [
+        plan_file("a.png", {"PNG:CreateDate": "2024:01:02 03:04:05"}),
+        # read from the sidecar itself, which must not be organized on its own
+        dated("a.png.xmp"),
+        # backfilled, but its sidecar was never written
+        plan_file("b.png", {"PNG:CreateDate": "2024:01:02 03:04:06"}),
+    ]
+
+    result = list(organize(str(tmp_path), str(work), plans, sidecar=True))
+
+    assert result == [
+        (str(work / "a.png"), "2024/01/20240102-030405.png"),
+        (str(work / "a.png.xmp"), "2024/01/20240102-030405.png.xmp"),
+    ]
+    assert (tmp_path / "2024" / "01" / "20240102-030405.png.xmp").read_bytes() == b"xmp"
+    assert os.listdir(work) == ["b.png"]
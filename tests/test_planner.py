@@ -0,0 +1,128 @@
+import pytest
+
+from src.importrr.planner import (
+    apply_renames,
+    format_target,
+    group_backfills,
+    plan,
+    plan_file,
+)
+
+
+def test_format_target():
+    assert format_target("2024:03:05 07:08:09+01:00") == "2024/03/20240305-070809"
+
+
+def test_plan_file_with_date():
+    record = {
+        "File:FileTypeExtension": "jpg",
+        "EXIF:DateTimeOriginal": "2024:03:05 07:08:09",
+    }
+    p = plan_file("IMG_0001.jpg", record)
+
+    assert p.rename is None
+    assert p.backfill is None
+    assert p.target == "2024/03/20240305-070809"
+
+
+def test_plan_file_wrong_extension():
+    record = {
+        "File:FileTypeExtension": "png",
+        "EXIF:DateTimeOriginal": "2024:03:05 07:08:09",
+    }
+    p = plan_file("shot.JPG", record)
+
+    assert p.rename == "shot.png"
+    assert p.final_name == "shot.png"
+
+
+def test_plan_file_ignores_other_extensions():
+    p = plan_file("doc.heic", {"File:FileTypeExtension": "heic"})
+
+    assert p.rename is None
+    assert p.backfill is None
+    assert p.target is None
+
+
+def test_plan_file_screenshot_first_source_wins():
+    record = {
+        "File:FileTypeExtension": "png",
+        "File:FileModifyDate": "2024:01:01 00:00:00+00:00",
+        "PNG:CreateDate": "2023:12:31 23:59:58",
+    }
+    p = plan_file("shot.png", record)
+
+    assert p.backfill == "screenshot"
+    assert p.source == "PNG:CreateDate"
+    assert p.target == "2023/12/20231231-235958"
+
+
+@pytest.mark.parametrize(
+    "record, source, expected",
+    [
+        (
+            {
+                "QuickTime:CreationDate": "2022:06:01 10:00:00+02:00",
+                "QuickTime:CreateDate": "2022:06:01 08:00:00",
+            },
+            "CreationDate",
+            "2022/06/20220601-100000",
+        ),
+        (
+            {"QuickTime:CreateDate": "2022:06:01 08:00:00"},
+            "CreateDate",
+            "2022/06/20220601-080000",
+        ),
+        ({"QuickTime:CreateDate": "0000:00:00 00:00:00"}, None, None),
+    ],
+)
+def test_plan_file_video_sources(record, source, expected):
+    record["File:FileTypeExtension"] = "mov"
+    p = plan_file("clip.mov", record)
+
+    assert p.backfill == ("video" if source else None)
+    assert p.source == source
+    assert p.target == expected
+
+
+def test_group_backfills():
+    dated = {"EXIF:DateTimeOriginal": "2024:01:01 00:00:00"}
+    plans = [
+        plan_file("a.png", {"PNG:CreateDate": "2024:01:01 00:00:00"}),
+        plan_file("b.png", {"PNG:CreateDate": "2024:01:02 00:00:00"}),
+        plan_file("c.jpg", {"File:FileModifyDate": "2024:01:03 00:00:00+00:00"}),
+        plan_file("d.mov", {"QuickTime:CreateDate": "2024:01:04 00:00:00"}),
+        plan_file("e.jpg", dated),
+    ]
+
+    assert group_backfills("/work", plans) == {
+        ("screenshot", "PNG:CreateDate"): ["/work/a.png", "/work/b.png"],
+        ("screenshot", "FileModifyDate"): ["/work/c.jpg"],
+        ("video", "CreateDate"): ["/work/d.mov"],
+    }
+
+
+def test_plan_uses_relative_names():
+    records = [
+        {"SourceFile": "/work/a.jpg", "File:FileTypeExtension": "jpg"},
+        {"Error": "no source"},
+    ]
+    plans = plan("/work", records)
+
+    assert [p.name for p in plans] == ["a.jpg"]
+
+
+def test_apply_renames(tmp_path):
+    (tmp_path / "a.JPG").write_bytes(b"a")
+    (tmp_path / "b.mov").write_bytes(b"b")
+    (tmp_path / "b.mp4").write_bytes(b"existing")
+
+    a = plan_file("a.JPG", {"File:FileTypeExtension": "jpg"})
+    b = plan_file("b.mov", {"File:FileTypeExtension": "mp4"})
+    apply_renames(str(tmp_path), [a, b])
+
+    assert (tmp_path / "a.jpg").exists()
+    assert a.final_name == "a.jpg"
+    # an existing file is never overwritten
+    assert (tmp_path / "b.mov").exists()
+    assert b.final_name == "b.mov"
@@ -0,0 +1,115 @@
+import json
+import os
+import subprocess
+from unittest.mock import MagicMock
+
+import pytest
+
+from src.importrr import report
+from src.importrr.report import Report, load, process_cpu, prune
+
+
+def test_span_records_counts_and_child_cpu():
+    run = Report("20240101000000-home-import", album="/album")
+
+    with run.span("exiftool.read", files=2) as span:
+        subprocess.run(
+            ["sh", "-c", "i=0; while [ $i -lt 20000 ]; do i=$((i+1)); done"], check=True
+        )
+        span["bytes"] = 10
+
+    (entry,) = run.spans
+    assert entry["stage"] == "exiftool.read"
+    assert entry["files"] == 2
+    assert entry["bytes"] == 10
+    assert entry["wall"] >= entry["child_cpu"] > 0
+
+
+def test_span_marks_failures():
+    run = Report("run")
+
+    with pytest.raises(RuntimeError), run.span("tar"):
+        raise RuntimeError("disk full")
+
+    assert run.spans[0]["failed"] is True
+
+
+def test_span_counts_session_process():
+    run = Report("run")
+    session = MagicMock()
+    session.cpu_time.side_effect = [1.0, 3.5]
+
+    with run.span("exiftool.backfill.video", session):
+        pass
+
+    assert run.spans[0]["child_cpu"] >= 2.5
+
+
+def test_stage_totals():
+    run = Report("run")
+    for size in (10, 20):
+        with run.span("transcode", bytes=size):
+            pass
+    with run.span("organize", files=3):
+        pass
+
+    stages = run.stages()
+    assert list(stages) == ["transcode", "organize"]
+    assert stages["transcode"]["count"] == 2
+    assert stages["transcode"]["bytes"] == 30
+    assert stages["organize"]["files"] == 3
+
+
+def test_save_keeps_rolling_history(tmp_path):
+    for i in range(4):
+        run = Report(f"2024010100000{i}-home-import")
+        run.save(str(tmp_path), history=2)
+
+    assert sorted(os.listdir(tmp_path)) == [
+        "20240101000002-home-import.json",
+        "20240101000003-home-import.json",
+    ]
+    assert [r["name"] for r in load(str(tmp_path))] == [
+        "20240101000002-home-import",
+        "20240101000003-home-import",
+    ]
+
+
+def test_prune_ignores_other_files(tmp_path):
+    (tmp_path / "notes.txt").write_text("x")
+    (tmp_path / "1.json").write_text("{}")
+
+    prune(str(tmp_path), history=0)
+
+    assert os.listdir(tmp_path) == ["notes.txt"]
+
+
+def test_process_cpu():
+    assert process_cpu(os.getpid()) >= 0
+    assert process_cpu(2**22 + 1) == 0.0
+
+
+def test_module_span_is_noop_without_report():
+    report.stop()
+    with report.span("scan", files=1) as span:
+        span["bytes"] = 1
+
+    run = report.start("run")
+    with report.span("scan"):
+        pass
+    report.stop()
+    assert json.loads(json.dumps(run.to_dict()))["stages"]["scan"]["count"] == 1
+
+
+def test_count_adds_to_innermost_span():
+    run = Report("run")
+    report.count("subprocesses")
+
+    with run.span("organize"), run.span("exiftool.read"):
+        report.count("subprocesses")
+        report.count("subprocesses", 2)
+
+    inner, outer = run.spans
+    assert inner["subprocesses"] == 3
+    assert "subprocesses" not in outer
+    assert inner["max_rss"] > 0
@@ -0,0 +1,64 @@
+import os
+import time
+
+from src.importrr.scanner import STATE_FILE, load_state, scan
+
+# a cutoff in the past, so only the stability check can pick up new files
+PAST = 0
+
+
+def test_scan_picks_up_settled_files(tmp_path):
+    (tmp_path / "a.jpg").write_bytes(b"a")
+
+    assert scan(str(tmp_path), time.time() + 60) == {"a.jpg": 1}
+    assert not (tmp_path / STATE_FILE).exists()
+
+
+def test_scan_waits_for_size_to_stop_changing(tmp_path):
+    f = tmp_path / "a.mov"
+    f.write_bytes(b"partial")
+
+    assert list(scan(str(tmp_path), PAST)) == []
+    assert "a.mov" in load_state(str(tmp_path / STATE_FILE))
+
+    with open(f, "ab") as out:
+        out.write(b" more")
+    assert list(scan(str(tmp_path), PAST)) == []
+
+    assert list(scan(str(tmp_path), PAST)) == ["a.mov"]
+    assert not (tmp_path / STATE_FILE).exists()
+
+
+def test_scan_waits_for_empty_files(tmp_path):
+    (tmp_path / "a.jpg").write_bytes(b"")
+
+    assert list(scan(str(tmp_path), PAST)) == []
+    assert list(scan(str(tmp_path), PAST)) == []
+
+
+def test_scan_skips_nested_dirs_unless_recursive(tmp_path):
+    (tmp_path / "top.jpg").write_bytes(b"a")
+    (tmp_path / "DCIM" / "Camera").mkdir(parents=True)
+    (tmp_path / "DCIM" / "Camera" / "b.jpg").write_bytes(b"b")
+    # work dir of an earlier failed run and a sync app's hidden folder
+    (tmp_path / "20240101120000").mkdir()
+    (tmp_path / "20240101120000" / "failed.jpg").write_bytes(b"c")
+    (tmp_path / ".stversions").mkdir()
+    (tmp_path / ".stversions" / "old.jpg").write_bytes(b"d")
+
+    cutoff = time.time() + 60
+    assert list(scan(str(tmp_path), cutoff)) == ["top.jpg"]
+    assert list(scan(str(tmp_path), cutoff, recursive=True)) == [
+        os.path.join("DCIM", "Camera", "b.jpg"),
+        "top.jpg",
+    ]
+
+
+def test_scan_ignores_corrupt_state(tmp_path):
+    (tmp_path / STATE_FILE).write_text("{not json")
+    (tmp_path / "a.jpg").write_bytes(b"a")
+
+    assert list(scan(str(tmp_path), PAST)) == []
+    assert load_state(str(tmp_path / STATE_FILE)) == {
+        "a.jpg": [1, os.stat(tmp_path / "a.jpg").st_mtime_ns]
+    }
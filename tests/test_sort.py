@@ -0,0 +1,216 @@
+import contextlib
+import json
+import os
+import tarfile
+from unittest.mock import ANY, MagicMock, patch
+
+from src.importrr.journal import Journal, unfinished
+from src.importrr.sort import (
+    Sort,
+    make_work_dir,
+    remaining_files,
+    sort_media,
+    split_batches,
+)
+
+
+def test_make_work_dir_keeps_nested_paths(tmp_path):
+    (tmp_path / "DCIM").mkdir()
+    (tmp_path / "DCIM" / "a.jpg").write_bytes(b"a")
+    work_dir = tmp_path / "20240101120000"
+
+    make_work_dir(str(tmp_path), str(work_dir), [os.path.join("DCIM", "a.jpg")])
+
+    assert (work_dir / "DCIM" / "a.jpg").read_bytes() == b"a"
+
+
+def test_remaining_files_prunes_empty_dirs(tmp_path):
+    (tmp_path / "done" / "deeper").mkdir(parents=True)
+    (tmp_path / "failed").mkdir()
+    (tmp_path / "failed" / "bad.jpg").write_bytes(b"x")
+
+    assert remaining_files(str(tmp_path)) == [os.path.join("failed", "bad.jpg")]
+    assert not (tmp_path / "done").exists()
+    assert (tmp_path / "failed").exists()
+
+
+def test_split_batches():
+    files = {"a.jpg": 10, "b.jpg": 10, "c.jpg": 10, "big.mov": 100, "d.jpg": 10}
+
+    assert split_batches(files, max_files=2, max_size=1000) == [
+        ["a.jpg", "b.jpg"],
+        ["c.jpg", "big.mov"],
+        ["d.jpg"],
+    ]
+    assert split_batches(files, max_files=10, max_size=30) == [
+        ["a.jpg", "b.jpg", "c.jpg"],
+        ["big.mov"],
+        ["d.jpg"],
+    ]
+    assert split_batches({}) == []
+
+
+@patch("src.importrr.sort.archive.create_tar")
+@patch("src.importrr.sort.sort_media")
+@patch("src.importrr.sort.get_media_files")
+def test_launch_processes_batches_independently(
+    mock_get_media_files, mock_sort_media, mock_create_tar, tmp_path
+):
+    album = tmp_path / "album"
+    (album / "import").mkdir(parents=True)
+    (album / "2024" / "01").mkdir(parents=True)
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+    for name in ["a.jpg", "b.jpg", "c.jpg"]:
+        (album / "import" / name).write_bytes(b"x")
+    mock_get_media_files.return_value = {"a.jpg": 1, "b.jpg": 1, "c.jpg": 1}
+    calls = []
+
+    def organize(root_dir, work_dir, session, on_organized=None, **kwargs):
+        calls.append(work_dir)
+        if len(calls) == 1:
+            raise RuntimeError("exiftool died")
+        os.rename(os.path.join(work_dir, "c.jpg"), album / "2024" / "01" / "c.jpg")
+        on_organized("2024/01/c.jpg")
+        return ["2024/01/c.jpg"]
+
+    mock_sort_media.side_effect = organize
+
+    sort = Sort(str(album), str(archive_dir), session=MagicMock(), batch_files=2)
+    sort.launch("import")
+
+    assert len(calls) == 2
+    assert calls[1] == calls[0] + "-1"
+    # the failed batch stays in its work dir, the second one was archived
+    assert sorted(os.listdir(calls[0])) == ["a.jpg", "b.jpg"]
+    assert not os.path.exists(calls[1])
+    mock_create_tar.assert_called_once_with(
+        str(album),
+        ["2024/01/c.jpg"],
+        str(archive_dir),
+        os.path.basename(calls[1]),
+        0,
+        ANY,
+        content=None,
+    )
+    # only the failed batch is resumed by the next run
+    assert unfinished(str(album / "import")) == [os.path.basename(calls[0])]
+
+
+@patch("src.importrr.sort.sort_media")
+@patch("src.importrr.sort.get_media_files", return_value={})
+def test_launch_resumes_unfinished_batch(
+    mock_get_media_files, mock_sort_media, tmp_path
+):
+    album = tmp_path / "album"
+    import_dir = album / "import"
+    (import_dir / "20240101000000").mkdir(parents=True)
+    (import_dir / "20240101000000" / "b.jpg").write_bytes(b"b")
+    (album / "2024" / "01").mkdir(parents=True)
+    (album / "2024" / "01" / "a.jpg").write_bytes(b"a")
+    archive_dir = tmp_path / "archive"
+    archive_dir.mkdir()
+    stale = archive_dir / "20240101000000-0.tar.part"
+    stale.write_bytes(b"half a tar")
+
+    # the previous run organized a.jpg and was killed while archiving it
+    journal = Journal(str(import_dir), "20240101000000")
+    journal.record("started", files=["a.jpg", "b.jpg"])
+    journal.record("organized", file="a.jpg", to="2024/01/a.jpg")
+    journal.record("archiving", part=str(stale))
+    journal.close()
+
+    def organize(root_dir, work_dir, session, on_organized=None, **kwargs):
+        os.rename(os.path.join(work_dir, "b.jpg"), album / "2024" / "01" / "b.jpg")
+        on_organized("2024/01/b.jpg")
+        return ["2024/01/b.jpg"]
+
+    mock_sort_media.side_effect = organize
+
+    Sort(str(album), str(archive_dir), session=MagicMock()).launch("import")
+
+    with tarfile.open(archive_dir / "20240101000000-0.tar") as tar:
+        assert tar.getnames() == ["2024/01/a.jpg", "2024/01/b.jpg"]
+    assert not stale.exists()
+    assert not (import_dir / "20240101000000").exists()
+    assert unfinished(str(import_dir)) == []
+
+
+@patch("src.importrr.sort.sort_media")
+@patch("src.importrr.sort.get_media_files", return_value={"a.jpg": 3})
+def test_launch_writes_run_report(mock_get_media_files, mock_sort_media, tmp_path):
+    album = tmp_path / "home"
+    (album / "import").mkdir(parents=True)
+    (album / "import" / "a.jpg").write_bytes(b"abc")
+    session = MagicMock(
+        version="12.76", invocations=0, bytes_rewritten=0, files_rewritten=0
+    )
+    session.cpu_time.return_value = 0.0
+    report_dir = tmp_path / "reports"
+
+    sort = Sort(str(album), session=session, report_dir=str(report_dir))
+    sort.launch("import")
+
+    (name,) = os.listdir(report_dir)
+    assert name.endswith("-home-import.json")
+    with open(report_dir / name) as f:
+        run = json.load(f)
+    assert run["tools"] == {"exiftool": "12.76"}
+    assert run["stages"]["scan"]["files"] == 1
+    assert run["stages"]["scan"]["bytes"] == 3
+    assert run["stages"]["move"]["files"] == 1
+    assert run["section"] == "home"
+    assert run["failed_batches"] == 0
+
+
+@patch("src.importrr.sort.organizer.organize")
+@patch("src.importrr.sort.planner.group_backfills", return_value={})
+@patch("src.importrr.sort.exifhelper.read_metadata", return_value=[])
+def test_sort_media_hands_on_each_organized_file(
+    mock_read_metadata, mock_group_backfills, mock_organize
+):
+    handed = []
+
+    def organize(root_dir, import_dir, plans, sidecar):
+        yield "/work/a.jpg", "2024/01/a.jpg"
+        # the first file was handed on before the second one was moved
+        assert handed == ["2024/01/a.jpg"]
+        yield "/work/b.jpg", "2024/01/b.jpg"
+
+    mock_organize.side_effect = organize
+
+    result = sort_media("/root", "/work", on_organized=handed.append)
+
+    assert result == ["2024/01/a.jpg", "2024/01/b.jpg"]
+    assert handed == result
+
+
+@patch("src.importrr.sort.organizer.organize")
+@patch("src.importrr.sort.planner.group_backfills", return_value={})
+@patch("src.importrr.sort.exifhelper.read_metadata")
+def test_sort_media_holds_album_lock_only_to_organize(
+    mock_read_metadata, mock_group_backfills, mock_organize
+):
+    held = []
+
+    @contextlib.contextmanager
+    def album_lock():
+        held.append(True)
+        yield
+        held.append(False)
+
+    def read_metadata(*args):
+        # other workers organize while this one reads its metadata
+        assert held == []
+        return []
+
+    def organize(root_dir, import_dir, plans, sidecar):
+        assert held == [True]
+        yield "/work/a.jpg", "2024/01/a.jpg"
+
+    mock_read_metadata.side_effect = read_metadata
+    mock_organize.side_effect = organize
+
+    sort_media("/root", "/work", album_lock=album_lock)
+
+    assert held == [True, False]
@@ -6,6 +6,13 @@ import pytest
 from src.importrr.sort import Sort
 
 
+@pytest.fixture(autouse=True)
+def mock_session():
+    # launch starts its ExifTool session before looking at the import dir
+    with patch("src.importrr.sort.exifhelper.ExifToolSession") as session:
+        yield session
+
+
 @pytest.fixture
 def mock_directories(tmp_path):
     root_dir = tmp_path / "root"
@@ -32,7 +39,7 @@ def test_launch_valid_import_dir(
     sort = Sort(str(root_dir), str(archive_dir))
 
     # Mock return values
-    mock_get_media_files.return_value = ["test.jpg"]
+    mock_get_media_files.return_value = {"test.jpg": 1}
     mock_sort_media.return_value = ["test.jpg"]
 
     # Valid relative path
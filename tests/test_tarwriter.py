@@ -0,0 +1,103 @@
+import errno
+import hashlib
+import os
+import tarfile
+from unittest.mock import patch
+
+import pytest
+
+from src.importrr.tarwriter import TarWriter, kernel_copy, source_fd
+
+
+def media(tmp_path):
+    root = tmp_path / "album"
+    (root / "2024" / "01").mkdir(parents=True)
+    files = {
+        "2024/01/empty.jpg": b"",
+        "2024/01/block.jpg": b"b" * 512,
+        "2024/01/odd.mov": os.urandom(70001),
+        # longer than a ustar name, so tarfile adds a pax header
+        "2024/01/" + "n" * 120 + ".png": b"png",
+    }
+    for name, data in files.items():
+        (root / name).write_bytes(data)
+    # a duplicate stored as a hardlink goes in as a link member
+    os.link(root / "2024/01/odd.mov", root / "2024/01/odd-1.mov")
+    return str(root), sorted(files) + ["2024/01/odd-1.mov"]
+
+
+def write(cls, root, names, path):
+    with cls.open(path, "x") as tar:
+        for name in names:
+            tar.add(os.path.join(root, name), arcname=name, recursive=False)
+        return tar.offset
+
+
+def test_output_matches_tarfile(tmp_path):
+    root, names = media(tmp_path)
+    expected, actual = tmp_path / "tarfile.tar", tmp_path / "writer.tar"
+
+    offset = write(tarfile.TarFile, root, names, expected)
+    assert write(TarWriter, root, names, actual) == offset
+
+    assert actual.read_bytes() == expected.read_bytes()
+    with tarfile.open(actual) as tar:
+        assert tar.getnames() == names
+        assert tar.getmember("2024/01/odd-1.mov").islnk()
+
+
+@patch("src.importrr.tarwriter.os.copy_file_range", create=True)
+def test_falls_back_to_sendfile(mock_copy_range, tmp_path):
+    mock_copy_range.side_effect = OSError(errno.EXDEV, "Invalid cross-device link")
+    root, names = media(tmp_path)
+    expected, actual = tmp_path / "tarfile.tar", tmp_path / "writer.tar"
+
+    write(tarfile.TarFile, root, names, expected)
+    write(TarWriter, root, names, actual)
+
+    assert actual.read_bytes() == expected.read_bytes()
+
+
+def test_kernel_copy_fails_on_short_source(tmp_path):
+    (tmp_path / "a").write_bytes(b"abc")
+    with (
+        open(tmp_path / "a", "rb") as src,
+        open(tmp_path / "b", "wb") as dst,
+        pytest.raises(OSError, match="unexpected end of data"),
+    ):
+        kernel_copy(src.fileno(), dst.fileno(), 10)
+
+
+def test_digests_match_member_data(tmp_path):
+    root, names = media(tmp_path)
+
+    with TarWriter.open(tmp_path / "writer.tar", "x") as tar:
+        for name in names:
+            tar.add(os.path.join(root, name), arcname=name, recursive=False)
+        members, digests = tar.getmembers(), tar.digests
+
+    # hardlinks have no data of their own
+    assert sorted(digests) == [m.offset for m in members[:-1]]
+    for member in members[:-1]:
+        data = (tmp_path / "album" / member.name).read_bytes()
+        assert digests[member.offset] == hashlib.sha256(data).hexdigest()
+
+
+@pytest.mark.parametrize("kernel", [True, False])
+def test_member_offsets_match_what_tarfile_reads(kernel, tmp_path):
+    root, names = media(tmp_path)
+    path = tmp_path / "writer.tar"
+
+    # without a source descriptor the data goes through tarfile's own copy
+    with patch(
+        "src.importrr.tarwriter.source_fd", wraps=source_fd if kernel else None
+    ) as mock_source_fd:
+        if not kernel:
+            mock_source_fd.return_value = None
+        with TarWriter.open(path, "x") as tar:
+            for name in names:
+                tar.add(os.path.join(root, name), arcname=name, recursive=False)
+            written = [(m.name, m.offset, m.offset_data) for m in tar.getmembers()]
+
+    with tarfile.open(path) as tar:
+        assert written == [(m.name, m.offset, m.offset_data) for m in tar]
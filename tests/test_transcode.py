@@ -4,7 +4,15 @@ from unittest.mock import MagicMock, patch
 import pytest
 from ffmpy import FFRuntimeError
 
-from src.importrr.transcode import FFMPEG_PARAMS, convert, transcode
+from src.importrr.transcode import (
+    FFMPEG_PARAMS,
+    FFPROBE_PARAMS,
+    REMUX_PARAMS,
+    can_remux,
+    convert,
+    probe_streams,
+    transcode,
+)
 
 
 @patch("src.importrr.transcode.transcode")
@@ -22,11 +30,14 @@ def test_convert_input_not_exists(mock_exists, mock_transcode):
     mock_exists.assert_called_once_with(os.path.join(root_dir, source_file))
 
 
+@patch("src.importrr.transcode.can_remux", return_value=False)
 @patch("src.importrr.transcode.exifhelper.copy_tags")
 @patch("src.importrr.transcode.os.path.getsize")
 @patch("src.importrr.transcode.os.path.exists")
 @patch("src.importrr.transcode.transcode")
-def test_convert_success(mock_transcode, mock_exists, mock_getsize, mock_copy_tags):
+def test_convert_success(
+    mock_transcode, mock_exists, mock_getsize, mock_copy_tags, mock_can_remux
+):
     mock_exists.side_effect = [True, True]  # input exists, output exists
     mock_getsize.side_effect = [1024, 512]  # input size, output size
 
@@ -39,17 +50,21 @@ def test_convert_success(mock_transcode, mock_exists, mock_getsize, mock_copy_ta
     mock_transcode.assert_called_once_with(
         os.path.join(root_dir, "test_video.mov"),
         os.path.join(root_dir, "test_video.mp4"),
+        None,
+        False,
     )
     mock_copy_tags.assert_called_once_with(
         root_dir,
         os.path.join(root_dir, "test_video.mov"),
         os.path.join(root_dir, "test_video.mp4"),
+        None,
     )
 
 
+@patch("src.importrr.transcode.can_remux", return_value=False)
 @patch("src.importrr.transcode.os.path.exists")
 @patch("src.importrr.transcode.transcode")
-def test_convert_output_not_created(mock_transcode, mock_exists):
+def test_convert_output_not_created(mock_transcode, mock_exists, mock_can_remux):
     mock_exists.side_effect = [True, False]  # input exists, output does not exist
 
     root_dir = "/test/root"
@@ -61,12 +76,15 @@ def test_convert_output_not_created(mock_transcode, mock_exists):
     mock_transcode.assert_called_once_with(
         os.path.join(root_dir, "test_video.mov"),
         os.path.join(root_dir, "test_video.mp4"),
+        None,
+        False,
     )
 
 
+@patch("src.importrr.transcode.can_remux", return_value=False)
 @patch("src.importrr.transcode.os.path.exists")
 @patch("src.importrr.transcode.transcode")
-def test_convert_exception(mock_transcode, mock_exists):
+def test_convert_exception(mock_transcode, mock_exists, mock_can_remux):
     mock_exists.return_value = True  # input exists
     mock_transcode.side_effect = Exception("FFmpeg error")
 
@@ -79,6 +97,8 @@ def test_convert_exception(mock_transcode, mock_exists):
     mock_transcode.assert_called_once_with(
         os.path.join(root_dir, "test_video.mov"),
         os.path.join(root_dir, "test_video.mp4"),
+        None,
+        False,
     )
 
 
@@ -98,6 +118,16 @@ def test_transcode_success(mock_ffmpeg_class):
     mock_ffmpeg_instance.run.assert_called_once()
 
 
+@patch("src.importrr.transcode.ffmpy.FFmpeg")
+def test_transcode_threads(mock_ffmpeg_class):
+    transcode("input.mov", "output.mp4", threads=4)
+
+    mock_ffmpeg_class.assert_called_once_with(
+        inputs={"input.mov": "-y"},
+        outputs={"output.mp4": FFMPEG_PARAMS + " -threads 4"},
+    )
+
+
 @patch("src.importrr.transcode.os.path.exists")
 @patch("src.importrr.transcode.os.remove")
 @patch("src.importrr.transcode.ffmpy.FFmpeg")
@@ -143,3 +173,78 @@ def test_transcode_failure_no_output_file(mock_ffmpeg_class, mock_remove, mock_e
 
     mock_exists.assert_called_once_with(output_file)
     mock_remove.assert_not_called()
+
+
+@patch("src.importrr.transcode.ffmpy.FFmpeg")
+def test_transcode_remux(mock_ffmpeg_class):
+    transcode("input.mov", "output.mp4", threads=4, remux=True)
+
+    mock_ffmpeg_class.assert_called_once_with(
+        inputs={"input.mov": "-y"}, outputs={"output.mp4": REMUX_PARAMS}
+    )
+
+
+@patch("src.importrr.transcode.probe_streams")
+@pytest.mark.parametrize(
+    "streams, expected",
+    [
+        (
+            [
+                {"codec_type": "video", "codec_name": "h264", "pix_fmt": "yuv420p"},
+                {"codec_type": "audio", "codec_name": "aac"},
+                {"codec_type": "data", "codec_name": "none"},
+            ],
+            True,
+        ),
+        (
+            [{"codec_type": "video", "codec_name": "h264", "pix_fmt": "yuv420p"}],
+            True,
+        ),
+        (
+            [
+                {"codec_type": "video", "codec_name": "hevc", "pix_fmt": "yuv420p"},
+                {"codec_type": "audio", "codec_name": "aac"},
+            ],
+            False,
+        ),
+        (
+            [
+                {"codec_type": "video", "codec_name": "h264", "pix_fmt": "yuv420p10le"},
+                {"codec_type": "audio", "codec_name": "aac"},
+            ],
+            False,
+        ),
+        (
+            [
+                {"codec_type": "video", "codec_name": "h264", "pix_fmt": "yuv420p"},
+                {"codec_type": "audio", "codec_name": "pcm_s16le"},
+            ],
+            False,
+        ),
+        ([], False),
+    ],
+)
+def test_can_remux(mock_probe_streams, streams, expected):
+    mock_probe_streams.return_value = streams
+
+    assert can_remux("input.mov") is expected
+
+
+@patch("src.importrr.transcode.probe_streams")
+def test_can_remux_probe_failure(mock_probe_streams):
+    mock_probe_streams.side_effect = OSError("ffprobe not found")
+
+    assert can_remux("input.mov") is False
+
+
+@patch("src.importrr.transcode.ffmpy.FFprobe")
+def test_probe_streams(mock_ffprobe_class):
+    mock_ffprobe_class.return_value.run.return_value = (
+        b'{"streams": [{"codec_type": "video"}]}',
+        b"",
+    )
+
+    assert probe_streams("input.mov") == [{"codec_type": "video"}]
+    mock_ffprobe_class.assert_called_once_with(
+        global_options=FFPROBE_PARAMS, inputs={"input.mov": None}
+    )
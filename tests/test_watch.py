@@ -0,0 +1,127 @@
+import json
+import os
+import time
+
+import pytest
+
+from src.importrr.scanner import STATE_FILE
+from src.importrr.watch import (
+    IN_CLOSE_WRITE,
+    IN_ISDIR,
+    IN_Q_OVERFLOW,
+    Inotify,
+    Watcher,
+)
+
+
+def poll_until(watcher, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        ready = watcher.poll(max_wait=0.05)
+        if ready:
+            return ready
+    return []
+
+
+def test_inotify_reports_file_names(tmp_path):
+    inotify = Inotify()
+    wd = inotify.add_watch(str(tmp_path))
+    (tmp_path / "photo.jpg").write_bytes(b"data")
+
+    events = inotify.read()
+    inotify.close()
+
+    assert (wd, IN_CLOSE_WRITE, "photo.jpg") in events
+
+
+def test_add_watch_missing_dir(tmp_path):
+    inotify = Inotify()
+    with pytest.raises(OSError):
+        inotify.add_watch(str(tmp_path / "missing"))
+    inotify.close()
+
+
+def test_watcher_triggers_section_once_quiet(tmp_path):
+    home = tmp_path / "home"
+    work = tmp_path / "work"
+    home.mkdir()
+    work.mkdir()
+    triggered = []
+    watcher = Watcher(
+        {str(home): "home", str(work): "work"}, triggered.append, quiet=0.2
+    )
+
+    (home / "photo.jpg").write_bytes(b"data")
+    start = time.monotonic()
+    ready = poll_until(watcher)
+    watcher.close()
+
+    assert ready == ["home"]
+    assert triggered == ["home"]
+    assert time.monotonic() - start >= 0.2
+
+
+def test_watcher_debounces_writes(tmp_path):
+    triggered = []
+    watcher = Watcher({str(tmp_path): "home"}, triggered.append, quiet=10)
+
+    watcher.record([(1, IN_CLOSE_WRITE, "a.jpg")])
+    first = watcher.pending[("home", "a.jpg")]
+    watcher.record([(1, IN_CLOSE_WRITE, "a.jpg")])
+
+    assert watcher.ready(first + 9.5) == []
+    assert watcher.ready(watcher.pending[("home", "a.jpg")] + 10) == ["home"]
+    assert watcher.pending == {}
+    watcher.close()
+
+
+def test_watcher_ignores_dirs_and_sweeps_on_overflow(tmp_path):
+    watcher = Watcher({str(tmp_path): "home"}, lambda key: None, quiet=0)
+
+    watcher.record([(1, IN_ISDIR | 0x100, "20240101120000")])
+    assert watcher.pending == {}
+
+    watcher.record([(-1, IN_Q_OVERFLOW, "")])
+    assert list(watcher.pending) == [("home", None)]
+    watcher.close()
+
+
+def test_watcher_skips_missing_dirs(tmp_path):
+    watcher = Watcher({str(tmp_path / "missing"): "home"}, lambda key: None)
+    assert watcher.watches == {}
+    watcher.close()
+
+
+def test_on_ready_failure_keeps_watching(tmp_path):
+    def fail(key):
+        raise RuntimeError("boom")
+
+    watcher = Watcher({str(tmp_path): "home"}, fail, quiet=0)
+    os.mkdir(tmp_path / "sub")
+    (tmp_path / "a.jpg").write_bytes(b"a")
+
+    assert poll_until(watcher) == ["home"]
+    watcher.close()
+
+
+def test_watcher_ignores_scan_state(tmp_path):
+    watcher = Watcher({str(tmp_path): "home"}, lambda key: None, quiet=0)
+
+    watcher.record([(1, IN_CLOSE_WRITE, ".importrr-scan.json.tmp")])
+
+    assert watcher.pending == {}
+    watcher.close()
+
+
+def test_watcher_rearms_files_the_scan_left_pending(tmp_path):
+    def scan(key):
+        # the import found a.jpg still changing and skipped it
+        with open(tmp_path / STATE_FILE, "w") as f:
+            json.dump({"a.jpg": [1, 1]}, f)
+
+    watcher = Watcher({str(tmp_path): "home"}, scan, quiet=0)
+    watcher.record([(1, IN_CLOSE_WRITE, "b.jpg")])
+
+    assert watcher.poll(max_wait=0) == ["home"]
+    assert list(watcher.pending) == [("home", "a.jpg")]
+    watcher.close()